@@ -0,0 +1,174 @@
+import json
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+class StageTimer:
+    """
+    Adds up the time spent in each named stage of a run, e.g. all the calls to create_room while one level is built.
+
+    Functions are timed by wrapping them (see wrap / patch). If a timed function calls itself, directly or through
+    another function in the same stage (e.g. the recursion in remove_junk_doors), only the outermost call is timed, so
+    no time is counted twice. Different stages can still overlap if one calls the other.
+    """
+    def __init__(self):
+        self.totals = dict()
+        self.calls = dict()
+        self._depth = dict()
+
+    def reset(self):
+        self.totals.clear()
+        self.calls.clear()
+        self._depth.clear()
+
+    def wrap(self, stage, function):
+        @wraps(function)
+        def timed(*args, **kwargs):
+            depth = self._depth.get(stage, 0)
+            self._depth[stage] = depth + 1
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+
+            if depth:
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self._depth[stage] = depth
+
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.totals[stage] = self.totals.get(stage, 0.0) + time.perf_counter() - start
+                self._depth[stage] = depth
+
+        return timed
+
+    def get_milliseconds(self):
+        return {stage: seconds * 1000 for stage, seconds in self.totals.items()}
+
+
+@contextmanager
+def patch(targets, timer):
+    """
+    Temporarily replace functions with timed versions, so existing code can be timed stage by stage without changing it.
+
+    :param targets: list of (owner, attribute name, stage name) - owner is a module or class, e.g.
+                    (map_functions, "create_room", "create_room") or (GameMap, "save_map_to_file", "save_map").
+    :param timer: the StageTimer to record into.
+    """
+    originals = []
+
+    try:
+        for owner, attribute, stage in targets:
+            original = getattr(owner, attribute)
+            originals.append((owner, attribute, original))
+            setattr(owner, attribute, timer.wrap(stage, original))
+
+        yield timer
+
+    finally:
+        for owner, attribute, original in reversed(originals):
+            setattr(owner, attribute, original)
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+
+    if len(values) % 2:
+        return values[middle]
+
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def get_unit(metric):
+    """
+    Metrics are milliseconds unless their name says otherwise: "_kb" for kilobytes and "_bytes" for bytes.
+    Whatever the unit, a bigger number is always worse (see compare).
+    """
+    if metric.endswith("_kb"):
+        return "kB"
+
+    if metric.endswith("_bytes"):
+        return "B"
+
+    return "ms"
+
+
+def save_baseline(results, filename):
+    """
+    Save benchmark results - {case name: {metric: milliseconds}} - as a JSON baseline to compare later runs against.
+    """
+    with open(filename, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+
+
+def load_baseline(filename):
+    with open(filename) as file:
+        return json.load(file)
+
+
+def compare(results, baseline, tolerance=0.25, min_ms=1.0):
+    """
+    Compare results against a baseline. A metric has regressed if it is more than tolerance (as a fraction) slower than
+    the baseline. Metrics under min_ms in both runs are ignored, as timings that small are mostly noise.
+
+    Returns a list of (case, metric, baseline ms, result ms, ratio) for each regression, worst first.
+    """
+    regressions = []
+
+    for case, metrics in results.items():
+        base_metrics = baseline.get(case, dict())
+
+        for metric, value in metrics.items():
+            base_value = base_metrics.get(metric)
+
+            if base_value is None or max(base_value, value) < min_ms:
+                continue
+
+            ratio = value / base_value if base_value else float("inf")
+
+            if ratio > 1 + tolerance:
+                regressions.append((case, metric, base_value, value, ratio))
+
+    return sorted(regressions, key=lambda regression: regression[4], reverse=True)
+
+
+def print_results(results):
+    for case, metrics in results.items():
+        print(case)
+
+        for metric, value in sorted(metrics.items()):
+            print("    {:<20} {:>10.2f} {}".format(metric, value, get_unit(metric)))
+
+
+def print_regressions(regressions):
+    if not regressions:
+        print("No regressions.")
+        return
+
+    for case, metric, base_value, value, ratio in regressions:
+        unit = get_unit(metric)
+        print("REGRESSION {} {}: {:.2f} {} -> {:.2f} {} (x{:.2f})".format(case, metric, base_value, unit, value, unit, ratio))
+
+
+def run_cli(run_suite, argv):
+    """
+    Shared command line for the benchmark scripts:
+        --save <file>       save the results as a baseline.
+        --compare <file>    compare the results against a baseline, and exit with status 1 if anything regressed.
+        --quick             run the smaller cases only.
+    """
+    results = run_suite(quick="--quick" in argv)
+    print_results(results)
+
+    if "--save" in argv:
+        save_baseline(results, argv[argv.index("--save") + 1])
+
+    if "--compare" in argv:
+        regressions = compare(results, load_baseline(argv[argv.index("--compare") + 1]))
+        print_regressions(regressions)
+
+        if regressions:
+            raise SystemExit(1)
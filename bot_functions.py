@@ -0,0 +1,175 @@
+import random
+import sys
+import time
+import tracemalloc
+import numpy as np
+from game_states import GameStates
+from entity_classes import Monster
+from render_functions import RenderOrder
+from session_functions import GameSession
+from perf_functions import phase_timer
+
+
+MOVES = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (1, -1), (-1, 1), (1, 1)]
+
+
+class BotPolicy:
+    """
+    Base class for a scripted player. Each turn the harness calls get_action(session), which returns the same kind of
+    action dict handle_keys would for a key press, e.g. {'move': (1, 0)} or {'pickup': True}.
+
+    Policies get their own random number generator, so a bot run is repeatable for a given map seed and bot seed and
+    doesn't disturb the map or combat RNGs.
+    """
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def get_action(self, session):
+        raise NotImplementedError
+
+    def random_move(self):
+        return {'move': self.rng.choice(MOVES)}
+
+    def step_towards(self, session, target_x, target_y):
+        """
+        The move for the first step of the shortest path to the target, or a random move if there is no path.
+        """
+        player = session.player
+        path = session.game_map.compute_path(player.x, player.y, target_x, target_y)
+
+        if not path:
+            return self.random_move()
+
+        next_x, next_y = path[0]
+        return {'move': (next_x - player.x, next_y - player.y)}
+
+
+class RandomWalkBot(BotPolicy):
+    """ Moves in a random direction every turn, and picks up anything it stands on. """
+    def get_action(self, session):
+        if self.rng.random() < 0.1:
+            return {'pickup': True}
+
+        return self.random_move()
+
+
+class SeekMonsterBot(BotPolicy):
+    """ Heads for the nearest living monster and attacks it (by walking into it). Wanders if none are left. """
+    def get_action(self, session):
+        player = session.player
+        nearest = None
+        nearest_distance = None
+
+        for entity in session.entities.get_by_render_order(RenderOrder.ACTOR):
+            if isinstance(entity, Monster) and not entity.dead:
+                distance = entity.distance_to(player)
+
+                if nearest is None or distance < nearest_distance:
+                    nearest, nearest_distance = entity, distance
+
+        if nearest is None:
+            return self.random_move()
+
+        return self.step_towards(session, nearest.x, nearest.y)
+
+
+class ExploreBot(BotPolicy):
+    """
+    Walks to the nearest walkable tile it hasn't seen yet, building up its own record of seen tiles from the FOV each
+    turn (the map's explored array is only updated when the map is drawn).
+    """
+    def __init__(self, seed=None):
+        super().__init__(seed)
+        self.seen = None
+
+    def get_action(self, session):
+        game_map = session.game_map
+        player = session.player
+
+        if self.seen is None:
+            self.seen = np.zeros((game_map.width, game_map.height), dtype=bool)
+
+        self.seen |= game_map.fov
+
+        unseen_x, unseen_y = np.nonzero(game_map.walkable & ~self.seen)
+        if not len(unseen_x):
+            return self.random_move()
+
+        nearest = np.argmin((unseen_x - player.x) ** 2 + (unseen_y - player.y) ** 2)
+        return self.step_towards(session, int(unseen_x[nearest]), int(unseen_y[nearest]))
+
+
+policies = {
+    "random": RandomWalkBot,
+    "seek": SeekMonsterBot,
+    "explore": ExploreBot,
+}
+
+
+def run_bot(policy, seed=None, max_turns=1000, measure_memory=False):
+    """
+    Build a level with dungeon_generator_complex (via GameSession) and let the bot play it headlessly until the player
+    dies or max_turns player turns have been taken.
+
+    Timing per phase (fov, player_turn, enemy_turn) is collected with the phase timer, which is reset first and only
+    turned on for the run.
+    measure_memory runs the game under tracemalloc to find the peak memory use - this slows everything down a lot, so
+    the turns per second from such a run shouldn't be compared with one without it.
+
+    Returns a dict: seed, turns, steps, seconds, turns_per_second, player_dead, phases and peak_memory_kb (or None).
+    """
+    if measure_memory:
+        tracemalloc.start()
+
+    # No level export - each run would otherwise leave a <seed>.txt in the working directory.
+    session = GameSession(seed=seed, save_map=False)
+
+    # The phase timer is shared by the whole process, so it is put back as it was afterwards.
+    phase_timer.reset()
+    timing_enabled, phase_timer.enabled = phase_timer.enabled, True
+
+    try:
+        steps = 0
+        start = time.perf_counter()
+
+        while session.turn < max_turns and session.game_state != GameStates.PLAYER_DEAD:
+            session.update_fov()
+            session.take_turn(policy.get_action(session))
+            steps += 1
+
+        seconds = time.perf_counter() - start
+
+    finally:
+        phase_timer.enabled = timing_enabled
+
+    peak_memory_kb = None
+    if measure_memory:
+        peak_memory_kb = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+
+    return {"seed": session.seed,
+            "turns": session.turn,
+            "steps": steps,
+            "seconds": seconds,
+            "turns_per_second": session.turn / seconds if seconds else 0.0,
+            "player_dead": session.game_state == GameStates.PLAYER_DEAD,
+            "phases": phase_timer.get_summary(),
+            "peak_memory_kb": peak_memory_kb}
+
+
+if __name__ == "__main__":
+    # Usage: python bot_functions.py [random|seek|explore] [map seed] [max turns] [--memory]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+
+    policy_name = args[0] if len(args) > 0 else "explore"
+    map_seed = int(args[1]) if len(args) > 1 else None
+    turns = int(args[2]) if len(args) > 2 else 1000
+
+    result = run_bot(policies[policy_name](seed=0), seed=map_seed, max_turns=turns, measure_memory="--memory" in sys.argv)
+
+    for name, value in result.items():
+        if name != "phases":
+            print(name, value)
+
+    for name, stats in result["phases"].items():
+        print(name, stats)
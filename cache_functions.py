@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import zipfile
+import zlib
+import numpy as np
+from map_functions import MapSnapshot, Door, Button, GENERATOR_VERSION
+from entity_classes import Monster, Pickup, stats
+
+
+class LevelCache:
+    """
+    An on-disk cache of generated levels, so a seed which has been played before loads in a few milliseconds instead of
+    being generated again.
+
+    Levels are keyed on everything the generator's output depends on - the seed, the map size, the generator
+    parameters and map_functions.GENERATOR_VERSION (bump that whenever a change to the generator changes its output) -
+    hashed into the filename. Each level is one compressed .npz file holding the map arrays, with the doors, the
+    player's position and the monsters and items (in their original order) as JSON alongside them.
+
+    The cache is kept under max_bytes: after each save the least recently used levels are deleted until it fits.
+    Loading a level counts as using it.
+
+    Rooms aren't stored - they are only needed while the level is being generated.
+    """
+    def __init__(self, directory=".level_cache", max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def get_key(level_seed, map_width, map_height, parameters):
+        key = json.dumps({"seed": level_seed, "size": [map_width, map_height], "parameters": parameters,
+                          "version": GENERATOR_VERSION}, sort_keys=True)
+
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get_filename(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def load(self, key, game_map, player, entities_list):
+        """
+        Load a cached level into a fresh game_map, placing the player and adding the monsters and items to
+        entities_list. Returns False (changing nothing) if the level isn't in the cache.
+
+        A file which can't be read (truncated, or written by an older version of the cache) counts as not being in the
+        cache - it is deleted, and the level is generated and saved again.
+        """
+        filename = self.get_filename(key)
+
+        try:
+            with np.load(filename) as data:
+                level = json.loads(str(data["level"]))
+                arrays = {name: data[name] for name in MapSnapshot.ARRAYS}
+
+        except FileNotFoundError:
+            return False
+
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile, zlib.error):
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+            return False
+
+        doors = dict()
+        for x, y, door_type, attributes in level["doors"]:
+            door = Button(x, y, 0, 0) if door_type == "button" else Door()
+            door.__dict__.update(attributes)
+            doors[(x, y)] = door
+
+        game_map.restore(MapSnapshot.from_data(game_map.width, game_map.height, arrays, doors))
+
+        player.x, player.y = level["player"]
+
+        for entity_type, x, y, name, char, colour, entity_stats in level["entities"]:
+            entity_class = Monster if entity_type == "monster" else Pickup
+            entities_list.append(entity_class(x, y, name, char, tuple(colour), stats(*entity_stats)))
+
+        # Mark the file as just used, for eviction.
+        os.utime(filename)
+
+        return True
+
+    def save(self, key, game_map, player, entities_list):
+        snapshot = game_map.snapshot()
+
+        doors = [[x, y, "button" if isinstance(door, Button) else "door", vars(door)]
+                 for (x, y), door in snapshot.doors.items()]
+
+        entities = []
+        for entity in entities_list:
+            if isinstance(entity, (Monster, Pickup)):
+                entity_stats = [entity.max_hp, entity.max_arm, entity.max_mp, entity.str, entity.dex] \
+                    if isinstance(entity, Monster) else [entity.hp, entity.arm, entity.mp, entity.str, entity.dex]
+                entities.append(["monster" if isinstance(entity, Monster) else "pickup", int(entity.x), int(entity.y),
+                                 entity.name, entity.char, list(entity.colour), entity_stats])
+
+        # Positions can be numpy ints (placement picks them out of numpy arrays), which JSON can't store.
+        level = {"player": [int(player.x), int(player.y)], "doors": doors, "entities": entities}
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Write to a temporary file first, so a crash half way through never leaves a broken level in the cache.
+        filename = self.get_filename(key)
+        temporary_filename = filename + ".tmp.npz"
+        np.savez_compressed(temporary_filename, level=np.array(json.dumps(level)), **snapshot.arrays)
+        os.replace(temporary_filename, filename)
+
+        self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used levels until the cache is no bigger than max_bytes.
+        """
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz") and not name.endswith(".tmp.npz"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+
+            os.remove(path)
+            total -= size
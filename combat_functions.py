@@ -0,0 +1,211 @@
+import numpy as np
+from message_functions import Message
+
+
+class AttackBatch:
+    """
+    The outcome of resolving many attacks in one go. Every attribute is a numpy array with one value per
+    attacker/defender pair, in the same order the pairs were passed to resolve_attacks.
+
+    ATTRIBUTES:
+        - attack_rolls / defend_rolls (int array): the d20 crit rolls for the attacker and the defender.
+        - attack_power (int array): the strength of each swing before the defender dodges.
+        - dodge (int array): how much of the swing the defender avoided.
+        - damage (int array): attack_power - dodge, clipped at 0 (a swing never heals).
+
+    Messages are not built when the batch is resolved - call messages() only if something is going to read them.
+    """
+    def __init__(self, attack_rolls, defend_rolls, attack_power, dodge):
+        self.attack_rolls = attack_rolls
+        self.defend_rolls = defend_rolls
+        self.attack_power = attack_power
+        self.dodge = dodge
+        self.damage = np.maximum(attack_power - dodge, 0)
+
+    def __len__(self):
+        return len(self.damage)
+
+    @property
+    def hits(self):
+        return self.damage > 0
+
+    def messages(self, attackers):
+        """
+        Generator yielding the same Message objects Actor.attack would have produced, one per swing.
+        :param attackers: sequence of entities (anything with a name and a colour) matching the resolved pairs.
+        """
+        for attacker, damage in zip(attackers, self.damage):
+            if damage > 0:
+                yield Message("{} attacks for {} damage", attacker.colour, attacker.name, damage)
+            else:
+                yield Message("{} attacks but does no damage", attacker.colour, attacker.name)
+
+
+def get_combat_stats(combatants):
+    """
+    Pull the strength and dexterity values out of a sequence of combatants into two int arrays.
+    A combatant can be an Actor, a stats namedtuple, or a monster/item template (anything with a .stats attribute).
+    """
+    strength = np.empty(len(combatants), dtype=np.int64)
+    dexterity = np.empty(len(combatants), dtype=np.int64)
+
+    for i, combatant in enumerate(combatants):
+        combatant_stats = getattr(combatant, "stats", combatant)
+        strength[i] = combatant_stats.str
+        dexterity[i] = combatant_stats.dex
+
+    return strength, dexterity
+
+
+def resolve_attacks(attack_str, defend_dex, rng):
+    """
+    Resolve one swing for every attacker/defender pair at once.
+
+    This mirrors the crit and dodge tables in Actor.attack exactly (including dodge using the attacker's crit roll
+    for the high band), so any change to those tables must be made in both places.
+
+    The random draws always happen in the same order and quantity (attacker crits, defender crits, attack power,
+    dodge - n of each), so the same rng seed will always give the same batch, bit for bit.
+
+    :param attack_str: int array of attacker strength values.
+    :param defend_dex: int array of defender dexterity values (same length as attack_str).
+    :param rng: a numpy Generator, e.g. np.random.default_rng(seed).
+    :return: AttackBatch
+    """
+    attack_str = np.asarray(attack_str)
+    defend_dex = np.asarray(defend_dex)
+    n = len(attack_str)
+
+    attack_rolls = rng.integers(1, 20, size=n, endpoint=True)
+    defend_rolls = rng.integers(1, 20, size=n, endpoint=True)
+
+    attack_fumble = attack_rolls == 1
+    attack_crit = attack_rolls == 20
+
+    # Bounds are truncated to int the same way int(self.str * 0.75) is in Actor.attack.
+    power_low = np.select([attack_fumble, attack_crit], [attack_str * 0.25, attack_str * 1.0], attack_str * 0.75)
+    power_high = np.select([attack_fumble, attack_crit], [attack_str * 0.5, attack_str * 1.25], attack_str * 1.0)
+    attack_power = rng.integers(power_low.astype(np.int64), power_high.astype(np.int64), endpoint=True)
+
+    defend_fumble = defend_rolls == 1
+    dodge_low = np.select([defend_fumble, attack_crit], [defend_dex * 0.0, defend_dex * 0.75], defend_dex * 0.5)
+    dodge_high = np.select([defend_fumble, attack_crit], [defend_dex * 0.25, defend_dex * 1.0], defend_dex * 0.75)
+    dodge = rng.integers(dodge_low.astype(np.int64), dodge_high.astype(np.int64), endpoint=True)
+
+    return AttackBatch(attack_rolls, defend_rolls, attack_power, dodge)
+
+
+class CombatEngine:
+    """
+    Resolves attacks in batches using its own seeded numpy generator, so simulation runs are reproducible per seed
+    and don't touch the global random module used by the game itself.
+
+    A message log is optional. When one is attached, every resolved swing is written to it just like Actor.attack
+    results would be; without one no Message objects are ever created, which is what headless balance runs want.
+    """
+    def __init__(self, seed=None, message_log=None):
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.message_log = message_log
+
+    def attach_log(self, message_log):
+        self.message_log = message_log
+
+    def detach_log(self):
+        self.message_log = None
+
+    def resolve(self, attackers, defenders):
+        """
+        Resolve one swing for each (attackers[i], defenders[i]) pair. Damage is NOT applied to the defenders - use
+        apply_damage for that if the combatants are live Actors.
+        """
+        attack_str, _ = get_combat_stats(attackers)
+        _, defend_dex = get_combat_stats(defenders)
+
+        batch = resolve_attacks(attack_str, defend_dex, self.rng)
+
+        if self.message_log is not None:
+            for message in batch.messages(attackers):
+                self.message_log.add_message(message)
+
+        return batch
+
+    @staticmethod
+    def apply_damage(defenders, batch, events):
+        """
+        Apply a resolved batch to live Actors via take_damage, which emits a DeathEvent into the bus for any killed.
+        """
+        for defender, damage in zip(defenders, batch.damage):
+            if damage > 0:
+                defender.take_damage(int(damage), events)
+
+    def simulate_duels(self, first, second, duels, max_rounds=100):
+        """
+        Fight `duels` independent battles between two combatants, `first` always swinging first each round, until one
+        side drops to 0 HP or max_rounds is reached. HP is taken from the combatants' stats; armour is ignored, just
+        as it is by Actor.take_damage.
+
+        :return: dict with the win rate for each side, the draw rate and the mean number of rounds fought.
+        """
+        first_str, first_dex = get_combat_stats([first])
+        second_str, second_dex = get_combat_stats([second])
+
+        first_hp = np.full(duels, getattr(first, "stats", first).hp, dtype=np.int64)
+        second_hp = np.full(duels, getattr(second, "stats", second).hp, dtype=np.int64)
+        rounds = np.zeros(duels, dtype=np.int64)
+
+        fighting = np.arange(duels)
+
+        for i in range(max_rounds):
+            if not len(fighting):
+                break
+
+            n = len(fighting)
+            rounds[fighting] += 1
+
+            swing = resolve_attacks(np.repeat(first_str, n), np.repeat(second_dex, n), self.rng)
+            second_hp[fighting] -= swing.damage
+
+            # Only duels where the second combatant survived get to swing back.
+            standing = fighting[second_hp[fighting] > 0]
+            swing = resolve_attacks(np.repeat(second_str, len(standing)), np.repeat(first_dex, len(standing)), self.rng)
+            first_hp[standing] -= swing.damage
+
+            fighting = standing[first_hp[standing] > 0]
+
+        first_wins = np.count_nonzero(second_hp <= 0)
+        second_wins = np.count_nonzero(first_hp <= 0)
+
+        return {"first_win_rate": float(first_wins / duels),
+                "second_win_rate": float(second_wins / duels),
+                "draw_rate": float((duels - first_wins - second_wins) / duels),
+                "mean_rounds": float(rounds.mean())}
+
+
+def balance_sweep(templates, opponent, duels=10000, seed=0, max_rounds=100):
+    """
+    Run simulate_duels for each template against the same opponent (e.g. the player's stats), using a fresh engine
+    per template seeded from `seed`, so adding a template to the manual doesn't shift the results of the others.
+
+    :param templates: a monster_manual entry - either a single template or a tuple of them.
+    :return: dict of template name -> simulate_duels result.
+    """
+    if hasattr(templates, "stats"):
+        templates = (templates,)
+
+    results = dict()
+    for index, template in enumerate(templates):
+        engine = CombatEngine(seed=(seed, index))
+        results[template.name] = engine.simulate_duels(opponent, template, duels, max_rounds=max_rounds)
+
+    return results
+
+
+if __name__ == "__main__":
+    from entity_templates import monster_manual
+    from entity_classes import stats
+
+    player_stats = stats(hp=200, arm=50, mp=25, str=4, dex=2)
+
+    for name, result in balance_sweep(monster_manual["level1"], player_stats).items():
+        print(name, result)
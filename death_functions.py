@@ -11,8 +11,13 @@ def kill_player(player):
     return Message("You died", colours["dark_red"]), GameStates.PLAYER_DEAD
 
 
-def kill_monster(monster):
-    death_message = Message("{} is dead!".format(monster.name), colours["dark_red"])
+def kill_monster(monster, entities, game_map):
+    """
+    Turn a monster into its remains. The corpse is taken out of the live entities and stamped into the map's static
+    layer, so it no longer costs anything in the per-turn and per-frame entity loops.
+    """
+    # The name is passed now (before it becomes "Remains of ..."), but only formatted if the message is shown.
+    death_message = Message("{} is dead!", colours["dark_red"], monster.name)
 
     monster.dead = True
     monster.name = "Remains of {}".format(monster.name.capitalize())
@@ -21,5 +26,8 @@ def kill_monster(monster):
     monster.blocks = False
     monster.render_order = RenderOrder.CORPSE
 
+    entities.remove(monster)
+    game_map.static_layer.add(monster)
+
     return death_message
 
@@ -1,22 +1,23 @@
+import os
 import tdl
-from game_states import GameStates
 from input_functions import handle_keys
-from map_functions import GameMap, Button, dungeon_generator_complex
-from entity_classes import Monster, Player, Pickup, get_blocking_entities_at_location, stats
-from render_functions import render_all
+from render_functions import render_snapshot
+from render_targets import make_consoles
+from hud_functions import Hud
+from perf_functions import phase_timer, Profiler
 from message_functions import MessageLog
-from death_functions import kill_player, kill_monster
-from config import colours
+from session_functions import GameSession
+from replay_functions import Recorder
+from cache_functions import LevelCache
+from save_functions import SaveManager, load_game
+from rewind_functions import RewindBuffer
+from snapshot_functions import SimulationThread
 from dungeon_from_file import read_map_from_file
 
 
-def main():
-    # # SET GAME CONSTANTS
+def get_screen_layout(map_width=150, map_height=150, view_port_width=30, view_port_height=30):
     # Map - any width and height OK, view port will move with player.
-    map_width, map_height = (150, 150)
-
     # View Port - the area of the screen displaying game world.
-    view_port_width, view_port_height = (30, 30)
 
     # Screen = derive from view port. Leave 2 cells at each side (if no side panels), 10 at top and bottom for HUD.
     screen_width, screen_height = (view_port_width + 19, view_port_height + 24)
@@ -39,189 +40,176 @@ def main():
     screen_layout["hud"] = (hud_width, hud_height)
     screen_layout["right"] = (right_panel_width, right_panel_height)
 
+    return screen_layout
+
+
+def main():
+    # # SET GAME CONSTANTS
+    screen_layout = get_screen_layout()
+    map_width, map_height = screen_layout["map"]
+    hud_width, hud_height = screen_layout["hud"]
+    right_panel_width, right_panel_height = screen_layout["right"]
+    message_log_width, message_log_height = screen_layout["message_log"]
+
     # # INITIALISE TDL CONSOLE ENGINE
-    # General - set the font to be used, and fps limit.
+    # General - set the font to be used, and fps limit (a cap only - the main loop waits for input rather than spinning).
     tdl.set_font('terminal16x16.png', greyscale=True, altLayout=False)
     tdl.set_fps(100)
 
-    # Consoles - these are different drawing canvases. Root is what is displayed on screen, pulled from other consoles.
-    root_console = tdl.init(screen_width, screen_height, title='Roguelike 3')
-    map_console = tdl.Console(map_width, map_height)
-    message_console = tdl.Console(message_log_width, message_log_height)
-    view_port_console = tdl.Console(view_port_width, view_port_height)
-    hud_console = tdl.Console(hud_width, hud_height)
-    right_console = tdl.Console(right_panel_width, right_panel_height)
+    # Frame time - the longest the render loop waits for input before checking for a newly finished turn to draw.
+    frame_time = 1 / 60
 
-    # Holding list to be unpacked in render function.
-    all_consoles = [root_console, view_port_console, map_console, message_console, hud_console, right_console]
+    # Performance stats - set ROGUELIKE_PERF=1 to time each phase of the loop (F3 shows the stats panel and also turns
+    # timing on), and ROGUELIKE_PERF_EXPORT to a .csv or .json filename to save the stats when the game closes.
+    phase_timer.enabled = os.environ.get("ROGUELIKE_PERF", "0") not in ("", "0")
+    perf_export = os.environ.get("ROGUELIKE_PERF_EXPORT")
 
-    # Set up HUD panels
-    message_log = MessageLog(0, 0, width=message_log_width, height=message_log_height)
+    # Profiling - F4 starts / stops cProfile and tracemalloc, and ROGUELIKE_PROFILE=1 starts them with the main loop.
+    # Files are written to ROGUELIKE_PROFILE_DIR (default: the working directory), see perf_functions.Profiler.
+    profile_on_start = os.environ.get("ROGUELIKE_PROFILE", "0") not in ("", "0")
+    profile_dir = os.environ.get("ROGUELIKE_PROFILE_DIR", ".")
 
-    # Field of view configuration
-    fov_algorithm = "BASIC"
-    fov_light_walls = True
-    fov_radius = 10
-    fov_recompute = True
+    # Recording - ROGUELIKE_RECORD=<file>.json saves the seeds and every action, to be played back by replay_functions.
+    # ROGUELIKE_SEED=<seed> plays the level for that seed instead of a random one.
+    record_filename = os.environ.get("ROGUELIKE_RECORD")
+    seed = os.environ.get("ROGUELIKE_SEED")
+
+    # Level cache - levels already generated for a seed are loaded from here. ROGUELIKE_LEVEL_CACHE=0 turns it off.
+    level_cache = None if os.environ.get("ROGUELIKE_LEVEL_CACHE") == "0" else LevelCache(".level_cache")
+
+    # Saving - ROGUELIKE_SAVE=<directory> autosaves after every turn, and carries on the game saved there (if any)
+    # instead of starting a new one. See save_functions.SaveManager.
+    save_directory = os.environ.get("ROGUELIKE_SAVE")
+
+    # Consoles - these are different drawing canvases. Root is what is displayed on screen, pulled from other consoles.
+    # Returned as a holding list to be unpacked in render function.
+    all_consoles = make_consoles(screen_layout, title='Roguelike 3')
+
+    # Set up HUD panels. The render loop's message log starts empty, and is filled from the snapshots - the messages
+    # are added to the session's own log first, on the simulation thread.
+    message_log = MessageLog(0, 0, width=message_log_width, height=message_log_height, greeting=None)
+    session_message_log = MessageLog(0, 0, width=message_log_width, height=message_log_height)
+    hud = Hud(hud_width, right_panel_width, right_panel_height)
 
     # # GAME WORLD SETUP
-    # General - set the initial game state.
-    game_state = GameStates.PLAYER_TURN
-    mouse_coordinates = (0, 0)
+    # The session generates the level, and holds the map, player, entities and turn logic - see session_functions.
+    session = load_game(save_directory, session_message_log) if save_directory else None
 
-    # Player & entities - set up player stats, then put in holding list for all game entities.
-    player_stats = stats(hp=200, arm=50, mp=25, str=4, dex=2)
-    player = Player(5, 5, "Bolly Angerfist", "@", (255, 255, 255), player_stats)
-    entities = [player]
+    if session is None:
+        session = GameSession(map_width, map_height, seed=int(seed) if seed else None, message_log=session_message_log,
+                              level_cache=level_cache)
+    print(session.seed)
 
-    # Map - create the map object, and then run the function to generate game world.
-    game_map = GameMap(map_width, map_height)
-    dungeon_generator_complex(game_map, player, entities, max_monsters_per_room=3, max_items_per_room=2, num_rooms=15, intersect_chance=0, cross_link_chance=30)
+    # Rewind - R undoes the last turn, back as far as the last 50 (see rewind_functions).
+    session.rewind = RewindBuffer(capacity=50)
     # game_map = read_map_from_file("maptest.txt", player, entities)
 
+    mouse_coordinates = (0, 0)
+
+    # Profiler - tagged with the map seed, so a profile can be re-run against the same level.
+    profiler = Profiler(session.seed, output_dir=profile_dir)
+
+    recorder = Recorder(session) if record_filename else None
+    saver = SaveManager(save_directory) if save_directory else None
+
+    # Simulation - from here on the session (with the recorder, saver and profiler) belongs to the simulation thread,
+    # which takes each turn and publishes a snapshot of the result. This loop only draws the newest snapshot and
+    # handles input, so the window stays responsive while a long turn is taken. See snapshot_functions.
+    simulation = SimulationThread(session, *screen_layout["view_port"], recorder=recorder, saver=saver,
+                                  profiler=profiler, profile_on_start=profile_on_start)
+    simulation.start()
+
+    def on_exit():
+        # Let the simulation finish the turns already asked for (and stop the profiler) before saving anything.
+        simulation.stop()
+
+        if perf_export:
+            phase_timer.export(perf_export)
+
+        if recorder:
+            recorder.save(record_filename)
+
+        if saver:
+            saver.close()
+
     # # MAIN GAME LOOP
+    snapshot = None
+    redraw = False
+
     while not tdl.event.is_window_closed():  # Endless loop while program is still running
 
+        if simulation.error is not None:
+            raise simulation.error
+
         '''RENDERING START'''
-        # Recompute the FOV around the player only when triggered.
-        if fov_recompute:
-            game_map.compute_fov(player.x, player.y,
-                                 fov=fov_algorithm, radius=fov_radius, light_walls=fov_light_walls, sphere=True)
-
-        # Main rendering function - perform every frame.
-        render_all(game_map, all_consoles, player, entities, fov_recompute, screen_layout, message_log, mouse_coordinates)
-        fov_recompute = False
+        # Draw the newest finished turn, if there is one - the map only when it's new, and otherwise only if what's
+        # under the mouse (or a panel) has changed since the last frame.
+        new_snapshot = simulation.buffer.take()
+
+        if new_snapshot is not None:
+            snapshot = new_snapshot
+
+        if snapshot is not None and (new_snapshot is not None or redraw):
+            with phase_timer.phase("frame"):
+                render_snapshot(snapshot, all_consoles, new_snapshot is not None, screen_layout, message_log,
+                                mouse_coordinates, hud)
+            redraw = False
         '''RENDERING END'''
 
         '''GET INPUT START'''
-        # Check for keyboard/mouse events.
-        for event in tdl.event.get():
-            if event.type == 'KEYUP':
-                user_input = event
-                break
+        # Block until there is a keyboard/mouse event, or for a frame at most, so a turn finished meanwhile is drawn.
+        event = tdl.event.wait(timeout=frame_time, flush=False)
 
-            elif event.type == "MOUSEMOTION":
-                mouse_coordinates = event.cell
+        if event is None:
+            continue
 
-        else:
-            user_input = None
+        if event.type == "MOUSEMOTION":
+            # Only the cell under the mouse matters (for hover highlights), not every pixel it moves.
+            if event.cell != mouse_coordinates:
+                mouse_coordinates = event.cell
+                redraw = True
+            continue
 
-        if not user_input:
+        if event.type != 'KEYUP':
             continue
 
+        user_input = event
+        redraw = True
+
         # Take the keyboard input and parse through the input handler.
         action = handle_keys(user_input)
 
         # Get actions only of the type indicated by the input handler.
-        move = action.get('move')
         exit_game = action.get('exit_game')
         fullscreen = action.get('fullscreen')
-        pickup = action.get('pickup')
+        scroll_log = action.get('scroll_log')
+        toggle_stats = action.get('toggle_stats')
         '''GET INPUT END'''
 
         '''MENU HANDLING START'''
         if exit_game:
+            on_exit()
             return True  # Break out of the loop and close script.
 
         if fullscreen:
             tdl.set_fullscreen(not tdl.get_fullscreen())
+
+        # Showing the stats panel doesn't take up the player's turn.
+        if toggle_stats:
+            hud.toggle_stats()
+            phase_timer.enabled = phase_timer.enabled or hud.show_stats
+            continue
+
+        # Nor does scrolling the message log.
+        if scroll_log:
+            message_log.scroll(scroll_log)
+            continue
         '''MENU HANDLING END'''
 
-        '''PLAYER TURN START'''
-        player_turn_results = []
-
-        # Check for items.
-        if pickup and game_state == GameStates.PLAYER_TURN:
-            for entity in entities:
-                if entity.x == player.x and entity.y == player.y:
-                    if isinstance(entity, Pickup):
-                        pickup_results = entity.activate(player, entities)
-                        player_turn_results.extend(pickup_results)
-                        fov_recompute = True
-                        game_state = GameStates.ENEMY_TURN
-
-        # If it's a movement event and it's the player's turn, move the player.
-        if move and game_state == GameStates.PLAYER_TURN:
-            dx, dy = move
-            destination_x = player.x + dx
-            destination_y = player.y + dy
-
-            # Only move the player if its a walkable tile on the map.
-            if game_map.walkable[destination_x, destination_y]:
-                target = get_blocking_entities_at_location(entities, destination_x, destination_y)
-
-                if target:
-                    if isinstance(target, Monster):
-                        attack_results = player.attack(target)
-                        player_turn_results.extend(attack_results)
-                        fov_recompute = True
-
-                else:
-                    player.move(dx, dy)
-                    fov_recompute = True
-
-            # If the tile is a door and not open, and not a door with a button - open it when touched by player.
-            elif game_map.is_door[destination_x, destination_y] and not game_map.door[destination_x][destination_y].is_open:
-                if not game_map.door[destination_x][destination_y].button:
-                    game_map.open_door(destination_x, destination_y)
-                    fov_recompute = True
-
-                # If the tile is a Button, activate it.
-                if isinstance(game_map.door[destination_x][destination_y], Button):
-                    game_map.door[destination_x][destination_y].open_door(game_map)
-                    fov_recompute = True
-
-            game_state = GameStates.ENEMY_TURN
-
-        for result in player_turn_results:
-            message = result.get("message")
-            dead_entity = result.get("dead")
-
-            if message:
-                message_log.add_message(message)
-
-            if dead_entity:
-                if dead_entity == player:
-                    message, game_state = kill_player(dead_entity)
-                else:
-                    message = kill_monster(dead_entity)
-
-                message_log.add_message(message)
-        '''PLAYER TURN END'''
-
-        '''ENEMY TURN START'''
-        # If this is the Enemy's turn, iterate through the entities list and let the Monster objects take an action.
-        if game_state == GameStates.ENEMY_TURN:
-
-            for entity in entities:
-                if isinstance(entity, Monster) and not entity.dead:
-                    enemy_turn_results = entity.take_turn(player, game_map, entities)
-                    fov_recompute = True
-
-                    for result in enemy_turn_results:
-                        message = result.get("message")
-                        dead_entity = result.get("dead")
-
-                        if message:
-                            message_log.add_message(message)
-
-                        if dead_entity:
-                            if dead_entity == player:
-                                message, game_state = kill_player(dead_entity)
-                            else:
-                                message = kill_monster(dead_entity)
-
-                            message_log.add_message(message)
-
-                        if game_state == GameStates.PLAYER_DEAD:
-                            break
-
-                    if game_state == GameStates.PLAYER_DEAD:
-                        break
-
-            else:
-                game_state = GameStates.PLAYER_TURN
-            '''ENEMY TURN START'''
+        # Everything else (turns, and starting or stopping the profiler) is queued for the simulation thread.
+        simulation.submit(action)
+
+    on_exit()
 
 
 if __name__ == "__main__":
@@ -1,9 +1,10 @@
 from render_functions import RenderOrder
 import math
 from collections import namedtuple
-from message_functions import Message
+from event_functions import DeathEvent, PickupEvent
 from config import colours
-from random import randint
+import rewind_functions
+import numpy as np
 
 stats = namedtuple("stats", ["hp", "arm", "mp", "str", "dex"])
 
@@ -21,16 +22,56 @@ class Entity:
 
     By default the render order is CORPSE (i.e. the lowest value) and will be rendered on the first pass.
     In effect this means it will likely be rendered on top of by other more important entities (Actors, items).
+
+    An entity can carry a LightSource in its light attribute (None by default) - see lighting_functions.
+
+    Position (x, y) and render_order are properties - when the entity belongs to an EntityList (its collection) any
+    change to them is passed on, so the list can keep its position index and render order buckets up to date.
     """
     def __init__(self, map_x, map_y, name, char, colour):
-        self.x = map_x
-        self.y = map_y
+        self.collection = None
+        self.id = id(self)
+        self._x = map_x
+        self._y = map_y
+        self._render_order = RenderOrder.CORPSE
         self.name = name
         self.char = char
         self.colour = colour
         self.blocks = False
-        self.render_order = RenderOrder.CORPSE
-        self.id = id(self)
+        self.light = None
+
+    @property
+    def x(self):
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        if self.collection is not None:
+            self.collection.move(self, value, self._y)
+
+        self._x = value
+
+    @property
+    def y(self):
+        return self._y
+
+    @y.setter
+    def y(self, value):
+        if self.collection is not None:
+            self.collection.move(self, self._x, value)
+
+        self._y = value
+
+    @property
+    def render_order(self):
+        return self._render_order
+
+    @render_order.setter
+    def render_order(self, value):
+        if self.collection is not None:
+            self.collection.change_render_order(self, value)
+
+        self._render_order = value
 
 
 class Actor(Entity):
@@ -52,21 +93,24 @@ class Actor(Entity):
         self.dex = stats.dex
 
     def move(self, dx, dy):
+        rewind_functions.journal.touch_entity(self)
+
         self.x += dx
         self.y += dy
 
-    def take_damage(self, amount):
-        results = []
+    def take_damage(self, amount, events):
+        rewind_functions.journal.touch_entity(self)
 
         self.hp -= amount
 
         if self.hp <= 0:
-            results.append({"dead": self})
+            events.emit(DeathEvent, self)
 
-        return results
-
-    def attack(self, target):
-        results = []
+    def attack(self, target, events, rng):
+        """
+        :param rng: the random.Random the rolls come from - the session's combat_rng.
+        """
+        randint = rng.randint
 
         self_crit_roll = randint(1, 20)
         target_crit_roll = randint(1, 20)
@@ -88,14 +132,11 @@ class Actor(Entity):
         damage = attack_power - dodge
 
         if damage > 0:
-            results.append({"message": Message("{} attacks for {} damage"
-                           .format(self.name, damage), self.colour)})
-            results.extend(target.take_damage(damage))
+            events.message("{} attacks for {} damage", self.colour, self.name, damage)
+            target.take_damage(damage, events)
 
         else:
-            results.append({"message": Message("{} attacks but does no damage".format(self.name), self.colour)})
-
-        return results
+            events.message("{} attacks but does no damage", self.colour, self.name)
 
 
 class Item(Entity):
@@ -118,52 +159,54 @@ class Pickup(Item):
         self.str = stats.str
         self.dex = stats.dex
 
-    def activate(self, target, entities):
-        results = list()
-        results.append({"message": Message("{} picks up {}".format(target.name, self.name), self.colour)})
+    def activate(self, target, entities, events):
+        rewind_functions.journal.touch_entity(self)
+        rewind_functions.journal.touch_entity(target)
+
+        events.message("{} picks up {}", self.colour, target.name, self.name)
 
         used = False
 
         if self.hp > 0:
             if target.hp == target.max_hp:
-                results.append({"message": Message("HP already full!", self.colour)})
+                events.message("HP already full!", self.colour)
             elif (target.hp + self.hp) > target.max_hp:
-                results.append({"message": Message("{} HP restored.".format(target.max_hp - target.hp), self.colour)})
+                events.message("{} HP restored.", self.colour, target.max_hp - target.hp)
                 target.hp = target.max_hp
                 used = True
             else:
-                results.append({"message": Message("{} HP restored.".format(self.hp), self.colour)})
+                events.message("{} HP restored.", self.colour, self.hp)
                 target.hp += self.hp
                 used = True
 
         if self.mp > 0:
             if target.mp == target.max_mp:
-                results.append({"message": Message("MP already full!", self.colour)})
+                events.message("MP already full!", self.colour)
             elif (target.mp + self.mp) > target.max_mp:
-                results.append({"message": Message("{} MP restored.".format(target.max_mp - target.mp), self.colour)})
+                events.message("{} MP restored.", self.colour, target.max_mp - target.mp)
                 target.mp = target.max_mp
                 used = True
             else:
-                results.append({"message": Message("{} MP restored.".format(self.mp), self.colour)})
+                events.message("{} MP restored.", self.colour, self.mp)
                 target.mp += self.mp
                 used = True
 
         if self.arm > 0:
             if target.arm == target.max_arm:
-                results.append({"message": Message("AR already full!", self.colour)})
+                events.message("AR already full!", self.colour)
             elif (target.arm + self.arm) > target.max_arm:
-                results.append({"message": Message("{} AR restored.".format(target.max_arm - target.arm), self.colour)})
+                events.message("{} AR restored.", self.colour, target.max_arm - target.arm)
                 target.arm = target.max_arm
                 used = True
             else:
-                results.append({"message": Message("{} AR restored.".format(self.arm), self.colour)})
+                events.message("{} AR restored.", self.colour, self.arm)
                 target.arm += self.arm
                 used = True
 
         if used:
             entities.remove(self)
 
-        return results
+        events.emit(PickupEvent, self, target, used)
 
 
 class Player(Actor):
@@ -202,24 +245,134 @@ class Monster(Actor):
         dy = other.y - self.y
         return math.sqrt(dx ** 2 + dy ** 2)
 
-    def take_turn(self, target, game_map, entities):
-        results = []
-
+    def take_turn(self, target, game_map, entities, events, rng):
         if game_map.fov[self.x, self.y]:
             if self.distance_to(target) >= 2:
                 self.move_towards(target.x, target.y, game_map, entities)
 
             elif target.hp > 0:
-                attack_results = self.attack(target)
-                results.extend(attack_results)
+                self.attack(target, events, rng)
+
+
+class EntityList:
+    """
+    Container for the entities which are still "live" in the game world (the player, monsters, and items).
+
+    Behaves like the plain list it replaces (append, remove, iteration, len, in) but entities are stored in a dict keyed
+    on Entity.id, so removing one (picking up an item, a monster dying) is constant time rather than a scan of the list.
+    Insertion order is preserved, so iteration order is the same as it would have been with a list.
+
+    Iteration walks a snapshot of the current entities, so it is safe to remove an entity from inside the loop.
+
+    Two indexes are kept up to date as entities are added, removed, moved or change render order:
+        - buckets: one dict of entities per RenderOrder, so drawing in render order never needs a sort.
+        - cells: (x, y) -> list of the entities on that tile, so "what is here?" never needs a scan.
+    """
+    def __init__(self, entities=()):
+        self._entities = dict()
+        self.buckets = {render_order: dict() for render_order in RenderOrder}
+        self.cells = dict()
+
+        for entity in entities:
+            self.append(entity)
+
+    def append(self, entity):
+        self._entities[entity.id] = entity
+        self.buckets[entity.render_order][entity.id] = entity
+        self.cells.setdefault((entity.x, entity.y), []).append(entity)
+        entity.collection = self
+
+    def remove(self, entity):
+        rewind_functions.journal.entity_removed(self, entity)
+
+        del self._entities[entity.id]
+        del self.buckets[entity.render_order][entity.id]
+        self._remove_from_cell(entity, entity.x, entity.y)
+        entity.collection = None
+
+    def set_order(self, ids):
+        """
+        Put the entities into the order of the given Entity.ids (any not in it go last), in the list and in each render
+        order bucket - so an entity added back (e.g. by a rewind) takes its old place rather than going on the end.
+        """
+        position = {entity_id: i for i, entity_id in enumerate(ids)}
+
+        def key(item):
+            return position.get(item[0], len(position))
+
+        self._entities = dict(sorted(self._entities.items(), key=key))
+        self.buckets = {render_order: dict(sorted(bucket.items(), key=key)) for render_order, bucket in self.buckets.items()}
+
+    def _remove_from_cell(self, entity, x, y):
+        cell = self.cells[(x, y)]
+        cell.remove(entity)
+
+        if not cell:
+            del self.cells[(x, y)]
+
+    def move(self, entity, new_x, new_y):
+        self._remove_from_cell(entity, entity.x, entity.y)
+        self.cells.setdefault((new_x, new_y), []).append(entity)
+
+    def change_render_order(self, entity, new_render_order):
+        del self.buckets[entity.render_order][entity.id]
+        self.buckets[new_render_order][entity.id] = entity
+
+    def at(self, x, y):
+        """
+        The entities on tile x, y (an empty tuple if there are none).
+        """
+        return self.cells.get((x, y), ())
+
+    def get_in_view(self, fov, view_port):
+        """
+        The entities which are both inside the view port and in the FOV, in render order (lowest value first).
+
+        Whichever is smaller is walked - the tiles in view, or the occupied tiles - so the cost is bounded by the size
+        of the view rather than the number of entities on the level.
+
+        :param fov: the game map's FOV array.
+        :param view_port: (x1, y1, x2, y2) as returned by get_view_port_position.
+        """
+        view_x1, view_y1, view_x2, view_y2 = view_port
+        visible_x, visible_y = np.nonzero(fov[view_x1:view_x2, view_y1:view_y2])
+
+        in_view = []
+        if len(visible_x) < len(self.cells):
+            for x, y in zip((visible_x + view_x1).tolist(), (visible_y + view_y1).tolist()):
+                in_view.extend(self.cells.get((x, y), ()))
+        else:
+            for (x, y), cell in self.cells.items():
+                if view_x1 <= x < view_x2 and view_y1 <= y < view_y2 and fov[x, y]:
+                    in_view.extend(cell)
+
+        # Drop each entity into its render order's list, then join the lists up in order - no sort needed.
+        by_render_order = {render_order: [] for render_order in RenderOrder}
+        for entity in in_view:
+            by_render_order[entity.render_order].append(entity)
+
+        return [entity for render_order in RenderOrder for entity in by_render_order[render_order]]
+
+    def get_by_render_order(self, render_order):
+        """
+        A snapshot of the entities in one render order bucket, e.g. RenderOrder.ACTOR for every live actor.
+        """
+        return list(self.buckets[render_order].values())
+
+    def __contains__(self, entity):
+        return entity.id in self._entities
+
+    def __iter__(self):
+        return iter(list(self._entities.values()))
 
-        return results
+    def __len__(self):
+        return len(self._entities)
 
 
 # TODO: doc
 def get_blocking_entities_at_location(entities, destination_x, destination_y):
-    for entity in entities:
-        if entity.blocks and entity.x == destination_x and entity.y == destination_y:
+    for entity in entities.at(destination_x, destination_y):
+        if entity.blocks:
             return entity
 
     return None
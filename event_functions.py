@@ -0,0 +1,101 @@
+from collections import deque
+from message_functions import Message
+
+
+class Event:
+    """
+    Base class for everything which can be sent through the EventBus. Each event type lists its fields in __slots__,
+    set() fills them in and clear() drops the references again so a pooled event doesn't keep dead objects alive.
+
+    Events are pooled and re-used by the bus, so a handler must never hold on to the event object itself after it
+    returns - copy out whichever fields are needed instead.
+    """
+    __slots__ = ()
+
+    def set(self, *args):
+        for field, value in zip(self.__slots__, args):
+            setattr(self, field, value)
+
+    def clear(self):
+        for field in self.__slots__:
+            setattr(self, field, None)
+
+
+class MessageEvent(Event):
+    """ A Message object to be shown to the player. """
+    __slots__ = ("message",)
+
+
+class DeathEvent(Event):
+    """ An Actor which has dropped to 0 HP or below. """
+    __slots__ = ("entity",)
+
+
+class PickupEvent(Event):
+    """ An item has been activated by an actor (target). used is False if it had no effect and is still on the map. """
+    __slots__ = ("item", "target", "used")
+
+
+class DoorOpenEvent(Event):
+    """ An actor has walked into the closed door (or button) at x, y. """
+    __slots__ = ("x", "y")
+
+
+class EventBus:
+    """
+    Replaces the lists of result dicts ({"message": ..., "dead": ...}) which every action used to return.
+
+    Actions emit typed events into the bus, and dispatch() hands each one to the handlers registered for its type, in
+    the order they were emitted. Handlers can emit further events of their own (e.g. a death produces a message), and
+    these are processed in the same dispatch call.
+
+    If nothing is registered for an event type, emitting one does nothing at all - no event object is queued, and
+    message() doesn't even create the Message. A headless run which never registers a MessageEvent handler therefore
+    pays nothing for messages.
+    """
+    def __init__(self):
+        self.handlers = dict()
+        self.queue = deque()
+        self.pools = dict()
+
+    def register(self, event_type, handler):
+        self.handlers.setdefault(event_type, []).append(handler)
+        self.pools.setdefault(event_type, [])
+
+    def unregister(self, event_type, handler):
+        self.handlers[event_type].remove(handler)
+
+        if not self.handlers[event_type]:
+            del self.handlers[event_type]
+
+    def wants(self, event_type):
+        return event_type in self.handlers
+
+    def emit(self, event_type, *args):
+        if event_type not in self.handlers:
+            return
+
+        pool = self.pools[event_type]
+        event = pool.pop() if pool else event_type()
+        event.set(*args)
+
+        self.queue.append(event)
+
+    def message(self, text, colour=(255, 255, 255), *args):
+        """
+        Shortcut to emit a MessageEvent. Any args are kept on the Message and only formatted into the text if and when
+        something reads it.
+        """
+        if MessageEvent in self.handlers:
+            self.emit(MessageEvent, Message(text, colour, *args))
+
+    def dispatch(self):
+        while self.queue:
+            event = self.queue.popleft()
+            event_type = type(event)
+
+            for handler in self.handlers.get(event_type, ()):
+                handler(event)
+
+            event.clear()
+            self.pools.setdefault(event_type, []).append(event)
@@ -0,0 +1,125 @@
+import os
+import sys
+import tempfile
+import time
+import map_functions
+from map_functions import GameMap, GenerationPipeline
+from entity_classes import Player, EntityList, stats
+from benchmark_functions import StageTimer, patch, median, run_cli
+
+
+# Every case is generated once per seed, and the median time of each stage is kept.
+SEEDS = [888727, 513201, 130875]
+
+# The stages of dungeon_generator_complex which are timed separately. Placement covers both the per-room and the
+# map-wide placement of monsters and items. save_map_to_file builds the level's text and starts the export thread, and
+# save_map_write is that thread writing the file.
+STAGES = [
+    (map_functions, "create_room", "create_room"),
+    (map_functions, "get_closest_room", "closest_room"),
+    (map_functions, "create_corridor", "corridors"),
+    (map_functions, "set_doors", "set_doors"),
+    (map_functions, "remove_junk_doors", "remove_junk_doors"),
+    (map_functions, "place_monsters", "placement"),
+    (map_functions, "place_pickups", "placement"),
+    (GameMap, "save_map_to_file", "save_map_to_file"),
+    (map_functions, "_write_text", "save_map_write"),
+]
+
+DEFAULTS = {"size": 150, "num_rooms": 15, "cross_link_chance": 30, "intersect_chance": 0,
+            "max_monsters_per_room": 3, "max_items_per_room": 2}
+
+
+def get_cases(quick=False):
+    """
+    The benchmark cases, as {case name: generator parameters}. Each sweep varies one parameter from the defaults used
+    by engine.main - map size sweeps scale the number of rooms with the width, so the dungeon stays as dense.
+    """
+    sizes = [150, 300, 600] if quick else [150, 300, 600, 1000, 2000]
+
+    cases = dict()
+
+    for size in sizes:
+        cases["size_{}".format(size)] = dict(DEFAULTS, size=size, num_rooms=int(15 * size / 150))
+
+    for num_rooms in [5, 15, 30, 60]:
+        cases["rooms_{}".format(num_rooms)] = dict(DEFAULTS, num_rooms=num_rooms)
+
+    for cross_link_chance in [0, 50, 100]:
+        cases["cross_link_{}".format(cross_link_chance)] = dict(DEFAULTS, cross_link_chance=cross_link_chance)
+
+    for intersect_chance in [25, 50]:
+        cases["intersect_{}".format(intersect_chance)] = dict(DEFAULTS, intersect_chance=intersect_chance)
+
+    for density in [0, 6, 12]:
+        cases["density_{}".format(density)] = dict(DEFAULTS, max_monsters_per_room=density, max_items_per_room=density)
+
+    return cases
+
+
+def generate(parameters, seed, timer):
+    """
+    Build one level, returning {stage: ms}, plus "init" for creating the GameMap and "total" for the whole generator.
+    """
+    map_functions.set_seed(seed)
+    timer.reset()
+
+    start = time.perf_counter()
+    game_map = GameMap(parameters["size"], parameters["size"])
+    init_ms = (time.perf_counter() - start) * 1000
+
+    player = Player(0, 0, "Bot", "@", (255, 255, 255), stats(hp=200, arm=50, mp=25, str=4, dex=2))
+    entities = EntityList([player])
+
+    # The same as dungeon_generator_complex, but with the pipeline to hand, so the export thread can be waited for -
+    # inside the timing, so the disk write is counted, and before the suite leaves its temporary directory.
+    start = time.perf_counter()
+    pipeline = GenerationPipeline(seed, num_rooms=parameters["num_rooms"],
+                                  cross_link_chance=parameters["cross_link_chance"],
+                                  intersect_chance=parameters["intersect_chance"],
+                                  max_monsters_per_room=parameters["max_monsters_per_room"],
+                                  max_items_per_room=parameters["max_items_per_room"])
+    pipeline.generate(game_map, player, entities)
+
+    if pipeline.export_thread is not None:
+        pipeline.export_thread.join()
+
+    total_ms = (time.perf_counter() - start) * 1000
+
+    result = timer.get_milliseconds()
+    result["init"] = init_ms
+    result["total"] = total_ms
+
+    return result
+
+
+def run_suite(quick=False):
+    """
+    Run every case over every seed, and return {case name: {stage: median ms}}.
+
+    save_map_to_file writes a file per seed to the working directory, so the suite runs in a temporary directory.
+    """
+    timer = StageTimer()
+    results = dict()
+    working_directory = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as directory, patch(STAGES, timer):
+        os.chdir(directory)
+
+        try:
+            for name, parameters in get_cases(quick).items():
+                runs = [generate(parameters, seed, timer) for seed in SEEDS]
+                stages = set().union(*runs)
+
+                results[name] = {stage: median([run.get(stage, 0.0) for run in runs]) for stage in stages}
+                print(name, "{:.1f} ms".format(results[name]["total"]), file=sys.stderr)
+
+        finally:
+            os.chdir(working_directory)
+
+    return results
+
+
+if __name__ == "__main__":
+    # Usage: python generation_benchmark.py [--quick] [--save baseline.json] [--compare baseline.json]
+    run_cli(run_suite, sys.argv)
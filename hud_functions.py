@@ -0,0 +1,151 @@
+from config import colours
+from render_functions import RenderOrder, render_status_bar, get_view_port_position, map_from_screen
+from render_targets import FrameBuffer
+from perf_functions import phase_timer, draw_stats_panel
+
+
+class Widget:
+    """
+    A rectangular piece of a HUD panel which keeps its own rendered cells in a small FrameBuffer.
+
+    Each frame the widget is given a key - a tuple of everything its drawing depends on. Only if the key differs from
+    the one it was last drawn with does it clear and redraw its buffer and copy it onto the panel console. Otherwise
+    the panel already holds the right cells and nothing is touched.
+
+    Sub-classes implement draw(buffer, *args) to do the actual drawing.
+    """
+    def __init__(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        self.buffer = FrameBuffer(width, height)
+        self.key = None
+
+    def update(self, panel, key, *args):
+        if key == self.key:
+            return False
+
+        self.buffer.clear()
+        self.draw(self.buffer, *args)
+        panel.blit(self.buffer, self.x, self.y)
+        self.key = key
+
+        return True
+
+    def invalidate(self):
+        self.key = None
+
+    def draw(self, buffer, *args):
+        raise NotImplementedError
+
+
+class NameWidget(Widget):
+    def draw(self, buffer, name):
+        buffer.draw_str(0, 0, name, bg=None, fg=colours["white"])
+
+
+class StatusBarWidget(Widget):
+    """
+    A labelled status bar, e.g. "HP: [#####   ]". Redrawn only when the value, maximum or bar width changes.
+    """
+    def __init__(self, x, y, width, label, bar_colour, back_colour):
+        super().__init__(x, y, width, 1)
+        self.label = label
+        self.bar_colour = bar_colour
+        self.back_colour = back_colour
+
+    def draw(self, buffer, bar_width, current_value, maximum_value):
+        buffer.draw_str(0, 0, self.label, bg=None, fg=colours["white"])
+        render_status_bar(buffer, 4, 0, bar_width, current_value, maximum_value, self.bar_colour, self.back_colour)
+
+
+class VisibleListWidget(Widget):
+    """
+    The "Visible:" list in the right panel - a health bar and name for each monster in view, with the one under the
+    mouse highlighted.
+    """
+    def draw(self, buffer, visible_monsters, hovered):
+        buffer.draw_str(0, 0, "Visible:")
+
+        list_y = 2
+        for entity in visible_monsters:
+            if list_y >= buffer.height:
+                break
+
+            render_status_bar(buffer, 0, list_y, 4, entity.hp, entity.max_hp, colours["light_red"], colours["dark_red"])
+
+            if entity is hovered:
+                buffer.draw_str(5, list_y, entity.name, fg=colours["black"], bg=entity.colour)
+            else:
+                buffer.draw_str(5, list_y, entity.name, fg=entity.colour, bg=None)
+
+            list_y += 1
+
+
+class Hud:
+    """
+    Holds the HUD widgets and the per-turn list of visible monsters they draw from.
+
+    update_visible should be called once per turn, after the FOV has been recomputed - this is the only place the
+    entities are scanned. draw is then cheap enough to call every frame, as each widget only redraws when its own
+    inputs (player stats, the visible monsters and their HP, the hovered monster) have changed.
+    """
+    def __init__(self, hud_width, right_panel_width, right_panel_height):
+        self.name = NameWidget(0, 0, hud_width, 1)
+        self.hp_bar = StatusBarWidget(0, 2, hud_width, "HP:", colours["light_red"], colours["dark_red"])
+        self.arm_bar = StatusBarWidget(0, 3, hud_width, "AR:", colours["light_blue"], colours["dark_blue"])
+        self.mp_bar = StatusBarWidget(0, 4, hud_width, "MP:", colours["light_yellow"], colours["dark_yellow"])
+        self.visible_list = VisibleListWidget(0, 0, right_panel_width, right_panel_height)
+
+        self.visible_monsters = []
+
+        # While show_stats is on, the right panel shows the phase timer readout instead of the visible monsters.
+        self.show_stats = False
+
+    def update_visible(self, player, game_map, entities, view_port_width, view_port_height):
+        view_port = get_view_port_position(player, game_map, view_port_width, view_port_height)
+
+        self.visible_monsters = [entity for entity in entities.get_in_view(game_map.fov, view_port)
+                                 if entity is not player and entity.render_order == RenderOrder.ACTOR]
+
+    def get_hovered(self, player, game_map, view_port_width, view_port_height, mouse_coordinates):
+        view_x1, view_y1, _, _ = get_view_port_position(player, game_map, view_port_width, view_port_height)
+
+        mouse_scr_x, mouse_scr_y = mouse_coordinates
+        mouse_map_x, mouse_map_y = map_from_screen(mouse_scr_x, mouse_scr_y, view_x1, view_y1)
+
+        for entity in self.visible_monsters:
+            if entity.x == mouse_map_x and entity.y == mouse_map_y:
+                return entity
+
+        return None
+
+    def toggle_stats(self):
+        self.show_stats = not self.show_stats
+
+        # The stats readout has been drawn over the visible list, so it needs a full redraw when it comes back.
+        self.visible_list.invalidate()
+
+    def invalidate(self):
+        for widget in (self.name, self.hp_bar, self.arm_bar, self.mp_bar, self.visible_list):
+            widget.invalidate()
+
+    def draw(self, hud_console, right_console, view_port_width, view_port_height, player, game_map, mouse_coordinates):
+        """
+        Update every widget which needs it. Returns True if anything on either panel was redrawn.
+        """
+        bar_width = len(player.name) - 4
+        changed = self.name.update(hud_console, (player.name,), player.name)
+        changed |= self.hp_bar.update(hud_console, (bar_width, player.hp, player.max_hp), bar_width, player.hp, player.max_hp)
+        changed |= self.arm_bar.update(hud_console, (bar_width, player.arm, player.max_arm), bar_width, player.arm, player.max_arm)
+        changed |= self.mp_bar.update(hud_console, (bar_width, player.mp, player.max_mp), bar_width, player.mp, player.max_mp)
+
+        if self.show_stats:
+            draw_stats_panel(right_console, phase_timer)
+            return True
+
+        hovered = self.get_hovered(player, game_map, view_port_width, view_port_height, mouse_coordinates)
+        visible_key = (tuple((entity.id, entity.name, entity.hp, entity.max_hp, entity.colour) for entity in self.visible_monsters),
+                       hovered.id if hovered else None)
+        changed |= self.visible_list.update(right_console, visible_key, self.visible_monsters, hovered)
+
+        return changed
@@ -20,7 +20,17 @@ def handle_keys(user_input):
 
     if user_input.key == 'ESCAPE':
         return {'exit_game': True}
+    elif user_input.key == 'PAGEUP':
+        return {'scroll_log': 1}
+    elif user_input.key == 'PAGEDOWN':
+        return {'scroll_log': -1}
+    elif user_input.key == 'F3':
+        return {'toggle_stats': True}
+    elif user_input.key == 'F4':
+        return {'toggle_profiler': True}
     elif key_char == 'g':
         return {'pickup': True}
+    elif key_char == 'r':
+        return {'rewind': 1}
 
     return {}
@@ -0,0 +1,122 @@
+from functools import lru_cache
+import numpy as np
+from tdl.map import quick_fov
+
+
+class LightSource:
+    """
+    A light carried by an entity (entity.light), e.g. the player's lantern or a torch on the wall.
+
+    ATTRIBUTES:
+        - radius (int): how far the light reaches, in tiles.
+        - colour (tuple): the RGB colour of the light - (255, 255, 255) lights tiles in their own colour.
+        - intensity (float): brightness at the source, 1.0 being full brightness.
+    """
+    def __init__(self, radius, colour=(255, 255, 255), intensity=1.0):
+        self.radius = radius
+        self.colour = colour
+        self.intensity = intensity
+
+
+@lru_cache(maxsize=None)
+def get_falloff_kernel(radius):
+    """
+    A (2 * radius + 1) square array of light strength around a source at the centre: 1.0 at the source, fading
+    (quadratically) to 0 just beyond the radius. Cached per radius, as every source with the same radius shares it.
+    """
+    offsets = np.arange(-radius, radius + 1)
+    distance = np.sqrt(offsets[:, np.newaxis] ** 2 + offsets[np.newaxis, :] ** 2)
+
+    kernel = (np.clip(1.0 - distance / (radius + 1), 0.0, 1.0) ** 2).astype(np.float32)
+    kernel.flags.writeable = False
+
+    return kernel
+
+
+class LightMap:
+    """
+    Composites the light from every registered LightSource into one per-tile light array for the game map, which
+    draw_map multiplies the tile colours by (see GameMap.light_map).
+
+    Each source's contribution is its falloff kernel, masked to the tiles the source can actually see (so light stops
+    at walls and closed doors), tinted by its colour. Contributions are cached per source and only recalculated when
+    the source moves, its light changes, or a door on the map opens (GameMap.door_version). The composite is only
+    rebuilt when at least one contribution has changed.
+
+    ATTRIBUTES:
+        - ambient (float): light level everywhere, before any sources are added. The default of 0.5 keeps tiles in
+          view at least as bright as remembered tiles out of view (which are drawn at half brightness).
+        - light (numpy array - float32, width x height x 3): the composited light, 0.0 to 1.0 per channel.
+    """
+    def __init__(self, game_map, ambient=0.5):
+        self.game_map = game_map
+        self.ambient = ambient
+        self.light = np.full((game_map.width, game_map.height, 3), ambient, dtype=np.float32)
+
+        self.sources = dict()
+        self._contributions = dict()
+        self._composited_keys = None
+
+    def add_source(self, entity):
+        self.sources[entity.id] = entity
+
+    def remove_source(self, entity):
+        self.sources.pop(entity.id, None)
+        self._contributions.pop(entity.id, None)
+
+    def _get_key(self, entity):
+        light = entity.light
+        return entity.x, entity.y, light.radius, light.colour, light.intensity, self.game_map.door_version
+
+    def _compute_contribution(self, entity):
+        """
+        Returns the map region (x1, y1, x2, y2) the source lights and its light array for that region.
+        """
+        game_map = self.game_map
+        radius = entity.light.radius
+
+        kernel_x1, kernel_y1 = entity.x - radius, entity.y - radius
+        x1, y1 = max(kernel_x1, 0), max(kernel_y1, 0)
+        x2, y2 = min(entity.x + radius + 1, game_map.width), min(entity.y + radius + 1, game_map.height)
+
+        kernel = get_falloff_kernel(radius)[x1 - kernel_x1:x2 - kernel_x1, y1 - kernel_y1:y2 - kernel_y1]
+
+        # Only tiles in the source's own field of view are lit. quick_fov asks about every tile of the square around
+        # the source, including any off the edge of the map - those block the light.
+        def is_transparent(x, y):
+            return 0 <= x < game_map.width and 0 <= y < game_map.height and bool(game_map.transparent[x, y])
+
+        visible = np.zeros(kernel.shape, dtype=bool)
+        for x, y in quick_fov(entity.x, entity.y, is_transparent, fov='BASIC', radius=radius, lightWalls=True,
+                              sphere=True):
+            if x1 <= x < x2 and y1 <= y < y2:
+                visible[x - x1, y - y1] = True
+
+        tint = np.asarray(entity.light.colour, dtype=np.float32) / 255 * entity.light.intensity
+        contribution = (kernel * visible)[..., np.newaxis] * tint
+
+        return (x1, y1, x2, y2), contribution
+
+    def update(self):
+        """
+        Bring the light array up to date with the sources - call once per turn, before the map is drawn.
+        """
+        keys = dict()
+
+        for entity_id, entity in self.sources.items():
+            key = self._get_key(entity)
+            keys[entity_id] = key
+
+            cached = self._contributions.get(entity_id)
+            if cached is None or cached[0] != key:
+                self._contributions[entity_id] = (key,) + self._compute_contribution(entity)
+
+        if keys == self._composited_keys:
+            return
+
+        self.light[:] = self.ambient
+        for key, (x1, y1, x2, y2), contribution in self._contributions.values():
+            self.light[x1:x2, y1:y2] += contribution
+
+        np.clip(self.light, 0.0, 1.0, out=self.light)
+        self._composited_keys = keys
@@ -1,6 +1,13 @@
 from tdl.map import Map
 import numpy as np
+import os
 import random
+import time
+import copy
+import threading
+import hashlib
+from contextlib import nullcontext
+import rewind_functions
 from entity_classes import Monster, Pickup
 from render_functions import get_render_char
 from entity_classes import stats
@@ -17,18 +24,29 @@ from entity_templates import monster_manual, item_manual
 # Place button doors.
 
 
-# Set up predictable random number for testing.
+# Set up predictable random number for testing. Nothing is seeded on import - set_seed picks the seed (a random one
+# unless told otherwise) when a level is about to be generated.
 PRNG = random.Random()
-seed = random.randint(1, 1000000)
+seed = None
 
 # # Testing levels
-# seed = 888727
-# seed = 513201
-# seed = 130875
-# seed = 524937
+# set_seed(888727)
+# set_seed(513201)
+# set_seed(130875)
+# set_seed(524937)
 
-PRNG.seed(seed)
-print(seed)
+
+def set_seed(new_seed=None):
+    """
+    Seed the map generator, so the next level generated is the one for new_seed (e.g. to replay a recording). With no
+    seed a random one is picked. Returns the seed.
+    """
+    global seed
+
+    seed = random.randint(1, 1000000) if new_seed is None else new_seed
+    PRNG.seed(seed)
+
+    return seed
 
 
 class GameMap(Map):
@@ -43,7 +61,15 @@ class GameMap(Map):
         - viable_coords (numpy array - bool): a representation of whether this tile is free for initial entity placement
         - is_door (numpy array - bool): refers to whether a given tile is a door, or a switch controlling a door.
         - door (list array - False or Object): a container for Door or Button objects, usually accessed via is_door
-        - r, g, b represent the colour value of each tile.
+        - r, g, b (numpy array - int16) represent the colour value of each tile.
+        - light_rgb / dark_rgb (numpy array - uint8, width x height x 3): the colour of each tile when in and out of
+          FOV. Kept in step with r, g, b by set_tile_colour(s), so the renderer can slice them straight out.
+        - static_layer (StaticLayer): chars and colours for things which will never move again, e.g. corpses.
+        - door_version (int): goes up every time a door is opened (or shut again by a rewind), so anything cached on the
+          layout knows to refresh.
+        - light_map (LightMap or None): dynamic lighting for the map, see lighting_functions. None means no lighting.
+        - tile_chars (numpy array - int32): the auto-tiled char of each tile (see render_functions.get_tile_chars), -1
+          until it has been worked out. Only valid while tile_chars_version matches door_version.
 
     Contains two methods - one to set a particular tile as a door during map creation, and another to allow the player
     to open that door during gameplay (accessed via the engine / main game loop).
@@ -53,48 +79,76 @@ class GameMap(Map):
         - Creates basic numpy arrays with False as default value (explored, viable_coords, is_door)
         - Creates a nested list to store door objects (False by default) as numpy arrays cannot contain objects.
     """
+    # The per-tile arrays open_door changes.
+    DOOR_ARRAYS = ("transparent", "walkable", "r", "g", "b", "light_rgb", "dark_rgb")
+
     def __init__(self, map_width, map_height):
         super().__init__(map_width, map_height)
         self.width = map_width
         self.height = map_height
         self.rooms = []
 
-        self.r = np.array([[250 for y in range(map_height)] for x in range(map_width)])
-        self.g = np.array([[250 for y in range(map_height)] for x in range(map_width)])
-        self.b = np.array([[250 for y in range(map_height)] for x in range(map_width)])
+        self.r = np.full((map_width, map_height), 250, dtype=np.int16)
+        self.g = np.full((map_width, map_height), 250, dtype=np.int16)
+        self.b = np.full((map_width, map_height), 250, dtype=np.int16)
 
-        self.explored = np.array([[False for y in range(map_height)] for x in range(map_width)])
-        self.viable_coords = np.array([[False for y in range(map_height)] for x in range(map_width)])
+        self.light_rgb = np.full((map_width, map_height, 3), 250, dtype=np.uint8)
+        self.dark_rgb = self.light_rgb // 2
 
-        self.is_door = np.array([[False for y in range(map_height)] for x in range(map_width)])
-        self.door = [[False for y in range(map_height)] for x in range(map_width)]
+        self.explored = np.zeros((map_width, map_height), dtype=bool)
+        self.viable_coords = np.zeros((map_width, map_height), dtype=bool)
 
-    # TODO: Doc
-    def save_map_to_file(self, entities_list):
-        filename = str(seed) + ".txt"
-        with open(filename, "w") as file:
-            for y in range(self.height):
-                for x in range(self.width):
-                    door = self.is_door[x, y]
-                    wall = not self.walkable[x, y] and not self.transparent[x, y] and not door
-                    ground = self.walkable[x, y] and self.transparent[x, y] and not door
-
-                    for entity in entities_list:
-                        if entity.x == x and entity.y == y:
-                            door = False
-                            wall = False
-                            ground = False
-                            monster = entity
-
-                    if door:
-                        print("+", end='', file=file)
-                    elif wall:
-                        print("#", end='', file=file)
-                    elif ground:
-                        print(".", end='', file=file)
-                    else:
-                        print(monster.char, end='', file=file)
-                print("", file=file)
+        self.is_door = np.zeros((map_width, map_height), dtype=bool)
+        self.door = [[False] * map_height for x in range(map_width)]
+
+        self.static_layer = StaticLayer(map_width, map_height)
+
+        self.door_version = 0
+        self.light_map = None
+
+        self.tile_chars = np.full((map_width, map_height), -1, dtype=np.int32)
+        self.tile_chars_version = None
+
+    def get_map_text(self, entities_list):
+        """
+        The map as lines of text, one char per tile: "+" for doors, "#" for walls, "." for floor, and an entity's own
+        char wherever one is standing (the last one in entities_list, if several share a tile).
+        """
+        walkable = np.asarray(self.walkable, dtype=bool)
+        transparent = np.asarray(self.transparent, dtype=bool)
+        is_door = np.asarray(self.is_door, dtype=bool)
+
+        chars = np.full((self.width, self.height), " ", dtype="<U1")
+        chars[walkable & transparent] = "."
+        chars[~walkable & ~transparent] = "#"
+        chars[is_door] = "+"
+
+        for entity in entities_list:
+            chars[entity.x, entity.y] = entity.char
+
+        return ["".join(chars[:, y]) for y in range(self.height)]
+
+    def save_map_to_file(self, entities_list, level_seed=None, background=False):
+        """
+        Write the map to <seed>.txt as text (see get_map_text), e.g. for checking a level by eye. The seed is the current
+        map seed unless level_seed is given.
+
+        With background=True the text is built straight away but written to disk on a separate thread, so the game
+        doesn't wait on the file - the thread is returned, for anything which needs to wait for it to finish. The
+        filename is made absolute first, so the file goes in the working directory at the time of the call even if the
+        working directory changes before the thread gets to it.
+        """
+        filename = os.path.abspath(str(seed if level_seed is None else level_seed) + ".txt")
+        text = "\n".join(self.get_map_text(entities_list)) + "\n"
+
+        if not background:
+            _write_text(filename, text)
+            return None
+
+        writer = threading.Thread(target=_write_text, args=(filename, text), name="map-export")
+        writer.start()
+
+        return writer
 
     # TODO: Doc
     def set_tile_colour(self, x, y, colour):
@@ -104,6 +158,23 @@ class GameMap(Map):
         self.g[x, y] = g
         self.b[x, y] = b
 
+        self.light_rgb[x, y] = colour
+        self.dark_rgb[x, y] = (r // 2, g // 2, b // 2)
+
+    def set_tile_colours(self, region, colours):
+        """
+        Bulk version of set_tile_colour.
+
+        :param region: anything which can index the map arrays, e.g. (slice(x1, x2), slice(y1, y2)).
+        :param colours: int array of RGB values, shaped like the region with a final axis of 3.
+        """
+        self.r[region] = colours[..., 0]
+        self.g[region] = colours[..., 1]
+        self.b[region] = colours[..., 2]
+
+        self.light_rgb[region] = colours
+        self.dark_rgb[region] = colours // 2
+
     def set_door(self, x, y, w=1, h=1, secret=False, button=False):
         """
         This method is typically called during map creation, for the purpose of creating a door in the game map.
@@ -217,7 +288,10 @@ class GameMap(Map):
         and triggered by any single tile which makes up that door on the map.
         """
 
+        rewind_functions.journal.touch_tile(self, x, y)
+
         self.door[x][y].is_open = True
+        self.door_version += 1
         self.transparent[x, y] = True
         self.walkable[x, y] = True
         set_tile_colour_light_to_dark(self, x, y)
@@ -236,6 +310,127 @@ class GameMap(Map):
         if self.is_door[x, y + 1] and not self.door[x][y + 1].is_open:
             self.open_door(x, y + 1)
 
+    def snapshot(self):
+        """
+        Take a copy of the map's layout as it stands (tiles, colours, doors and rooms), which restore() can put back
+        later - used by GenerationPipeline to cache the output of each stage.
+        """
+        return MapSnapshot(self)
+
+    def restore(self, snapshot):
+        """
+        Put the layout saved in a MapSnapshot back onto this map. The map must be the same size as the snapshot's.
+        """
+        snapshot.apply(self)
+
+
+class MapSnapshot:
+    """
+    A copy of a GameMap's layout at one moment - the tile arrays, colours, doors and the list of rooms.
+
+    Arrays are copied, and each Door / Button is copied, so changes made to the map afterwards (carving, opening a
+    door) don't leak into the snapshot, and a snapshot can be restored any number of times. Rooms aren't changed once
+    they are created, so the room objects themselves are shared.
+    """
+    ARRAYS = ("transparent", "walkable", "explored", "viable_coords", "is_door", "r", "g", "b", "light_rgb", "dark_rgb")
+
+    def __init__(self, game_map):
+        self.width = game_map.width
+        self.height = game_map.height
+
+        self.arrays = {name: np.array(getattr(game_map, name), copy=True) for name in self.ARRAYS}
+        self.doors = {(x, y): copy.copy(door) for x, column in enumerate(game_map.door)
+                      for y, door in enumerate(column) if door}
+        self.rooms = list(game_map.rooms)
+        self.door_version = game_map.door_version
+
+    @classmethod
+    def from_data(cls, width, height, arrays, doors, rooms=(), door_version=0):
+        """
+        Build a snapshot from saved parts rather than a live map (e.g. a level loaded from the cache).
+
+        :param arrays: dict of array name -> numpy array, for every name in ARRAYS.
+        :param doors: dict of (x, y) -> Door or Button.
+        """
+        snapshot = cls.__new__(cls)
+        snapshot.width = width
+        snapshot.height = height
+        snapshot.arrays = arrays
+        snapshot.doors = doors
+        snapshot.rooms = list(rooms)
+        snapshot.door_version = door_version
+
+        return snapshot
+
+    def apply(self, game_map):
+        if (game_map.width, game_map.height) != (self.width, self.height):
+            raise ValueError("Snapshot is {}x{}, map is {}x{}".format(self.width, self.height, game_map.width, game_map.height))
+
+        for name, array in self.arrays.items():
+            getattr(game_map, name)[:] = array
+
+        game_map.door = [[False for y in range(self.height)] for x in range(self.width)]
+        for (x, y), door in self.doors.items():
+            game_map.door[x][y] = copy.copy(door)
+
+        game_map.rooms = list(self.rooms)
+        game_map.door_version = self.door_version
+
+        # The layout has changed under the auto-tiled chars, whatever door_version says.
+        game_map.tile_chars_version = None
+
+
+def _write_text(filename, text):
+    with open(filename, "w") as file:
+        file.write(text)
+
+
+class StaticLayer:
+    """
+    A per-tile grid of console chars and colours for decorations which sit on the map but never act or move again -
+    at the moment these are the remains of dead monsters.
+
+    Once an entity is stamped into the static layer it is no longer an entity at all as far as the game is concerned;
+    it is drawn along with the map tiles instead of being sorted, cleared and checked every frame with the live ones.
+
+    ATTRIBUTES:
+        - char (numpy array - int): the console char to draw on each tile, 0 where there is nothing.
+        - colour (numpy array - uint8, width x height x 3): the RGB colour of the char on each tile.
+        - names (dict): (x, y) -> name of the decoration on that tile, for anything which wants to describe it.
+        - version (int): goes up every time a decoration is added (or taken off by a rewind), so anything keeping a copy
+          knows to refresh.
+
+    Only one decoration is kept per tile, the most recent one covers anything already there.
+    """
+    def __init__(self, map_width, map_height):
+        self.char = np.zeros((map_width, map_height), dtype=np.int32)
+        self.colour = np.zeros((map_width, map_height, 3), dtype=np.uint8)
+        self.names = dict()
+        self.version = 0
+
+    def add(self, entity):
+        char = entity.char
+        if isinstance(char, str):
+            char = ord(char)
+
+        rewind_functions.journal.touch_static(self, entity.x, entity.y)
+
+        self.char[entity.x, entity.y] = char
+        self.colour[entity.x, entity.y] = entity.colour
+        self.names[(entity.x, entity.y)] = entity.name
+        self.version += 1
+
+    def get_colour(self, x, y):
+        """
+        Returns the light and dark colour of the decoration at x, y, in the same form as get_tile_colour.
+        """
+        light_r, light_g, light_b = (int(channel) for channel in self.colour[x, y])
+
+        light_colour = (light_r, light_g, light_b)
+        dark_colour = (int(light_r / 2), int(light_g / 2), int(light_b / 2))
+
+        return light_colour, dark_colour
+
 
 class Door:
     """
@@ -313,10 +508,8 @@ class Rect:
         self.inside = []
 
     def carve(self, game_map):
-        for y in range(self.y1, self.y2):
-            for x in range(self.x1, self.x2):
-                carve_function(game_map, x, y)
-                self.inside.append((x, y))
+        carve_region(game_map, self.x1, self.y1, self.x2, self.y2)
+        self.inside.extend((x, y) for y in range(self.y1, self.y2) for x in range(self.x1, self.x2))
 
 
 # TODO: doc all functions
@@ -373,6 +566,65 @@ class Room(Rect):
         return w, h
 
 
+class GenerationReport:
+    """
+    Structured stats on one run of dungeon_generator_complex, to find out why a seed is slow to generate. Pass one in
+    as the generator's report argument and it is filled in and returned; without one nothing is counted or timed.
+
+    ATTRIBUTES:
+        - seed: the map seed the level was generated from.
+        - stage_times (dict): wall time in seconds spent in each stage of the GenerationPipeline (rooms, linking,
+          cross_links, doors, junk_cleanup, spawns) and in save_map.
+        - room_attempts (int): candidate rooms tried by create_room, including those thrown away for being out of
+          bounds or overlapping another room.
+        - rooms_accepted (int): rooms actually carved.
+        - corridor_tiles (int): tiles newly made walkable by the corridors and cross links.
+        - junk_door_passes (int): full-map passes made by remove_junk_doors (its recursion depth).
+        - placement_retries (int): random spots rejected by place_entity before a free one was found.
+    """
+    def __init__(self):
+        self.seed = None
+        self.stage_times = dict()
+        self.room_attempts = 0
+        self.rooms_accepted = 0
+        self.corridor_tiles = 0
+        self.junk_door_passes = 0
+        self.placement_retries = 0
+
+    def stage(self, name):
+        return _ReportStage(self, name)
+
+    def to_dict(self):
+        return {"seed": self.seed,
+                "stage_times": dict(self.stage_times),
+                "room_attempts": self.room_attempts,
+                "rooms_accepted": self.rooms_accepted,
+                "corridor_tiles": self.corridor_tiles,
+                "junk_door_passes": self.junk_door_passes,
+                "placement_retries": self.placement_retries}
+
+
+class _ReportStage:
+    """ Adds the time spent inside a with block to one of the report's stage times. """
+    def __init__(self, report, name):
+        self.report = report
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        stage_times = self.report.stage_times
+        stage_times[self.name] = stage_times.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+
+def _no_stage(name):
+    return nullcontext()
+
+
 def get_viable_coordinates(game_map):
     """
     Takes the numpy array in game_map representing viable coordinates, and searches for all "True" value indices (x, y).
@@ -385,7 +637,7 @@ def get_viable_coordinates(game_map):
     return viable_coords
 
 
-def place_entity(game_map, entity, entities_list, room=None):
+def place_entity(game_map, entity, entities_list, room=None, report=None):
     """
     Using a list of viable coordinates from the game map, selects one point at random, and updates the entity's location
     This point is then set to False in GameMap.viable and removed from the viable coords list.
@@ -393,6 +645,7 @@ def place_entity(game_map, entity, entities_list, room=None):
     :param viable_coords: List of viable map coordinates as a tuple i.e. (x, y)
     :param game_map: The GameMap object
     :param entity: The entity to be placed
+    :param report: optional GenerationReport to count placement retries in.
     """
     viable_coords = get_viable_coordinates(game_map)
 
@@ -402,6 +655,8 @@ def place_entity(game_map, entity, entities_list, room=None):
             if place in viable_coords:
                 break
             else:
+                if report:
+                    report.placement_retries += 1
                 continue
     else:
         place = PRNG.choice(viable_coords)
@@ -414,37 +669,173 @@ def place_entity(game_map, entity, entities_list, room=None):
     entities_list.append(entity)
 
 
-def place_monsters(game_map, entities_list, max_number_of_entities, room=None):
+def place_monsters(game_map, entities_list, max_number_of_entities, room=None, report=None):
     for i in range(PRNG.randint(0, max_number_of_entities)):
         monster_name, monster_char, monster_colour, monster_stats = PRNG.choice(monster_manual["level1"])
         monster = Monster(0, 0, monster_name, monster_char, monster_colour, monster_stats)
-        place_entity(game_map, monster, entities_list, room=room)
+        place_entity(game_map, monster, entities_list, room=room, report=report)
 
 
-def place_pickups(game_map, entities_list, max_number_of_entities, room=None):
+def place_pickups(game_map, entities_list, max_number_of_entities, room=None, report=None):
     for i in range(PRNG.randint(0, max_number_of_entities)):
         item_name, item_char, item_colour, item_stats = PRNG.choice(item_manual["level1"])
         item = Pickup(0, 0, item_name, item_char, item_colour, item_stats)
-        place_entity(game_map, item, entities_list, room=room)
+        place_entity(game_map, item, entities_list, room=room, report=report)
 
 
-# TODO: Doc
-def dungeon_generator_complex(game_map, player, entities_list, max_monsters_per_room, max_items_per_room, num_rooms, cross_link_chance, intersect_chance, map_border=3):
-    boundary_x = (map_border, game_map.width - map_border)
-    boundary_y = (map_border, game_map.height - map_border)
+# Bump whenever a change to the generator changes the level it makes from a given seed and parameters, so levels
+# cached by an older version (see cache_functions) aren't used.
+GENERATOR_VERSION = 2
 
-    first_room = create_room(game_map, boundary_x, boundary_y, intersect_chance)
-    player.x, player.y = first_room.center
+# The stages of GenerationPipeline, in order, and the generator parameters each one depends on.
+GENERATION_STAGES = ["rooms", "linking", "cross_links", "doors", "junk_cleanup", "spawns"]
 
-    for i in range(num_rooms - 1):
-        room = create_room(game_map, boundary_x, boundary_y, intersect_chance, square=False)
-        place_monsters(game_map, entities_list, max_monsters_per_room, room=room)
-        place_pickups(game_map, entities_list, max_items_per_room, room=room)
+STAGE_PARAMETERS = {
+    "rooms": ("num_rooms", "intersect_chance", "map_border"),
+    "linking": (),
+    "cross_links": ("cross_link_chance",),
+    "doors": (),
+    "junk_cleanup": ("map_border",),
+    "spawns": ("num_rooms", "max_monsters_per_room", "max_items_per_room"),
+}
+
+
+def derive_seed(level_seed, stage):
+    """
+    The seed for one stage's random number stream, worked out from the level seed and the stage name. Every stage
+    gets its own stream, so re-running a stage always draws the same numbers whatever happened in the stages before.
+    """
+    digest = hashlib.sha256("{}:{}".format(level_seed, stage).encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+class GenerationPipeline:
+    """
+    dungeon_generator_complex split into explicit stages, run in order:
+
+        rooms -> linking -> cross_links -> doors -> junk_cleanup -> spawns
+
+        - rooms: create_room num_rooms times (the first room is where the player starts).
+        - linking: join each room to its closest unlinked neighbour with a corridor.
+        - cross_links: extra corridors between random rooms, to make loops.
+        - doors: a door wherever a corridor breaks through a room's wall.
+        - junk_cleanup: remove_junk_doors.
+        - spawns: place the player, then monsters and items - per room, and then anywhere on the map.
+
+    Each stage re-seeds the map PRNG from derive_seed(seed, stage) before it starts, so its random numbers don't
+    depend on how many the earlier stages used. The map is snapshotted after every stage but the last, and the
+    snapshot is kept along with the parameters which produced it. Generating again after changing only, say,
+    cross_link_chance restores the snapshot from after linking and re-runs the stages from cross_links onwards - the
+    result is exactly what a full run with the new parameters would give.
+
+    Usage:
+        pipeline = GenerationPipeline(seed, num_rooms=15, cross_link_chance=30)
+        pipeline.generate(GameMap(150, 150), player, entities)
+
+        pipeline.set_parameters(max_monsters_per_room=6)
+        pipeline.generate(GameMap(150, 150), player, new_entities)    # only re-runs spawns.
+
+    ATTRIBUTES:
+        - seed: the level seed.
+        - parameters (dict): the generator parameters (see dungeon_generator_complex).
+        - snapshots (dict): stage name -> (cache key, MapSnapshot) for the output of each stage.
+        - stages_run (list): the stages the last generate call actually ran, handy for checking the cache works.
+        - export_thread (Thread or None): the background thread writing the last level's text dump, if any.
+    """
+    def __init__(self, level_seed, num_rooms=15, cross_link_chance=30, intersect_chance=0, max_monsters_per_room=3,
+                 max_items_per_room=2, map_border=3):
+        self.seed = level_seed
+        self.parameters = {"num_rooms": num_rooms, "cross_link_chance": cross_link_chance,
+                           "intersect_chance": intersect_chance, "max_monsters_per_room": max_monsters_per_room,
+                           "max_items_per_room": max_items_per_room, "map_border": map_border}
+
+        self.snapshots = dict()
+        self.stages_run = []
+        self.export_thread = None
+
+    def set_parameters(self, **parameters):
+        for name in parameters:
+            if name not in self.parameters:
+                raise KeyError("Unknown generator parameter: {}".format(name))
+
+        self.parameters.update(parameters)
+
+    def get_stage_key(self, stage, map_width, map_height):
+        """
+        Everything the output of a stage depends on: the seed, the map size, and the parameters of this stage and
+        every stage before it.
+        """
+        key = [self.seed, map_width, map_height]
+
+        for name in GENERATION_STAGES[:GENERATION_STAGES.index(stage) + 1]:
+            key.extend(self.parameters[parameter] for parameter in STAGE_PARAMETERS[name])
+
+        return tuple(key)
+
+    def generate(self, game_map, player, entities_list, report=None, save_map=True):
+        """
+        Generate the level into game_map (a fresh GameMap), re-using the latest cached stage output still valid for the
+        current parameters. Returns the report, if one was given.
+        """
+        stage_timer = report.stage if report else _no_stage
+
+        if report:
+            report.seed = self.seed
+
+        # Find the last stage whose cached output is still good, and start from there.
+        start = 0
+        for index, stage in enumerate(GENERATION_STAGES[:-1]):
+            cached = self.snapshots.get(stage)
+
+            if cached is None or cached[0] != self.get_stage_key(stage, game_map.width, game_map.height):
+                break
+
+            start = index + 1
+
+        if start:
+            game_map.restore(self.snapshots[GENERATION_STAGES[start - 1]][1])
+
+        self.stages_run = GENERATION_STAGES[start:]
+
+        for stage in self.stages_run:
+            PRNG.seed(derive_seed(self.seed, stage))
+
+            with stage_timer(stage):
+                STAGE_FUNCTIONS[stage](game_map, player, entities_list, self.parameters, report)
+
+            if stage != GENERATION_STAGES[-1]:
+                self.snapshots[stage] = (self.get_stage_key(stage, game_map.width, game_map.height), game_map.snapshot())
+
+        # The text dump of the level is written on a background thread, so the first frame doesn't wait for the disk.
+        if save_map:
+            with stage_timer("save_map"):
+                self.export_thread = game_map.save_map_to_file(entities_list, level_seed=self.seed, background=True)
+
+        return report
+
+
+def _get_boundaries(game_map, parameters):
+    map_border = parameters["map_border"]
+    return (map_border, game_map.width - map_border), (map_border, game_map.height - map_border)
+
+
+def generate_rooms(game_map, player, entities_list, parameters, report=None):
+    boundary_x, boundary_y = _get_boundaries(game_map, parameters)
+
+    create_room(game_map, boundary_x, boundary_y, parameters["intersect_chance"], report=report)
+
+    for i in range(parameters["num_rooms"] - 1):
+        create_room(game_map, boundary_x, boundary_y, parameters["intersect_chance"], square=False, report=report)
+
+
+def link_rooms(game_map, player, entities_list, parameters, report=None):
+    if report:
+        walkable_before = np.count_nonzero(game_map.walkable)
 
     rooms_to_link = list(game_map.rooms)
 
-    current_room = first_room
-    for i in range(num_rooms):
+    current_room = game_map.rooms[0]
+    for i in range(parameters["num_rooms"]):
         new_room = get_closest_room(rooms_to_link, current_room)
 
         if not new_room:
@@ -453,7 +844,15 @@ def dungeon_generator_complex(game_map, player, entities_list, max_monsters_per_
             create_corridor(game_map, current_room, new_room)
             current_room = new_room
 
-    number_of_cross_links = int((len(game_map.rooms) * int(cross_link_chance / 10)) / 10)
+    if report:
+        report.corridor_tiles += int(np.count_nonzero(game_map.walkable) - walkable_before)
+
+
+def cross_link_rooms(game_map, player, entities_list, parameters, report=None):
+    if report:
+        walkable_before = np.count_nonzero(game_map.walkable)
+
+    number_of_cross_links = int((len(game_map.rooms) * int(parameters["cross_link_chance"] / 10)) / 10)
 
     for i in range(number_of_cross_links):
         rooms_to_cross_link = list(game_map.rooms)
@@ -464,12 +863,62 @@ def dungeon_generator_complex(game_map, player, entities_list, max_monsters_per_
         new_room = PRNG.choice(rooms_to_cross_link)
         create_corridor(game_map, previous_room, new_room)
 
+    if report:
+        report.corridor_tiles += int(np.count_nonzero(game_map.walkable) - walkable_before)
+
+
+def place_doors(game_map, player, entities_list, parameters, report=None):
     set_doors(game_map)
-    remove_junk_doors(game_map, boundary_x, boundary_y)
-    place_monsters(game_map, entities_list, max_number_of_entities=num_rooms)
-    place_pickups(game_map, entities_list, max_number_of_entities=num_rooms)
 
-    game_map.save_map_to_file(entities_list)
+
+def clean_up_doors(game_map, player, entities_list, parameters, report=None):
+    boundary_x, boundary_y = _get_boundaries(game_map, parameters)
+    remove_junk_doors(game_map, boundary_x, boundary_y, report=report)
+
+
+def spawn_entities(game_map, player, entities_list, parameters, report=None):
+    player.x, player.y = game_map.rooms[0].center
+
+    # No monsters or items in the first room - the player starts there.
+    for room in game_map.rooms[1:]:
+        place_monsters(game_map, entities_list, parameters["max_monsters_per_room"], room=room, report=report)
+        place_pickups(game_map, entities_list, parameters["max_items_per_room"], room=room, report=report)
+
+    place_monsters(game_map, entities_list, max_number_of_entities=parameters["num_rooms"], report=report)
+    place_pickups(game_map, entities_list, max_number_of_entities=parameters["num_rooms"], report=report)
+
+
+STAGE_FUNCTIONS = {
+    "rooms": generate_rooms,
+    "linking": link_rooms,
+    "cross_links": cross_link_rooms,
+    "doors": place_doors,
+    "junk_cleanup": clean_up_doors,
+    "spawns": spawn_entities,
+}
+
+
+def dungeon_generator_complex(game_map, player, entities_list, max_monsters_per_room, max_items_per_room, num_rooms, cross_link_chance, intersect_chance, map_border=3, report=None, save_map=True):
+    """
+    Generate a complete level into game_map: rooms, corridors between them, doors, monsters and items, with the player
+    placed in the centre of the first room. The level is generated from the current map seed (see set_seed), or a
+    random one if no seed has been set yet.
+
+    This runs every stage of a new GenerationPipeline - keep a GenerationPipeline around instead to re-use the earlier
+    stages when only later parameters change.
+
+    :param report: optional GenerationReport - if given it is filled in with stage timings and counts, and returned.
+    :param save_map: write the level to <seed>.txt as well (see GameMap.save_map_to_file).
+    :return: the report, or None.
+    """
+    if seed is None:
+        set_seed()
+
+    pipeline = GenerationPipeline(seed, num_rooms=num_rooms, cross_link_chance=cross_link_chance,
+                                  intersect_chance=intersect_chance, max_monsters_per_room=max_monsters_per_room,
+                                  max_items_per_room=max_items_per_room, map_border=map_border)
+
+    return pipeline.generate(game_map, player, entities_list, report=report, save_map=save_map)
 
 
 # TODO: Doc
@@ -504,9 +953,12 @@ def set_doors(game_map):
 
 
 # TODO: Doc
-def remove_junk_doors(game_map, boundary_x, boundary_y):
+def remove_junk_doors(game_map, boundary_x, boundary_y, report=None):
     change = False
 
+    if report:
+        report.junk_door_passes += 1
+
     for y in range(boundary_y[0], boundary_y[1]):
         for x in range(boundary_x[0], boundary_x[1]):
             if game_map.is_door[x, y]:
@@ -537,7 +989,7 @@ def remove_junk_doors(game_map, boundary_x, boundary_y):
                     change = True
 
     if change:
-        remove_junk_doors(game_map, boundary_x, boundary_y)
+        remove_junk_doors(game_map, boundary_x, boundary_y, report=report)
 
 
 # TODO: Doc
@@ -621,8 +1073,11 @@ def create_corridor(game_map, previous_room, new_room):
 
 
 # TODO: Doc
-def create_room(game_map, boundary_x, boundary_y, intersect_chance, room_x=None, room_y=None, square=True):
+def create_room(game_map, boundary_x, boundary_y, intersect_chance, room_x=None, room_y=None, square=True, report=None):
     while True:
+        if report:
+            report.room_attempts += 1
+
         if not room_x:
             x = PRNG.randint(boundary_x[0], boundary_x[-1])
         else:
@@ -644,6 +1099,9 @@ def create_room(game_map, boundary_x, boundary_y, intersect_chance, room_x=None,
                 else:
                     break
 
+    if report:
+        report.rooms_accepted += 1
+
     game_map.rooms.append(room)
     room.carve(game_map)
     return room
@@ -686,16 +1144,12 @@ def room_collides(game_map, new_room):
 
 # TODO: Doc
 def create_h_tunnel(game_map, x1, x2, y, h):
-    for y in range(y, y + h):
-        for x in range(min(x1, x2), max(x1, x2) + h):
-            carve_function(game_map, x, y)
+    carve_region(game_map, min(x1, x2), y, max(x1, x2) + h, y + h)
 
 
 # TODO: Doc
 def create_v_tunnel(game_map, y1, y2, x, w):
-    for x in range(x, x + w):
-        for y in range(min(y1, y2), max(y1, y2) + w):
-            carve_function(game_map, x, y)
+    carve_region(game_map, x, min(y1, y2), x + w, max(y1, y2) + w, columns_first=True)
 
 
 # TODO: Doc
@@ -709,6 +1163,41 @@ def carve_function(game_map, x, y):
     game_map.set_tile_colour(x, y, (r, g, b))
 
 
+def carve_region(game_map, x1, y1, x2, y2, columns_first=False):
+    """
+    Carve every tile in the rectangle x1 <= x < x2, y1 <= y < y2 - the bulk equivalent of calling carve_function on
+    each tile, with the map arrays and tile colours set as whole slices.
+
+    The colour variance is still drawn from the PRNG once per tile and in the same order the tile by tile loops used
+    (row by row, or column by column for vertical tunnels), so a given seed still produces exactly the same map.
+    """
+    width = x2 - x1
+    height = y2 - y1
+
+    if width <= 0 or height <= 0:
+        return
+
+    region = (slice(x1, x2), slice(y1, y2))
+
+    game_map.transparent[region] = True
+    game_map.walkable[region] = True
+    game_map.viable_coords[region] = True
+    game_map.is_door[region] = False
+
+    for x in range(x1, x2):
+        game_map.door[x][y1:y2] = [False] * height
+
+    variance = np.array([PRNG.randint(-25, 25) for i in range(width * height)], dtype=np.int64)
+
+    if columns_first:
+        variance = variance.reshape(width, height)
+    else:
+        variance = variance.reshape(height, width).T
+
+    colours = np.repeat((150 + variance)[..., np.newaxis], 3, axis=2)
+    game_map.set_tile_colours(region, colours)
+
+
 # TODO: Doc
 def set_tile_colour_light_to_dark(game_map, x, y):
     new_r = int(game_map.r[x, y] * 0.6)
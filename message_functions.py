@@ -1,31 +1,167 @@
 import textwrap
 
 
-# TODO: Doc
 class Message:
-    def __init__(self, text, colour=(255, 255, 255)):
-        self.text = text
+    """
+    A single line (or more, once wrapped) of text for the message log, drawn in the given colour.
+
+    The text can be a format string, with the values to fill in passed as extra args. Formatting is put off until
+    something actually reads message.text, so a message which is never displayed never pays for str.format.
+    The wrapped lines are cached the same way, for the last width they were wrapped to.
+    """
+    def __init__(self, text, colour=(255, 255, 255), *args):
+        self._text = text
+        self.args = args
         self.colour = colour
+        self._wrap_width = None
+        self._wrap_lines = None
+
+    @property
+    def text(self):
+        if self.args:
+            self._text = self._text.format(*self.args)
+            self.args = ()
+
+        return self._text
+
+    def wrap(self, width):
+        if width != self._wrap_width:
+            self._wrap_lines = textwrap.wrap(self.text, width)
+            self._wrap_width = width
+
+        return self._wrap_lines
 
 
-# TODO: Doc
 class MessageLog:
-    def __init__(self, x, y, width, height):
-        self.messages = []
+    """
+    Stores the game messages for the message log panel.
+
+    Messages are kept whole (unwrapped and unformatted) in a fixed size ring buffer, so adding one is constant time
+    and the log never holds more than `capacity` of them no matter how long the game runs. The oldest message is
+    overwritten once the buffer is full.
+
+    Only the lines which are actually on screen get formatted and wrapped, and only once per message (see Message).
+
+    ATTRIBUTES:
+        - x, y (int): where the log is drawn on the message console.
+        - width, height (int): the size of the log panel in console cells, i.e. line length and number of lines shown.
+        - capacity (int): how many messages are kept for scrollback.
+        - scroll_offset (int): how many wrapped lines back from the newest the view currently ends. 0 is the bottom.
+        - version (int): bumped every time the visible lines could have changed, so the renderer can skip redraws.
+        - added (int): how many messages have ever been added, including any since overwritten - so anything keeping
+          up with the log (e.g. a save) can tell how many are new.
+
+    INIT:
+        - greeting: the text of the first message in the log. None starts the log empty (e.g. one to be filled with
+          messages from elsewhere).
+    """
+    def __init__(self, x, y, width, height, capacity=2000, greeting="Where am I? I have to get out of here..."):
         self.x = x
         self.y = y
         self.width = width
         self.height = height
-        self.add_message(Message("Where am I? I have to get out of here..."))
+        self.capacity = capacity
+
+        self._buffer = [None] * capacity
+        self._start = 0
+        self._count = 0
+
+        self.scroll_offset = 0
+        self.version = 0
+        self.drawn_version = -1
+        self.added = 0
+
+        if greeting is not None:
+            self.add_message(Message(greeting))
+
+    def __len__(self):
+        return self._count
 
     def add_message(self, message):
-        # split the messages across lines using text wrap
-        new_message_lines = textwrap.wrap(message.text, self.width)
+        if self._count < self.capacity:
+            self._buffer[(self._start + self._count) % self.capacity] = message
+            self._count += 1
+        else:
+            # Buffer is full, overwrite the oldest message and move the start along.
+            self._buffer[self._start] = message
+            self._start = (self._start + 1) % self.capacity
+
+        # New messages always snap the view back to the latest lines.
+        self.scroll_offset = 0
+        self.version += 1
+        self.added += 1
+
+    def clear(self):
+        """
+        Remove every message, e.g. before putting back the messages from a saved game.
+        """
+        self._buffer = [None] * self.capacity
+        self._start = 0
+        self._count = 0
+        self.scroll_offset = 0
+        self.version += 1
+
+    def scroll(self, lines):
+        """
+        Scroll the view by a number of lines - positive goes back in time, negative towards the newest messages.
+        """
+        new_offset = max(0, self.scroll_offset + lines)
+        newest_lines = self._get_lines_from_end(new_offset + self.height)
+        new_offset = min(new_offset, max(0, len(newest_lines) - self.height))
+
+        if new_offset != self.scroll_offset:
+            self.scroll_offset = new_offset
+            self.version += 1
+
+    def iter_messages(self):
+        """
+        Generator over the stored messages, newest first.
+        """
+        for i in range(self._count - 1, -1, -1):
+            yield self._buffer[(self._start + i) % self.capacity]
+
+    def get_newest(self, number):
+        """
+        The newest number messages (or all of them, if fewer are stored), oldest first.
+        """
+        newest = []
+
+        for message in self.iter_messages():
+            if len(newest) >= number:
+                break
+
+            newest.append(message)
+
+        newest.reverse()
+        return newest
+
+    def _get_lines_from_end(self, number_of_lines):
+        """
+        Wrap messages from the newest backwards until there are number_of_lines lines (or the messages run out).
+        Returns a list of (text, colour) tuples, oldest first.
+        """
+        lines = []
+
+        for message in self.iter_messages():
+            for line in reversed(message.wrap(self.width)):
+                lines.append((line, message.colour))
+
+            if len(lines) >= number_of_lines:
+                break
+
+        lines.reverse()
+        return lines[-number_of_lines:]
+
+    def get_visible_lines(self):
+        """
+        Returns the (text, colour) lines which should currently be on screen, oldest first.
+        """
+        lines = self._get_lines_from_end(self.scroll_offset + self.height)
+        return lines[:self.height]
 
-        for line in new_message_lines:
-            # if the buffer is full, remove the first message to make room for the new one
-            if len(self.messages) == self.height:
-                del self.messages[0]
+    @property
+    def needs_redraw(self):
+        return self.version != self.drawn_version
 
-            # add the new message line as Message object
-            self.messages.append(Message(line, message.colour))
+    def mark_drawn(self):
+        self.drawn_version = self.version
@@ -0,0 +1,238 @@
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+from config import colours
+
+
+class _NullPhase:
+    """ Stand-in context manager handed out while timing is disabled - does nothing at all. """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    """
+    Times one named phase. One of these is created per phase name and then re-used, so timing a phase doesn't
+    allocate anything. Phases with different names can be nested, but a phase can't be nested inside itself.
+    """
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timer.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class PhaseTimer:
+    """
+    Collects how long each phase of the main loop and render pipeline takes (FOV, draw_map, the enemy turn etc).
+
+    Usage:
+        with phase_timer.phase("draw_map"):
+            draw_map(...)
+
+    The last `window` samples of each phase are kept, and rolling percentiles are worked out from them on request.
+    While disabled, phase() returns a shared do-nothing context manager, so the instrumentation can stay in place.
+
+    Phases are recorded from both the simulation thread and the render loop (see snapshot_functions), so the samples
+    are only touched under a lock - read them through get_stats / get_summary rather than from samples directly.
+    """
+    def __init__(self, enabled=False, window=1000):
+        self.enabled = enabled
+        self.window = window
+        self.samples = dict()
+        self._phases = dict()
+        self._lock = threading.Lock()
+
+    def phase(self, name):
+        if not self.enabled:
+            return _NULL_PHASE
+
+        phase = self._phases.get(name)
+        if phase is None:
+            phase = self._phases[name] = _Phase(self, name)
+
+        return phase
+
+    def record(self, name, seconds):
+        with self._lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=self.window)
+
+            samples.append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+
+    def get_stats(self, name):
+        """
+        Rolling stats for one phase, in milliseconds: count, mean, p50, p95, p99 and max.
+        """
+        with self._lock:
+            samples = tuple(self.samples.get(name, ()))
+
+        return self._get_stats(samples)
+
+    def get_summary(self):
+        """
+        get_stats for every phase recorded so far, as a dict of phase name -> stats.
+        """
+        with self._lock:
+            all_samples = {name: tuple(samples) for name, samples in self.samples.items()}
+
+        return {name: self._get_stats(samples) for name, samples in all_samples.items()}
+
+    @staticmethod
+    def _get_stats(samples):
+        samples = np.array(samples, dtype=np.float64) * 1000
+
+        if not len(samples):
+            return {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+
+        return {"count": len(samples), "mean": float(samples.mean()),
+                "p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(samples.max())}
+
+    def export(self, filename):
+        """
+        Write the stats for every phase to a .csv or .json file, chosen by the file extension.
+        """
+        import csv
+        import json
+
+        summary = self.get_summary()
+
+        if filename.endswith(".csv"):
+            with open(filename, "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(["phase", "count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"])
+
+                for name, stats in summary.items():
+                    writer.writerow([name, stats["count"], stats["mean"], stats["p50"], stats["p95"], stats["p99"], stats["max"]])
+        else:
+            with open(filename, "w") as file:
+                json.dump(summary, file, indent=2)
+
+
+# The timer used by the engine and render functions. Disabled until the engine switches it on.
+phase_timer = PhaseTimer()
+
+
+class Profiler:
+    """
+    Starts and stops cProfile and tracemalloc around a slice of play, so one heavy fight (say) can be profiled in a
+    real session without restarting the game or wrapping main() by hand.
+
+    Each stop() writes two files to the output directory, both named with the map seed and the time profiling started:
+        - profile_<seed>_<time>.prof: the cProfile stats, for pstats / snakeviz.
+        - memory_<seed>_<time>.snapshot: the tracemalloc snapshot, for tracemalloc.Snapshot.load().
+
+    ATTRIBUTES:
+        - seed: the map seed, used to tag the output files so a profile can be matched to the level it came from.
+        - output_dir (str): where the files are written.
+        - running (bool): True between start() and stop().
+    """
+    def __init__(self, seed, output_dir="."):
+        self.seed = seed
+        self.output_dir = output_dir
+
+        self.running = False
+        self.profile = None
+        self.started = None
+        self._owns_tracemalloc = False
+
+    def start(self):
+        # Only imported when profiling is actually used, to keep them off the start up path.
+        import cProfile
+        import tracemalloc
+
+        if self.running:
+            return
+
+        self.started = time.strftime("%Y%m%d-%H%M%S")
+        self.profile = cProfile.Profile()
+
+        # tracemalloc may already be tracing (e.g. python -X tracemalloc) - if so leave it running when we stop.
+        self._owns_tracemalloc = not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start()
+
+        self.profile.enable()
+        self.running = True
+
+    def stop(self):
+        """
+        Stop profiling and write the files. Returns the (profile, snapshot) filenames, or None if it wasn't running.
+        """
+        if not self.running:
+            return None
+
+        import tracemalloc
+
+        self.profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = "{}_{}".format(self.seed, self.started)
+        profile_filename = os.path.join(self.output_dir, "profile_{}.prof".format(name))
+        snapshot_filename = os.path.join(self.output_dir, "memory_{}.snapshot".format(name))
+
+        self.profile.dump_stats(profile_filename)
+        snapshot.dump(snapshot_filename)
+
+        self.profile = None
+        self.running = False
+
+        return profile_filename, snapshot_filename
+
+    def toggle(self):
+        """
+        Start profiling if stopped, or stop it and write the files if running. Returns the filenames written, if any.
+        """
+        if self.running:
+            return self.stop()
+
+        self.start()
+        return None
+
+
+def draw_stats_panel(panel, timer):
+    """
+    Draw a live p50/p95/p99 (ms) readout of each phase onto a panel console - used in place of the right panel's
+    visible monster list while the stats overlay is switched on.
+    """
+    panel.clear()
+    panel.draw_str(0, 0, "ms p50/95/99")
+
+    # One copy of every phase's stats, taken under the timer's lock, as the simulation thread may be recording.
+    summary = timer.get_summary()
+
+    y = 2
+    for name in sorted(summary):
+        if y + 1 >= panel.height:
+            break
+
+        stats = summary[name]
+        panel.draw_str(0, y, name[:panel.width], fg=colours["white"])
+        panel.draw_str(1, y + 1, "{:.1f}/{:.1f}/{:.1f}".format(stats["p50"], stats["p95"], stats["p99"]), fg=colours["light_green"])
+        y += 2
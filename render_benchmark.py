@@ -0,0 +1,167 @@
+import sys
+import time
+import numpy as np
+import map_functions
+from map_functions import GameMap, carve_region
+from entity_classes import Monster, Player, EntityList, stats
+from entity_templates import monster_manual
+from render_functions import (get_render_char, draw_map, draw_entities, draw_hud, update_game_display, clear_all,
+                              get_view_port_position)
+from render_targets import make_consoles
+from hud_functions import Hud
+from engine import get_screen_layout
+from benchmark_functions import median, run_cli
+
+
+SEED = 4242
+MAP_SIZE = 200
+REPEATS = 20
+
+
+def build_state(state, view_port_size, seed=SEED):
+    """
+    Build a synthetic game map, player and entities for one of the benchmark states, without running the generator:
+
+        - wall_dense: a lattice of one tile corridors between 3 x 3 blocks of wall, so most of the view is walls
+          needing auto-tiled chars.
+        - open_cave: one big open area with scattered 3 x 3 pillars.
+        - crowded: the open cave with 500 monsters around the player, all in view.
+        - explored: the wall lattice with the whole map already explored, so the view is full of remembered tiles.
+
+    The player is always in the middle of the map. Everything is drawn from the given seed, so the same state is built
+    every time.
+    """
+    map_functions.set_seed(seed)
+    rng = np.random.default_rng(seed)
+
+    game_map = GameMap(MAP_SIZE, MAP_SIZE)
+    centre = MAP_SIZE // 2
+
+    player = Player(centre, centre, "Bench", "@", (255, 255, 255), stats(hp=200, arm=50, mp=25, str=4, dex=2))
+    entities = EntityList([player])
+    fov_radius = 10
+
+    if state in ("wall_dense", "explored"):
+        for i in range(1, MAP_SIZE - 1, 4):
+            carve_region(game_map, i, 1, i + 1, MAP_SIZE - 1)
+            carve_region(game_map, 1, i, MAP_SIZE - 1, i + 1)
+
+        # Make sure the player is standing on a floor tile.
+        carve_region(game_map, centre, centre, centre + 1, centre + 1)
+
+    else:
+        carve_region(game_map, 1, 1, MAP_SIZE - 1, MAP_SIZE - 1)
+
+        pillars = np.zeros((MAP_SIZE, MAP_SIZE), dtype=bool)
+        for x in range(4, MAP_SIZE - 6, 6):
+            for y in range(4, MAP_SIZE - 6, 6):
+                if rng.random() < 0.3:
+                    pillars[x:x + 3, y:y + 3] = True
+
+        pillars[centre - 1:centre + 2, centre - 1:centre + 2] = False
+        game_map.walkable[pillars] = False
+        game_map.transparent[pillars] = False
+
+    if state == "crowded":
+        fov_radius = view_port_size
+
+        half = view_port_size // 2
+        floor_x, floor_y = np.nonzero(game_map.walkable[centre - half:centre + half, centre - half:centre + half])
+        chosen = rng.choice(len(floor_x), size=min(500, len(floor_x) - 1), replace=False)
+        templates = monster_manual["level1"]
+
+        for index in chosen:
+            x, y = int(floor_x[index]) + centre - half, int(floor_y[index]) + centre - half
+            if (x, y) == (centre, centre):
+                continue
+
+            name, char, colour, monster_stats = templates[int(rng.integers(len(templates)))]
+            entities.append(Monster(x, y, name, char, colour, monster_stats))
+
+    if state == "explored":
+        game_map.explored[:] = True
+
+    game_map.compute_fov(player.x, player.y, fov="BASIC", radius=fov_radius, light_walls=True, sphere=True)
+
+    return game_map, player, entities
+
+
+def time_call(function, repeats=REPEATS, setup=None):
+    """ Median wall time of function() over repeats calls, in ms. setup() is called (untimed) before each one. """
+    samples = []
+
+    for i in range(repeats):
+        if setup is not None:
+            setup()
+
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+
+    return median(samples) * 1000
+
+
+def benchmark_state(state, view_port_size):
+    """
+    Time each render function for one state against headless consoles, returning {function name: median ms}.
+    """
+    game_map, player, entities = build_state(state, view_port_size)
+
+    screen_layout = get_screen_layout(MAP_SIZE, MAP_SIZE, view_port_size, view_port_size)
+    root_console, view_port_console, map_console, message_console, hud_console, right_console = make_consoles(screen_layout, headless=True)
+    hud = Hud(screen_layout["hud"][0], *screen_layout["right"])
+
+    view_port_x1, view_port_y1, view_port_x2, view_port_y2 = get_view_port_position(player, game_map, view_port_size, view_port_size)
+
+    def render_chars():
+        for x in range(view_port_x1, view_port_x2):
+            for y in range(view_port_y1, view_port_y2):
+                get_render_char(game_map, x, y)
+
+    def render_entities():
+        clear_all(map_console, draw_entities(game_map, map_console, entities, player, view_port_size, view_port_size))
+
+    def render_map():
+        draw_map(game_map, map_console, player, view_port_size, view_port_size)
+
+    def clear_tile_chars():
+        # Forget the auto-tiled chars (see render_functions.get_tile_chars), as after a door opens.
+        game_map.tile_chars_version = None
+
+    def render_hud():
+        # Cold: every widget redraws, as on the turn the monsters in view change.
+        hud.invalidate()
+        hud.update_visible(player, game_map, entities, view_port_size, view_port_size)
+        draw_hud(hud, hud_console, right_console, view_port_size, view_port_size, player, game_map, (0, 0))
+
+    return {
+        "get_render_char": time_call(render_chars),
+        # Cold, every tile in view is auto-tiled again - warm, the chars all come from game_map.tile_chars.
+        "draw_map": time_call(render_map, setup=clear_tile_chars),
+        "draw_map_warm": time_call(render_map),
+        "draw_entities": time_call(render_entities),
+        "draw_hud": time_call(render_hud),
+        "update_game_display": time_call(lambda: update_game_display(game_map, player, root_console, view_port_console,
+                                                                     map_console, view_port_size, view_port_size)),
+    }
+
+
+def run_suite(quick=False):
+    """
+    Run every state at each view port size, and return {case name: {render function: median ms}}.
+    """
+    view_port_sizes = [30] if quick else [30, 60, 100]
+    results = dict()
+
+    for state in ["wall_dense", "open_cave", "crowded", "explored"]:
+        for view_port_size in view_port_sizes:
+            name = "{}_{}".format(state, view_port_size)
+            results[name] = benchmark_state(state, view_port_size)
+            print(name, file=sys.stderr)
+
+    return results
+
+
+if __name__ == "__main__":
+    # Usage: python render_benchmark.py [--quick] [--save baseline.json] [--compare baseline.json]
+    run_cli(run_suite, sys.argv)
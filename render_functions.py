@@ -1,8 +1,10 @@
 from enum import Enum
-import tdl
 import numpy as np
 from config import colours
 from game_states import GameStates
+from render_targets import flush, char_code
+from message_functions import Message
+from perf_functions import phase_timer
 
 
 class RenderOrder(Enum):
@@ -14,7 +16,7 @@ class RenderOrder(Enum):
     ACTOR = 3
 
 
-def render_all(game_map, all_consoles, player, entities, fov_recompute, screen_layout, message_log, mouse_coordinates):
+def render_all(game_map, all_consoles, player, entities, fov_recompute, screen_layout, message_log, mouse_coordinates, hud):
     """
     Draw all game elements on screen. This function is called from the engine every frame.
     This actually just calls the individual functions to draw the map, game entities, and other HUD elements.
@@ -25,6 +27,10 @@ def render_all(game_map, all_consoles, player, entities, fov_recompute, screen_l
         - root console (where the view port and later the HUD panel consoles will be drawn.
 
     The root console is the only one actually drawn to the screen.
+
+    All of the consoles are off-screen FrameBuffers (see render_targets.make_consoles), so nothing here needs a window.
+    The finished frame is presented once at the end with flush, which only sends the cells that changed to the window
+    (if there is one) and can be read back from the root console with get_frame.
     """
 
     # Unpack all consoles.
@@ -36,61 +42,115 @@ def render_all(game_map, all_consoles, player, entities, fov_recompute, screen_l
     hud_width, hud_height = screen_layout["hud"]
     right_con_width, right_con_height = screen_layout["right"]
 
-    # Re-draw HUD regardless of FOV Recompute
-    draw_hud(hud_console, right_console, view_port_width, view_port_height, player, game_map, entities, mouse_coordinates)
+    # Each step is timed by the phase timer (see perf_functions) - this does nothing unless timing is switched on.
+    with phase_timer.phase("hud"):
+        # The visible monster list only changes when a turn has been taken, so only query the entities then.
+        if fov_recompute:
+            hud.update_visible(player, game_map, entities, view_port_width, view_port_height)
 
-    update_hud(root_console, hud_console, right_console, hud_width, hud_height, right_con_width, right_con_height)
+        # The HUD widgets each redraw only if their own inputs changed, and the panels are only copied if one did.
+        if draw_hud(hud, hud_console, right_console, view_port_width, view_port_height, player, game_map, mouse_coordinates):
+            update_hud(root_console, hud_console, right_console, hud_width, hud_height, right_con_width, right_con_height)
 
     # Re-draw in-game graphics only if the fov recompute trigger has been set.
     if fov_recompute:
-        draw_map(game_map, map_console, player, view_port_width, view_port_height)  # Draw the map
-        draw_entities(game_map, map_console, entities)  # Draw the game entities
-        draw_message_log(message_console, message_log)  # Draw the message lo
+        if game_map.light_map is not None:
+            with phase_timer.phase("lighting"):
+                game_map.light_map.update()  # Only recomposites if a light moved or a door opened.
+
+        with phase_timer.phase("draw_map"):
+            draw_map(game_map, map_console, player, view_port_width, view_port_height)  # Draw the map
+
+        with phase_timer.phase("draw_entities"):
+            drawn_entities = draw_entities(game_map, map_console, entities, player, view_port_width, view_port_height)
 
         # Update the root console
-        update_game_display(game_map, player,
-                       root_console, view_port_console, map_console, message_console,
-                       view_port_width, view_port_height, message_log_width, message_log_height)
+        with phase_timer.phase("blit"):
+            update_game_display(game_map, player, root_console, view_port_console, map_console,
+                                view_port_width, view_port_height)
+
+        # Clear the entities just drawn from the map console ready for update next frame.
+        clear_all(map_console, drawn_entities)
 
-    # Clear entities from the map console ready for update next frame.
-    clear_all(map_console, entities)
+    # The message log only changes when a message arrives or the player scrolls it, so only redraw it then.
+    if message_log.needs_redraw:
+        with phase_timer.phase("message_log"):
+            draw_message_log(message_console, message_log)
+            update_message_display(root_console, message_console, message_log_width, message_log_height)
+            message_log.mark_drawn()
 
+    # Present the finished frame - once, after everything has been drawn.
+    with phase_timer.phase("flush"):
+        flush(root_console)
 
-def draw_hud(hud_console, right_console, view_port_width, view_port_height, player, game_map, entities, mouse_coordinates):
-    # Top HUD
-    hud_console.draw_str(0, 0, player.name, bg=None, fg=colours["white"])
-    hud_console.draw_str(0, 2, "HP:", bg=None, fg=colours["white"])
-    render_status_bar(hud_console, 4, 2, len(player.name)-4, player.hp, player.max_hp, colours["light_red"], colours["dark_red"])
-    hud_console.draw_str(0, 3, "AR:", bg=None, fg=colours["white"])
-    render_status_bar(hud_console, 4, 3, len(player.name)-4, player.arm, player.max_arm, colours["light_blue"], colours["dark_blue"])
-    hud_console.draw_str(0, 4, "MP:", bg=None, fg=colours["white"])
-    render_status_bar(hud_console, 4, 4, len(player.name)-4, player.mp, player.max_mp, colours["light_yellow"], colours["dark_yellow"])
 
-    # RIGHT HUD
-    view_x1, view_y1, view_x2, view_y2 = get_view_port_position(player, game_map, view_port_width, view_port_height)
+def render_snapshot(snapshot, all_consoles, new_snapshot, screen_layout, message_log, mouse_coordinates, hud):
+    """
+    Draw a frame from a TurnSnapshot (see snapshot_functions) rather than from the live game - the same frame
+    render_all draws, but this reads nothing the simulation thread could be changing while it draws.
 
-    mouse_scr_x, mouse_scr_y = mouse_coordinates
-    mouse_map_x, mouse_map_y = map_from_screen(mouse_scr_x, mouse_scr_y, view_x1, view_y1)
+    :param new_snapshot: True the first time this snapshot is drawn - the map and entities are only redrawn then, and
+                         its messages only added to the message log then.
+    :param message_log: the render loop's own MessageLog, which the snapshots' messages are added to.
+    """
 
-    list_y = 2
-    right_console.draw_str(0, 0, "Visible:")
-    for entity in entities:
-        draw = False
+    # Unpack all consoles.
+    root_console, view_port_console, map_console, message_console, hud_console, right_console = all_consoles
+
+    # Unpack screen layout
+    view_port_width, view_port_height = screen_layout["view_port"]
+    message_log_width, message_log_height = screen_layout["message_log"]
+    hud_width, hud_height = screen_layout["hud"]
+    right_con_width, right_con_height = screen_layout["right"]
 
-        if not entity.id == player.id:
-            if "remains" not in entity.name.lower():
+    player = snapshot.player
 
-                if entity.render_order == RenderOrder.ACTOR:
-                    if game_map.fov[entity.x, entity.y]:
-                        render_status_bar(right_console, 0, list_y, 4, entity.hp, entity.max_hp, colours["light_red"], colours["dark_red"])
+    if new_snapshot:
+        hud.visible_monsters = snapshot.visible_monsters
 
-                        if mouse_map_x == entity.x and mouse_map_y == entity.y:
-                            right_console.draw_str(5, list_y, entity.name, fg=colours["black"], bg=entity.colour)
-                        else:
-                            right_console.draw_str(5, list_y, entity.name, fg=entity.colour, bg=None)
-                        draw = True
-        if draw:
-            list_y += 1
+        for text, colour in snapshot.messages:
+            message_log.add_message(Message(text, colour))
+
+    # The snapshot has the map's width and height, so it stands in for the game map here.
+    with phase_timer.phase("hud"):
+        if draw_hud(hud, hud_console, right_console, view_port_width, view_port_height, player, snapshot, mouse_coordinates):
+            update_hud(root_console, hud_console, right_console, hud_width, hud_height, right_con_width, right_con_height)
+
+    if new_snapshot:
+        with phase_timer.phase("draw_map"):
+            view_port_x1, view_port_y1, _, _ = snapshot.view_port
+            map_console.draw_array(view_port_x1, view_port_y1, snapshot.chars, fg=snapshot.fg, mask=snapshot.to_draw)
+
+        with phase_timer.phase("draw_entities"):
+            for x, y, char, colour in snapshot.entities:
+                map_console.draw_char(x, y, char, colour, bg=None)
+
+        with phase_timer.phase("blit"):
+            update_game_display(snapshot, player, root_console, view_port_console, map_console,
+                                view_port_width, view_port_height)
+
+        # Clear the entities just drawn from the map console ready for update next frame.
+        for x, y, char, colour in snapshot.entities:
+            map_console.draw_char(x, y, ' ', colour, bg=None)
+
+    if message_log.needs_redraw:
+        with phase_timer.phase("message_log"):
+            draw_message_log(message_console, message_log)
+            update_message_display(root_console, message_console, message_log_width, message_log_height)
+            message_log.mark_drawn()
+
+    with phase_timer.phase("flush"):
+        flush(root_console)
+
+
+def draw_hud(hud, hud_console, right_console, view_port_width, view_port_height, player, game_map, mouse_coordinates):
+    """
+    Draw the top HUD (player name and status bars) and the right panel (visible monsters) via the Hud's cached widgets.
+
+    :param hud: The Hud object (see hud_functions) holding the widgets and the visible monsters for this turn.
+    :return: True if anything on either panel was redrawn.
+    """
+    return hud.draw(hud_console, right_console, view_port_width, view_port_height, player, game_map, mouse_coordinates)
 
 
 def draw_message_log(message_console, message_log):
@@ -98,10 +158,12 @@ def draw_message_log(message_console, message_log):
     :param message_console: The console used to display the message log on screen.
     :param message_log: The message_log object which stores the individual message objects to be drawn.
     """
+    message_console.clear()
+
     # Print the game messages, one line at a time
     y = message_log.y
-    for message in message_log.messages:
-        message_console.draw_str(message_log.x, y, message.text, bg=None, fg=message.colour)
+    for text, colour in message_log.get_visible_lines():
+        message_console.draw_str(message_log.x, y, text, bg=None, fg=colour)
         y += 1
 
 
@@ -306,10 +368,36 @@ def get_render_char(game_map, x, y):
         return 176
 
 
+def get_tile_chars(game_map, view, needed):
+    """
+    The auto-tiled chars (see get_render_char) of the tiles in a region of the map, as an int32 array. Only the tiles
+    marked in needed are sure to be filled in - the rest may be -1.
+
+    A tile's char only depends on the layout around it, which only changes when a door opens, so each char is worked
+    out once and kept in game_map.tile_chars until door_version moves on. A frame only calls get_render_char for tiles
+    it hasn't seen before, rather than every tile in view.
+
+    :param view: (x slice, y slice) of the region.
+    :param needed: bool array the shape of the region, True for each tile whose char is wanted.
+    """
+    if game_map.tile_chars_version != game_map.door_version:
+        game_map.tile_chars[:] = -1
+        game_map.tile_chars_version = game_map.door_version
+
+    tile_chars = game_map.tile_chars[view]
+    x_offset, y_offset = view[0].start, view[1].start
+
+    for x, y in zip(*np.nonzero(needed & (tile_chars < 0))):
+        tile_chars[x, y] = char_code(get_render_char(game_map, int(x) + x_offset, int(y) + y_offset))
+
+    return tile_chars
+
+
 def draw_map(game_map, map_console, player, view_port_width, view_port_height):
     """
-    A function to render the map on screen. Iterates through the game_map tiles taking player FOV into account and
-    draws the contents to the map console which will later be passed to the root console via another function.
+    A function to render the map on screen. Takes the slice of the game_map tiles under the view port, taking player
+    FOV into account, and draws it to the map console which will later be passed to the root console via another
+    function.
 
     :param game_map: The game map object.
     :param map_console: This console ONLY draws the map, a portion of this console is blitted based on current view_port
@@ -317,59 +405,84 @@ def draw_map(game_map, map_console, player, view_port_width, view_port_height):
     :param view_port_width: The width of the view_port in the screen layout.
     :param view_port_height: As above
     """
+    view_port, chars, fg, to_draw = get_map_view(game_map, player, view_port_width, view_port_height)
+
+    map_console.draw_array(view_port[0], view_port[1], chars, fg=fg, mask=to_draw)
+
+
+def get_map_view(game_map, player, view_port_width, view_port_height):
+    """
+    Work out how the map under the view port should look, without drawing it anywhere - so it can be drawn now
+    (draw_map) or handed to another thread to draw (see snapshot_functions). Tiles in the FOV become explored.
+
+    Colours come straight from the map's precomputed light_rgb / dark_rgb arrays, so picking the colour of every tile
+    in view is a handful of array operations rather than a tuple built per tile.
+
+    :return: (view port (x1, y1, x2, y2), chars, fg, to_draw) - the arrays are new each call, view port sized:
+             chars (int32) and fg (uint8 RGB) for each tile, and to_draw (bool) True for the tiles to draw at all.
+    """
 
     # This grabs the view port coordinates. See function docstring for more detailed info.
-    view_port_x1, view_port_y1, view_port_x2, view_port_y2 = get_view_port_position(player, game_map, view_port_width, view_port_height)
+    view_port = get_view_port_position(player, game_map, view_port_width, view_port_height)
+    view_port_x1, view_port_y1, view_port_x2, view_port_y2 = view_port
+    view = (slice(view_port_x1, view_port_x2), slice(view_port_y1, view_port_y2))
 
-    # Iterate through the tiles in the game_map object to draw them
-    for x, y in game_map:
+    # Tiles within the FOV are drawn with the light colours (and become explored), explored tiles outside it with dark.
+    in_fov = np.asarray(game_map.fov[view], dtype=bool)
+    game_map.explored[view] |= in_fov
+    to_draw = game_map.explored[view].copy()
 
-        # Only draw the tile if it appears within the constraints of the view port.
-        if view_port_x1 <= x < view_port_x2 and view_port_y1 <= y < view_port_y2:
+    light_colour = game_map.light_rgb[view]
+    dark_colour = game_map.dark_rgb[view]
 
-            '''
-            First pull the char for this tile using the auto-tile function (get_render_char)
-            Then get the colours which are stored in the map tile itself.
-            '''
+    # Anything in the static layer (e.g. remains) is drawn in place of the floor, as part of the map.
+    static_char = game_map.static_layer.char[view]
+    has_static = static_char != 0
 
-            char = get_render_char(game_map, x, y)
-            light_colour, dark_colour = get_tile_colour(game_map, x, y)
+    if has_static.any():
+        static_colour = game_map.static_layer.colour[view]
+        light_colour = np.where(has_static[..., np.newaxis], static_colour, light_colour)
+        dark_colour = np.where(has_static[..., np.newaxis], static_colour // 2, dark_colour)
 
-            # If the tile is within the FOV, draw it with the light colours, if it's outside FOV and explored, use dark
-            if game_map.fov[x, y]:
-                map_console.draw_char(x, y, char, fg=light_colour, bg=None)
-                game_map.explored[x, y] = True
+    # With dynamic lighting, the colour of tiles in view is scaled by the light falling on them.
+    if game_map.light_map is not None:
+        light_colour = (light_colour * game_map.light_map.light[view]).astype(np.uint8)
 
-            elif game_map.explored[x, y]:
-                map_console.draw_char(x, y, char, fg=dark_colour, bg=None)
+    fg = np.where(in_fov[..., np.newaxis], light_colour, dark_colour)
 
+    # The chars come from the auto-tile function (get_render_char), worked out once per tile (see get_tile_chars).
+    chars = np.where(has_static, static_char, get_tile_chars(game_map, view, to_draw & ~has_static))
 
-# TODO: doc
-def get_tile_colour(game_map, x, y):
-    light_r = game_map.r[x, y]
-    light_g = game_map.g[x, y]
-    light_b = game_map.b[x, y]
+    return view_port, chars, fg, to_draw
 
-    dark_r = int(light_r/2)
-    dark_g = int(light_g/2)
-    dark_b = int(light_b/2)
 
-    light_colour = (light_r, light_g, light_b)
-    dark_colour = (dark_r, dark_g, dark_b)
+# TODO: doc
+def get_tile_colour(game_map, x, y):
+    light_colour = tuple(game_map.light_rgb[x, y].tolist())
+    dark_colour = tuple(game_map.dark_rgb[x, y].tolist())
 
     return light_colour, dark_colour
 
 
-# TODO: Doc
-def draw_entities(game_map, map_console, entities):
-    entities_in_render_order = sorted(entities, key=lambda x: x.render_order.value)
+def draw_entities(game_map, map_console, entities, player, view_port_width, view_port_height):
+    """
+    Draw the entities which are on screen and in the FOV onto the map console, in render order.
+    The EntityList hands these over already filtered and grouped (see EntityList.get_in_view), so nothing off screen
+    or out of sight is touched, however many entities there are on the level.
 
-    for entity in entities_in_render_order:
+    :return: the list of entities drawn, so they can be cleared again after the frame.
+    """
+    view_port = get_view_port_position(player, game_map, view_port_width, view_port_height)
+    entities_in_view = entities.get_in_view(game_map.fov, view_port)
+
+    for entity in entities_in_view:
         draw_entity(map_console, entity, game_map.fov)
 
+    return entities_in_view
+
 
 # TODO: Doc
-def update_game_display(game_map, player, root_console, view_port_console, map_console, message_console, view_port_width, view_port_height, message_log_width, message_log_height):
+def update_game_display(game_map, player, root_console, view_port_console, map_console, view_port_width, view_port_height):
 
     view_port_x1, view_port_y1, _, _ = get_view_port_position(player, game_map, view_port_width, view_port_height)
 
@@ -377,21 +490,16 @@ def update_game_display(game_map, player, root_console, view_port_console, map_c
     root_console.blit(view_port_console, 2, 10, view_port_width, view_port_height, 0, 0)
     view_port_console.clear()
 
+
+def update_message_display(root_console, message_console, message_log_width, message_log_height):
     root_console.blit(message_console, 2, 42, width=message_log_width, height=message_log_height)
-    message_console.clear()
 
-    tdl.flush()
 
 
 # TODO: Doc
 def update_hud(root_console, hud_console, right_console, hud_width, hud_height, right_con_width, right_con_height):
     root_console.blit(hud_console, 2, 2, width=hud_width, height=hud_height)
-    hud_console.clear()
-
     root_console.blit(right_console, 34, 10, width=right_con_width, height=right_con_height)
-    right_console.clear()
-
-    tdl.flush()
 
 
 # TODO: Doc, this may not work in this game
@@ -0,0 +1,362 @@
+import numpy as np
+
+
+DEFAULT_FG = (255, 255, 255)
+DEFAULT_BG = (0, 0, 0)
+
+
+def char_code(char):
+    """
+    Console chars are given either as single character strings or libtcod char code integers - return the integer.
+    """
+    if isinstance(char, str):
+        return ord(char)
+
+    return int(char)
+
+
+class Frame:
+    """
+    An immutable copy of everything on a FrameBuffer at one moment: the char code, foreground and background colour
+    of every cell. Frames compare equal when every cell matches, and can be hashed, so rendered output can be stored,
+    compared between runs, or used as a dict key.
+
+    Arrays are indexed [x, y] like the GameMap arrays.
+    """
+    def __init__(self, char, fg, bg):
+        self.char = char.copy()
+        self.fg = fg.copy()
+        self.bg = bg.copy()
+
+        for array in (self.char, self.fg, self.bg):
+            array.flags.writeable = False
+
+        self._digest = None
+
+    @property
+    def width(self):
+        return self.char.shape[0]
+
+    @property
+    def height(self):
+        return self.char.shape[1]
+
+    @property
+    def digest(self):
+        if self._digest is None:
+            import hashlib
+            hasher = hashlib.sha1()
+            hasher.update(np.array(self.char.shape, dtype=np.int32).tobytes())
+
+            for array in (self.char, self.fg, self.bg):
+                hasher.update(array.tobytes())
+
+            self._digest = hasher.hexdigest()
+
+        return self._digest
+
+    def __eq__(self, other):
+        if not isinstance(other, Frame):
+            return NotImplemented
+
+        return (self.char.shape == other.char.shape and np.array_equal(self.char, other.char)
+                and np.array_equal(self.fg, other.fg) and np.array_equal(self.bg, other.bg))
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def to_text(self):
+        """
+        The chars of the frame as lines of text, handy for eyeballing a frame or diffing it in a test failure.
+        Codes outside printable ASCII are shown as "?".
+        """
+        lines = []
+        for y in range(self.height):
+            codes = self.char[:, y]
+            lines.append("".join(chr(code) if 32 <= code < 127 else "?" for code in codes))
+
+        return "\n".join(lines)
+
+
+class FrameBuffer:
+    """
+    An in-memory console which can stand in for a tdl Console anywhere in the render functions, without needing a
+    window (or a display at all). Every cell is held in numpy arrays instead of being sent to libtcod:
+
+        - char (int32, width x height): the console char code of each cell.
+        - fg / bg (uint8, width x height x 3): the foreground / background RGB colour of each cell.
+
+    Supports the parts of the tdl Console API the game uses: draw_char, draw_str, draw_rect, clear and blit, with the
+    same colour conventions - a colour of None leaves the existing colour alone, and leaving fg/bg out uses the
+    defaults. Unlike tdl, strings which run off the right edge are clipped rather than wrapped onto the next line.
+    """
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+        self.char = np.zeros((width, height), dtype=np.int32)
+        self.fg = np.zeros((width, height, 3), dtype=np.uint8)
+        self.bg = np.zeros((width, height, 3), dtype=np.uint8)
+
+        self.frame_count = 0
+        self.compositor = None
+
+        self.clear()
+
+    def _set_colours(self, x_slice, y_slice, fg, bg):
+        if fg is not None:
+            self.fg[x_slice, y_slice] = DEFAULT_FG if fg is Ellipsis else fg
+
+        if bg is not None:
+            self.bg[x_slice, y_slice] = DEFAULT_BG if bg is Ellipsis else bg
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def clear(self, fg=DEFAULT_FG, bg=DEFAULT_BG):
+        self.char[:] = ord(" ")
+        self.fg[:] = fg
+        self.bg[:] = bg
+
+    def draw_char(self, x, y, char, fg=Ellipsis, bg=Ellipsis):
+        if not self.in_bounds(x, y):
+            return
+
+        if char is not None:
+            self.char[x, y] = char_code(char)
+
+        self._set_colours(x, y, fg, bg)
+
+    def draw_str(self, x, y, string, fg=Ellipsis, bg=Ellipsis):
+        if not 0 <= y < self.height or x >= self.width:
+            return
+
+        codes = [ord(char) for char in string][:self.width - x]
+        if not codes:
+            return
+
+        self.char[x:x + len(codes), y] = codes
+        self._set_colours(slice(x, x + len(codes)), y, fg, bg)
+
+    def draw_rect(self, x, y, width, height, string, fg=Ellipsis, bg=Ellipsis):
+        width = self.width if width is None else width
+        height = self.height if height is None else height
+
+        x1, y1 = max(x, 0), max(y, 0)
+        x2, y2 = min(x + width, self.width), min(y + height, self.height)
+
+        if x1 >= x2 or y1 >= y2:
+            return
+
+        if string is not None:
+            self.char[x1:x2, y1:y2] = char_code(string)
+
+        self._set_colours(slice(x1, x2), slice(y1, y2), fg, bg)
+
+    def draw_array(self, x, y, char, fg=None, bg=None, mask=None):
+        """
+        Draw a whole block of cells at once, with its top left corner at x, y.
+
+        :param char: int array of char codes, width x height.
+        :param fg / bg: uint8 arrays of colours, width x height x 3, or None to leave the existing colours alone.
+        :param mask: optional bool array, width x height - only cells where it is True are drawn.
+        """
+        width, height = char.shape
+        region = (slice(x, x + width), slice(y, y + height))
+
+        if mask is None:
+            mask = np.ones(char.shape, dtype=bool)
+
+        self.char[region][mask] = char[mask]
+
+        if fg is not None:
+            self.fg[region][mask] = fg[mask]
+
+        if bg is not None:
+            self.bg[region][mask] = bg[mask]
+
+    def blit(self, source, x=0, y=0, width=None, height=None, srcX=0, srcY=0):
+        """
+        Copy a width x height region of another FrameBuffer, starting at srcX, srcY, onto this one at x, y.
+        The region is clipped to fit both buffers.
+        """
+        width = source.width - srcX if width is None else width
+        height = source.height - srcY if height is None else height
+
+        # Clip the region against the edges of the source and destination.
+        width = min(width, source.width - srcX, self.width - x)
+        height = min(height, source.height - srcY, self.height - y)
+
+        if width <= 0 or height <= 0:
+            return
+
+        destination = (slice(x, x + width), slice(y, y + height))
+        region = (slice(srcX, srcX + width), slice(srcY, srcY + height))
+
+        self.char[destination] = source.char[region]
+        self.fg[destination] = source.fg[region]
+        self.bg[destination] = source.bg[region]
+
+    def get_frame(self):
+        return Frame(self.char, self.fg, self.bg)
+
+    def apply_delta(self, delta):
+        """
+        Draw the changed cells from a FrameDeltaEncoder delta, so a copy of a FrameBuffer kept somewhere else (e.g. by
+        a client of server_functions) can be brought up to date.
+        """
+        if not delta:
+            return
+
+        xs, ys = delta["x"], delta["y"]
+        self.char[xs, ys] = delta["char"]
+        self.fg[xs, ys] = delta["fg"]
+        self.bg[xs, ys] = delta["bg"]
+
+
+class FrameTracker:
+    """
+    Remembers the last frame passed on from a FrameBuffer, so the cells which changed since can be worked out - the
+    part shared by FrameCompositor (which draws them to a window) and FrameDeltaEncoder (which sends them elsewhere).
+
+    ATTRIBUTES:
+        - previous_char, previous_fg, previous_bg (np.array): copies of the FrameBuffer arrays as last passed on, None
+          before the first frame (or after invalidate).
+        - cells_pushed (int): changed cells passed on so far.
+    """
+    def __init__(self):
+        self.previous_char = None
+        self.previous_fg = None
+        self.previous_bg = None
+
+        self.cells_pushed = 0
+
+    def invalidate(self):
+        """
+        Forget the last frame, so every cell counts as changed next time (e.g. after the window is recreated).
+        """
+        self.previous_char = None
+
+    def get_dirty_mask(self, frame_buffer):
+        if self.previous_char is None or self.previous_char.shape != frame_buffer.char.shape:
+            return np.ones(frame_buffer.char.shape, dtype=bool)
+
+        return ((self.previous_char != frame_buffer.char)
+                | np.any(self.previous_fg != frame_buffer.fg, axis=2)
+                | np.any(self.previous_bg != frame_buffer.bg, axis=2))
+
+    def remember(self, frame_buffer, cells):
+        """
+        Keep a copy of the frame just passed on, which changed `cells` cells.
+        """
+        self.previous_char = frame_buffer.char.copy()
+        self.previous_fg = frame_buffer.fg.copy()
+        self.previous_bg = frame_buffer.bg.copy()
+
+        self.cells_pushed += cells
+
+
+class FrameCompositor(FrameTracker):
+    """
+    Sits between an off-screen root FrameBuffer and the real tdl window console.
+
+    The compositor remembers what it last sent to the window, and each time it is presented with a new frame works out
+    which cells actually changed. Only those cells are drawn to the window, one draw_char each (tdl has no call to draw
+    a block of cells with different chars and colours), followed by a single tdl.flush().
+
+    On a quiet turn where nothing on screen changed, presenting a frame costs one array comparison and no drawing.
+    """
+    def __init__(self, window_console):
+        super().__init__()
+        self.window_console = window_console
+
+    def present(self, frame_buffer):
+        dirty_mask = self.get_dirty_mask(frame_buffer)
+
+        if dirty_mask.any():
+            char, fg, bg = frame_buffer.char, frame_buffer.fg, frame_buffer.bg
+            draw_char = self.window_console.draw_char
+
+            xs, ys = np.nonzero(dirty_mask)
+
+            for x, y, cell_char, cell_fg, cell_bg in zip(xs.tolist(), ys.tolist(), char[xs, ys].tolist(),
+                                                         fg[xs, ys].tolist(), bg[xs, ys].tolist()):
+                draw_char(x, y, cell_char, fg=tuple(cell_fg), bg=tuple(cell_bg))
+
+            self.remember(frame_buffer, len(xs))
+
+        import tdl
+        tdl.flush()
+
+
+class FrameDeltaEncoder(FrameTracker):
+    """
+    The FrameCompositor's counterpart with no window: instead of drawing the changed cells, get_delta returns them, for
+    sending somewhere else (see server_functions). A delta is a dict of lists ready for JSON - the x and y of each
+    changed cell, with its char code and fg / bg colours - which FrameBuffer.apply_delta draws back onto a copy.
+
+    The first delta (and the first after invalidate) holds every cell.
+    """
+    def get_delta(self, frame_buffer):
+        """
+        The cells which changed since the last delta, or None if nothing did.
+        """
+        dirty_mask = self.get_dirty_mask(frame_buffer)
+
+        if not dirty_mask.any():
+            return None
+
+        char, fg, bg = frame_buffer.char, frame_buffer.fg, frame_buffer.bg
+        xs, ys = np.nonzero(dirty_mask)
+
+        delta = {"x": xs.tolist(), "y": ys.tolist(), "char": char[xs, ys].tolist(), "fg": fg[xs, ys].tolist(),
+                 "bg": bg[xs, ys].tolist()}
+
+        self.remember(frame_buffer, len(xs))
+
+        return delta
+
+
+def make_consoles(screen_layout, headless=False, title="Roguelike 3"):
+    """
+    Create every console the render functions need, in the order render_all unpacks them:
+    root, view port, map, message log, HUD, right panel.
+
+    Every console is an off-screen FrameBuffer. With headless=True no window is opened at all, so the whole render
+    path can run on a machine with no display. Otherwise a tdl window is opened and attached to the root console via a
+    FrameCompositor, which copies only the changed cells across each time the root console is flushed.
+    """
+    screen_width, screen_height = screen_layout["screen"]
+
+    root_console = FrameBuffer(screen_width, screen_height)
+
+    if not headless:
+        import tdl
+        window_console = tdl.init(screen_width, screen_height, title=title)
+        root_console.compositor = FrameCompositor(window_console)
+
+    view_port_console = FrameBuffer(*screen_layout["view_port"])
+    map_console = FrameBuffer(*screen_layout["map"])
+    message_console = FrameBuffer(*screen_layout["message_log"])
+    hud_console = FrameBuffer(*screen_layout["hud"])
+    right_console = FrameBuffer(*screen_layout["right"])
+
+    return [root_console, view_port_console, map_console, message_console, hud_console, right_console]
+
+
+def flush(root_console):
+    """
+    Present the finished frame on the root console - this should happen once per frame, after everything is drawn.
+
+    If the root console has a compositor (i.e. there is a window) the changed cells are pushed to the window and
+    flushed. A headless FrameBuffer has nothing to present, so it just counts the frame. A plain tdl root console
+    is flushed with tdl.flush() as before.
+    """
+    if isinstance(root_console, FrameBuffer):
+        if root_console.compositor:
+            root_console.compositor.present(root_console)
+
+        root_console.frame_count += 1
+    else:
+        import tdl
+        tdl.flush()
@@ -0,0 +1,138 @@
+import json
+import sys
+import time
+from game_states import GameStates
+from session_functions import GameSession
+from perf_functions import phase_timer
+from rewind_functions import RewindBuffer
+
+
+RECORDING_VERSION = 1
+
+
+class Recorder:
+    """
+    Records everything needed to play a session back exactly: the map size and seed, the combat RNG state at the
+    start, the size of the session's RewindBuffer (if it has one), and every action (the dicts from handle_keys) passed
+    to GameSession.take_turn, in order.
+
+    Usage:
+        recorder = Recorder(session)
+        ...
+        recorder.record(action)
+        session.take_turn(action)
+        ...
+        recorder.save("bug_report.json")
+
+    The file is plain JSON, so it can be attached to a bug report as it is.
+    """
+    def __init__(self, session):
+        self.map_size = (session.game_map.width, session.game_map.height)
+        self.seed = session.seed
+        self.combat_state = session.combat_state
+        self.rewind_capacity = session.rewind.turns.maxlen if session.rewind is not None else None
+        self.actions = []
+
+    def record(self, action):
+        if action:
+            self.actions.append(action)
+
+    def to_dict(self):
+        version, internal_state, gauss_next = self.combat_state
+
+        return {"version": RECORDING_VERSION,
+                "map_size": list(self.map_size),
+                "seed": self.seed,
+                "combat_state": [version, list(internal_state), gauss_next],
+                "rewind_capacity": self.rewind_capacity,
+                "actions": self.actions}
+
+    def save(self, filename):
+        with open(filename, "w") as file:
+            json.dump(self.to_dict(), file)
+
+
+def load_recording(filename):
+    """
+    Read a recording saved by Recorder.save. JSON has no tuples, so the combat RNG state and move actions are turned
+    back into tuples here, as the game expects.
+    """
+    with open(filename) as file:
+        recording = json.load(file)
+
+    if recording.get("version") != RECORDING_VERSION:
+        raise ValueError("Unsupported recording version: {}".format(recording.get("version")))
+
+    version, internal_state, gauss_next = recording["combat_state"]
+    recording["combat_state"] = (version, tuple(internal_state), gauss_next)
+    recording["map_size"] = tuple(recording["map_size"])
+
+    for action in recording["actions"]:
+        if "move" in action:
+            action["move"] = tuple(action["move"])
+
+    return recording
+
+
+def replay(recording, render=False, screen_layout=None):
+    """
+    Play a recording back through GameSession as fast as possible, without a window.
+
+    With render=True each turn is also drawn with render_all onto headless consoles (see render_targets), so the
+    replay measures rendering as well as the turn logic - screen_layout must then be given, as built in engine.main.
+
+    Returns the finished session and a summary dict: turns, seconds, turns_per_second, and the player's final
+    position and HP (handy for checking two replays of the same recording agree).
+    """
+    session = GameSession(*recording["map_size"], seed=recording["seed"], combat_state=recording["combat_state"])
+
+    if recording.get("rewind_capacity"):
+        session.rewind = RewindBuffer(recording["rewind_capacity"])
+
+    if render:
+        from render_functions import render_all
+        from render_targets import make_consoles
+        from hud_functions import Hud
+        from message_functions import MessageLog
+
+        all_consoles = make_consoles(screen_layout, headless=True)
+        message_log = MessageLog(0, 0, *screen_layout["message_log"])
+        hud = Hud(screen_layout["hud"][0], *screen_layout["right"])
+
+    start = time.perf_counter()
+
+    for action in recording["actions"]:
+        # Nothing but a rewind does anything once the player is dead.
+        if session.game_state == GameStates.PLAYER_DEAD and not action.get("rewind"):
+            continue
+
+        fov_recompute = session.update_fov()
+
+        if render:
+            with phase_timer.phase("frame"):
+                render_all(session.game_map, all_consoles, session.player, session.entities, fov_recompute,
+                           screen_layout, message_log, (0, 0), hud)
+
+        session.take_turn(action)
+
+    seconds = time.perf_counter() - start
+
+    summary = {"turns": session.turn,
+               "seconds": seconds,
+               "turns_per_second": session.turn / seconds if seconds else 0.0,
+               "player": (session.player.x, session.player.y, session.player.hp)}
+
+    return session, summary
+
+
+if __name__ == "__main__":
+    # Usage: python replay_functions.py recording.json [--render]
+    from engine import get_screen_layout
+
+    phase_timer.enabled = True
+
+    _, result = replay(load_recording(sys.argv[1]), render="--render" in sys.argv, screen_layout=get_screen_layout())
+
+    print(result)
+    for name, stats in phase_timer.get_summary().items():
+        print(name, stats)
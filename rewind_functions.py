@@ -0,0 +1,200 @@
+from collections import deque
+from contextlib import contextmanager
+
+
+class _NullJournal:
+    """
+    Stands in for a TurnRecord while no turn is being recorded, so every hook is a no-op method call.
+    """
+    def touch_entity(self, entity):
+        pass
+
+    def entity_removed(self, collection, entity):
+        pass
+
+    def touch_tile(self, game_map, x, y):
+        pass
+
+    def touch_static(self, layer, x, y):
+        pass
+
+
+_NULL_JOURNAL = _NullJournal()
+
+# Where the hooks in entity_classes and map_functions report changes to. Swapped for a TurnRecord by
+# RewindBuffer.record_turn while a turn is being recorded.
+journal = _NULL_JOURNAL
+
+
+class TurnRecord:
+    """
+    What one turn changed, kept copy-on-write: the first time the turn touches an entity or a tile (see the hooks), its
+    state from before the change is copied here, and anything the turn never touches is never copied. undo() puts
+    every copy back, which takes the game back to how it was when the turn started.
+
+    The hooks are:
+        - Actor.move, Actor.take_damage and Pickup.activate (touch_entity) - the entity's attributes. take_damage also
+          covers the monster being killed, and kill_player / kill_monster, as they change the entity later in the same
+          turn.
+        - EntityList.remove (entity_removed) - a monster dying or an item being used up, with the order of the list so
+          the entity goes back in its old place (which decides the order monsters take their turns in).
+        - GameMap.open_door (touch_tile) - the tile arrays open_door changes (GameMap.DOOR_ARRAYS) and the door.
+        - StaticLayer.add (touch_static) - the decoration a corpse is stamped over.
+
+    ATTRIBUTES:
+        - turn, game_state, combat_state: the session's turn counter, game state and combat_rng state before the turn.
+          The combat_rng is the session's own, so undoing a turn only winds back that game's rolls.
+        - entities (dict): Entity.id -> (entity, copy of its __dict__).
+        - removed (list): (EntityList, entity, order of Entity.ids in the list) for each entity removed.
+        - tiles (dict): (x, y) -> (game_map, {array name: value}, door open state or None).
+        - static (dict): (x, y) -> (layer, char, colour, name).
+    """
+    def __init__(self, session):
+        self.turn = session.turn
+        self.game_state = session.game_state
+        self.combat_state = session.combat_rng.getstate()
+
+        self.entities = dict()
+        self.removed = []
+        self.tiles = dict()
+        self.static = dict()
+
+    def touch_entity(self, entity):
+        if entity.id not in self.entities:
+            self.entities[entity.id] = (entity, vars(entity).copy())
+
+    def entity_removed(self, collection, entity):
+        self.touch_entity(entity)
+        self.removed.append((collection, entity, list(collection._entities)))
+
+    def touch_tile(self, game_map, x, y):
+        if (x, y) in self.tiles:
+            return
+
+        values = {name: getattr(game_map, name)[x, y].copy() for name in game_map.DOOR_ARRAYS}
+        door = game_map.door[x][y]
+        self.tiles[(x, y)] = (game_map, values, door.is_open if door else None)
+
+    def touch_static(self, layer, x, y):
+        if (x, y) not in self.static:
+            self.static[(x, y)] = (layer, int(layer.char[x, y]), layer.colour[x, y].copy(), layer.names.get((x, y)))
+
+    def is_empty(self):
+        return not (self.entities or self.tiles or self.static)
+
+    def undo(self, session):
+        """
+        Put everything this turn touched back as it was before the turn.
+        """
+        '''ENTITIES START'''
+        # Position and render order go through their properties, so an EntityList the entity is in keeps its indexes
+        # up to date - but only if they changed, as the EntityList moves the entity to the back of the render order
+        # bucket even if it is set to the same value. An entity which was removed is not in an EntityList at the
+        # moment, and goes back into it below.
+        for entity, saved in self.entities.values():
+            if entity.collection is not None:
+                if (entity.x, entity.y) != (saved["_x"], saved["_y"]):
+                    entity.x = saved["_x"]
+                    entity.y = saved["_y"]
+
+                if entity.render_order != saved["_render_order"]:
+                    entity.render_order = saved["_render_order"]
+
+            collection = entity.collection
+            vars(entity).update(saved)
+            entity.collection = collection
+
+        for collection, entity, order in reversed(self.removed):
+            collection.append(entity)
+            collection.set_order(order)
+        '''ENTITIES END'''
+
+        '''TILES START'''
+        for (x, y), (game_map, values, is_open) in self.tiles.items():
+            for name, value in values.items():
+                getattr(game_map, name)[x, y] = value
+
+            if is_open is not None:
+                game_map.door[x][y].is_open = is_open
+
+            # Anything cached against the layout (e.g. LightMap) has to notice the door closing again.
+            game_map.door_version += 1
+
+        for (x, y), (layer, char, colour, name) in self.static.items():
+            layer.char[x, y] = char
+            layer.colour[x, y] = colour
+
+            if name is None:
+                layer.names.pop((x, y), None)
+            else:
+                layer.names[(x, y)] = name
+
+            layer.version += 1
+        '''TILES END'''
+
+        session.turn = self.turn
+        session.game_state = self.game_state
+        session.combat_rng.setstate(self.combat_state)
+
+
+class RewindBuffer:
+    """
+    A ring of the last `capacity` turns (TurnRecords), so the game can be wound back turn by turn - for chasing AI
+    bugs, or as a gameplay feature.
+
+    Because each turn only keeps copies of what it touched, the memory used grows with how much happened in those
+    turns rather than with the size of the map or the number of entities. Once the ring is full the oldest turn is
+    dropped.
+
+    explored isn't rewound - what the player has seen stays seen - and neither is the message log.
+
+    Usage:
+        rewind = RewindBuffer(capacity=50)
+
+        with rewind.record_turn(session):
+            session.take_turn(action)
+
+        rewind.rewind(session)      # back to before that turn.
+    """
+    def __init__(self, capacity=50):
+        self.turns = deque(maxlen=capacity)
+
+    def __len__(self):
+        return len(self.turns)
+
+    @contextmanager
+    def record_turn(self, session):
+        """
+        Record the changes made inside the with block as one turn. Nothing is kept if the block changed nothing (e.g.
+        an action which didn't use up the player's turn).
+        """
+        global journal
+
+        record = TurnRecord(session)
+        previous, journal = journal, record
+
+        try:
+            yield record
+        finally:
+            journal = previous
+
+            if not record.is_empty() or record.turn != session.turn:
+                self.turns.append(record)
+
+    def rewind(self, session, turns=1):
+        """
+        Undo the last `turns` turns (as many as are kept, if fewer). Returns how many were undone.
+        """
+        undone = 0
+
+        while self.turns and undone < turns:
+            self.turns.pop().undo(session)
+            undone += 1
+
+        if undone:
+            session.fov_recompute = True
+
+        return undone
+
+    def clear(self):
+        self.turns.clear()
@@ -0,0 +1,434 @@
+import json
+import os
+import numpy as np
+from game_states import GameStates
+from map_functions import GameMap, MapSnapshot, Door, Button
+from entity_classes import Player, Monster, Pickup, EntityList, stats
+from render_functions import RenderOrder
+from message_functions import Message
+from session_functions import GameSession
+
+
+SAVE_VERSION = 1
+
+ENTITY_CLASSES = {"player": Player, "monster": Monster, "pickup": Pickup}
+ENTITY_KINDS = {entity_class: kind for kind, entity_class in ENTITY_CLASSES.items()}
+
+# Everything about an entity which can change during a game, after its position and render order. Fields an entity
+# doesn't have (e.g. max_hp on a Pickup) are saved as None.
+ENTITY_FIELDS = ("name", "char", "colour", "hp", "arm", "mp", "max_hp", "max_arm", "max_mp", "str", "dex", "blocks",
+                 "dead")
+
+# The same, as the keys they are stored under in the entity's __dict__ (position and render order are properties).
+ENTITY_KEYS = ("_x", "_y", "_render_order") + ENTITY_FIELDS
+
+# Map arrays which only change when a door opens (or is shut again by a rewind), so are only compared when
+# GameMap.door_version has moved on. explored is compared every turn.
+LAYOUT_ARRAYS = GameMap.DOOR_ARRAYS
+
+
+def get_entity_state(entity):
+    """
+    Everything about an entity which can change, straight out of its __dict__ as a tuple - cheap to build, and two
+    can be compared to see whether the entity has changed. See get_entity_record for the saved form.
+    """
+    return tuple(map(vars(entity).get, ENTITY_KEYS))
+
+
+def get_entity_record(entity):
+    """
+    Everything needed to rebuild an entity (see build_entity), as a list which JSON can store.
+    """
+    x, y, render_order, *values = get_entity_state(entity)
+
+    # Positions can be numpy ints (placement picks them out of numpy arrays), which JSON can't store.
+    record = [ENTITY_KINDS[type(entity)], int(x), int(y), render_order.value]
+    for field, value in zip(ENTITY_FIELDS, values):
+        record.append([int(channel) for channel in value] if field == "colour" else value)
+
+    return record
+
+
+def build_entity(record):
+    kind, x, y, render_order = record[:4]
+    fields = dict(zip(ENTITY_FIELDS, record[4:]))
+
+    entity = ENTITY_CLASSES[kind](x, y, fields["name"], fields["char"], tuple(fields["colour"]), stats(0, 0, 0, 0, 0))
+    entity.render_order = RenderOrder(render_order)
+
+    for field, value in fields.items():
+        if value is not None:
+            setattr(entity, field, tuple(value) if field == "colour" else value)
+
+    return entity
+
+
+def diff_array(array, saved):
+    """
+    Compare a map array against the copy saved last time, bring the copy up to date, and return the tiles which
+    changed as [xs, ys, values] lists - or None if nothing did. Arrays with a colour axis (width x height x 3) count a
+    tile as changed if any channel did.
+    """
+    array = np.asarray(array)
+    changed = array != saved
+
+    if changed.ndim == 3:
+        changed = changed.any(axis=2)
+
+    # any() is far quicker than nonzero() on a 2D array, and on most turns nothing has changed.
+    if not changed.any():
+        return None
+
+    xs, ys = np.nonzero(changed)
+
+    saved[xs, ys] = array[xs, ys]
+
+    return [xs.tolist(), ys.tolist(), array[xs, ys].tolist()]
+
+
+def get_rng_record(state):
+    """
+    A random.Random state (from getstate) as a JSON list. get_rng_state turns it back.
+    """
+    version, internal_state, gauss_next = state
+    return [version, list(internal_state), gauss_next]
+
+
+def get_rng_state(record):
+    version, internal_state, gauss_next = record
+    return version, tuple(internal_state), gauss_next
+
+
+def apply_array_diff(array, diff):
+    xs, ys, values = diff
+    array[xs, ys] = values
+
+
+class SaveManager:
+    """
+    Saves a game in progress to a directory, as one full snapshot plus a delta for every turn since.
+
+        - base.npz: the full game - every map array, the doors and the static layer, with the entities, message log,
+          turn, combat_rng state and so on as JSON alongside them. Written compressed, and atomically (through a
+          temporary file), so there is always one whole snapshot on disk.
+        - deltas.jsonl: one JSON line per save() since the snapshot, holding only what changed - tiles newly explored,
+          doors opened or shut (and the tiles that changed with them), decorations in the static layer, entities which
+          changed or were removed, new messages, and the combat_rng state if any combat rolls were made.
+
+    To work out a delta the manager keeps its own copy of what it last saved - explored and the layout arrays, the
+    static layer, and a tuple of state per entity - and compares the game against it. The layout arrays are only
+    compared when a door has been opened (GameMap.door_version), and the static layer when something has been added
+    to it (StaticLayer.version), so most saves are one numpy compare over the map, a tuple per entity and one short
+    line appended to a file: microseconds rather than a rewrite of the whole world.
+
+    Every compact_every deltas the snapshot is rewritten and the deltas emptied, so loading never has more than that
+    many to replay. Each delta has a sequence number, and the snapshot records the last one folded into it, so if the
+    game stops between writing a new snapshot and emptying the deltas the stale ones are skipped on load.
+
+    The first save() writes a snapshot, as there is nothing yet to compare against (so a manager picking up a loaded
+    game starts a fresh base of its own). The sequence numbers carry on from any save already in the directory, so the
+    old deltas are skipped if the game stops before they are emptied.
+
+    Usage:
+        saver = SaveManager("saves/slot1")
+        ...
+        session.take_turn(action)
+        saver.save(session)
+
+        session = load_game("saves/slot1", message_log)
+    """
+    BASE_FILENAME = "base.npz"
+    DELTAS_FILENAME = "deltas.jsonl"
+
+    def __init__(self, directory, compact_every=100):
+        self.directory = directory
+        self.compact_every = compact_every
+
+        self.seq = get_last_seq(directory)
+        self.deltas_since_base = 0
+
+        self._arrays = None
+        self._static_char = None
+        self._static_colour = None
+        self._static_version = None
+        self._door_version = None
+        self._open_doors = None
+        self._door_positions = None
+        self._states = None
+        self._messages_added = 0
+        self._combat_state = None
+        self._deltas_file = None
+
+    def save(self, session):
+        if self._states is None or self.deltas_since_base >= self.compact_every:
+            self.write_base(session)
+            return
+
+        self.seq += 1
+        delta = self.get_delta(session)
+        delta["seq"] = self.seq
+
+        self._deltas_file.write(json.dumps(delta, separators=(",", ":")) + "\n")
+        self._deltas_file.flush()
+
+        self.deltas_since_base += 1
+
+    def write_base(self, session):
+        """
+        Write a full snapshot of the game, and start a new (empty) list of deltas against it.
+        """
+        game_map, message_log = session.game_map, session.message_log
+        snapshot = game_map.snapshot()
+        layer = game_map.static_layer
+
+        doors = [[x, y, "button" if isinstance(door, Button) else "door", vars(door)]
+                 for (x, y), door in snapshot.doors.items()]
+
+        self._states = {str(entity.id): get_entity_state(entity) for entity in session.entities}
+        records = [[str(entity.id), get_entity_record(entity)] for entity in session.entities]
+
+        messages = []
+        if message_log is not None:
+            messages = [[message.text, list(message.colour)] for message in message_log.get_newest(len(message_log))]
+            self._messages_added = message_log.added
+
+        self._combat_state = session.combat_rng.getstate()
+
+        meta = {"version": SAVE_VERSION, "seq": self.seq, "seed": session.seed, "turn": session.turn,
+                "game_state": session.game_state.name, "width": game_map.width, "height": game_map.height,
+                "combat_state": get_rng_record(self._combat_state),
+                "doors": doors, "static_names": [[int(x), int(y), name] for (x, y), name in layer.names.items()],
+                "entities": records, "messages": messages}
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        filename = os.path.join(self.directory, self.BASE_FILENAME)
+        temporary_filename = filename + ".tmp.npz"
+        np.savez_compressed(temporary_filename, meta=np.array(json.dumps(meta)), static_char=layer.char,
+                            static_colour=layer.colour, **snapshot.arrays)
+        os.replace(temporary_filename, filename)
+
+        # Keep copies of everything the deltas are worked out against.
+        self._arrays = {name: snapshot.arrays[name] for name in ("explored",) + LAYOUT_ARRAYS}
+        self._static_char = layer.char.copy()
+        self._static_colour = layer.colour.copy()
+        self._static_version = layer.version
+        self._door_version = game_map.door_version
+        self._door_positions = list(snapshot.doors)
+        self._open_doors = {position for position, door in snapshot.doors.items() if door.is_open}
+
+        if self._deltas_file is not None:
+            self._deltas_file.close()
+
+        self._deltas_file = open(os.path.join(self.directory, self.DELTAS_FILENAME), "w")
+        self.deltas_since_base = 0
+
+    def get_delta(self, session):
+        """
+        What has changed since the last save, as a dict ready for JSON. Brings the saved copies up to date.
+        """
+        game_map, message_log = session.game_map, session.message_log
+        delta = {"turn": session.turn, "game_state": session.game_state.name}
+
+        '''TILES START'''
+        tiles = dict()
+        explored = diff_array(game_map.explored, self._arrays["explored"])
+        if explored:
+            tiles["explored"] = explored
+
+        # Only a door opening changes the layout, so skip comparing it otherwise.
+        if game_map.door_version != self._door_version:
+            for name in LAYOUT_ARRAYS:
+                diff = diff_array(getattr(game_map, name), self._arrays[name])
+                if diff:
+                    tiles[name] = diff
+
+            doors = []
+            for x, y in self._door_positions:
+                is_open = game_map.door[x][y].is_open
+
+                if is_open != ((x, y) in self._open_doors):
+                    doors.append([x, y, is_open])
+
+                    if is_open:
+                        self._open_doors.add((x, y))
+                    else:
+                        self._open_doors.discard((x, y))
+
+            delta["doors"] = doors
+            self._door_version = game_map.door_version
+
+        if tiles:
+            delta["tiles"] = tiles
+
+        layer = game_map.static_layer
+        if layer.version != self._static_version:
+            changed = (layer.char != self._static_char) | (layer.colour != self._static_colour).any(axis=2)
+            xs, ys = np.nonzero(changed)
+
+            self._static_char[xs, ys] = layer.char[xs, ys]
+            self._static_colour[xs, ys] = layer.colour[xs, ys]
+            self._static_version = layer.version
+            delta["static"] = [[x, y, int(layer.char[x, y]), layer.colour[x, y].tolist(), layer.names.get((x, y))]
+                               for x, y in zip(xs.tolist(), ys.tolist())]
+        '''TILES END'''
+
+        '''ENTITIES START'''
+        states = dict()
+        changed_records = dict()
+        saved_states = self._states
+
+        for entity in session.entities:
+            uid = str(entity.id)
+            state = get_entity_state(entity)
+            states[uid] = state
+
+            if saved_states.get(uid) != state:
+                changed_records[uid] = get_entity_record(entity)
+
+        removed = [uid for uid in saved_states if uid not in states]
+        self._states = states
+
+        if changed_records:
+            delta["entities"] = changed_records
+
+        if removed:
+            delta["removed"] = removed
+        '''ENTITIES END'''
+
+        if message_log is not None and message_log.added != self._messages_added:
+            new_messages = message_log.get_newest(message_log.added - self._messages_added)
+            delta["messages"] = [[message.text, list(message.colour)] for message in new_messages]
+            self._messages_added = message_log.added
+
+        # The random numbers only move on in turns with combat, so most deltas leave the (large) state out.
+        combat_state = session.combat_rng.getstate()
+        if combat_state != self._combat_state:
+            delta["combat_state"] = get_rng_record(combat_state)
+            self._combat_state = combat_state
+
+        return delta
+
+    def close(self):
+        if self._deltas_file is not None:
+            self._deltas_file.close()
+            self._deltas_file = None
+
+
+def has_save(directory):
+    return os.path.exists(os.path.join(directory, SaveManager.BASE_FILENAME))
+
+
+def read_deltas(filename, after_seq):
+    """
+    The deltas in a deltas file with a sequence number after after_seq, in order. A half written last line (the game
+    stopped mid-save) is ignored.
+    """
+    deltas = []
+
+    try:
+        with open(filename) as file:
+            for line in file:
+                try:
+                    delta = json.loads(line)
+                except ValueError:
+                    break
+
+                if delta["seq"] > after_seq:
+                    deltas.append(delta)
+
+    except FileNotFoundError:
+        pass
+
+    return deltas
+
+
+def get_last_seq(directory):
+    """
+    The sequence number of the newest record saved in the directory - the snapshot, or a delta after it - or 0 if there
+    is no save.
+    """
+    try:
+        with np.load(os.path.join(directory, SaveManager.BASE_FILENAME)) as data:
+            seq = json.loads(str(data["meta"]))["seq"]
+    except FileNotFoundError:
+        return 0
+
+    deltas = read_deltas(os.path.join(directory, SaveManager.DELTAS_FILENAME), seq)
+
+    return deltas[-1]["seq"] if deltas else seq
+
+
+def load_game(directory, message_log=None, **session_options):
+    """
+    Load a game saved by SaveManager - the snapshot with every delta since applied - as a GameSession.
+    Any messages in message_log are replaced with the saved ones. session_options are passed on to
+    GameSession.from_state (fov settings). Returns None if there is no save in the directory.
+    """
+    try:
+        data = np.load(os.path.join(directory, SaveManager.BASE_FILENAME))
+    except FileNotFoundError:
+        return None
+
+    with data:
+        meta = json.loads(str(data["meta"]))
+        arrays = {name: data[name] for name in MapSnapshot.ARRAYS}
+        static_char = data["static_char"]
+        static_colour = data["static_colour"]
+
+    if meta["version"] != SAVE_VERSION:
+        raise ValueError("Save is version {}, expected {}".format(meta["version"], SAVE_VERSION))
+
+    doors = dict()
+    for x, y, door_type, attributes in meta["doors"]:
+        door = Button(x, y, 0, 0) if door_type == "button" else Door()
+        door.__dict__.update(attributes)
+        doors[(x, y)] = door
+
+    static_names = {(x, y): name for x, y, name in meta["static_names"]}
+    records = {uid: record for uid, record in meta["entities"]}
+    messages = meta["messages"]
+    turn, game_state = meta["turn"], meta["game_state"]
+    combat_state = meta["combat_state"]
+
+    for delta in read_deltas(os.path.join(directory, SaveManager.DELTAS_FILENAME), meta["seq"]):
+        turn, game_state = delta["turn"], delta["game_state"]
+
+        for name, diff in delta.get("tiles", dict()).items():
+            apply_array_diff(arrays[name], diff)
+
+        for x, y, is_open in delta.get("doors", ()):
+            doors[(x, y)].is_open = is_open
+
+        for x, y, char, colour, name in delta.get("static", ()):
+            static_char[x, y] = char
+            static_colour[x, y] = colour
+            static_names[(x, y)] = name
+
+        # Changed entities keep their place in the order, new ones go on the end.
+        records.update(delta.get("entities", dict()))
+
+        for uid in delta.get("removed", ()):
+            del records[uid]
+
+        messages.extend(delta.get("messages", ()))
+        combat_state = delta.get("combat_state", combat_state)
+
+    game_map = GameMap(meta["width"], meta["height"])
+    game_map.restore(MapSnapshot.from_data(meta["width"], meta["height"], arrays, doors))
+    game_map.static_layer.char[:] = static_char
+    game_map.static_layer.colour[:] = static_colour
+    game_map.static_layer.names = {position: name for position, name in static_names.items() if name is not None}
+
+    entities = EntityList([build_entity(record) for record in records.values()])
+    player = next(entity for entity in entities if isinstance(entity, Player))
+
+    if message_log is not None:
+        message_log.clear()
+
+        for text, colour in messages:
+            message_log.add_message(Message(text, tuple(colour)))
+
+    return GameSession.from_state(game_map, player, entities, meta["seed"], turn=turn,
+                                  game_state=GameStates[game_state], combat_state=get_rng_state(combat_state),
+                                  message_log=message_log, **session_options)
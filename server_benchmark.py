@@ -0,0 +1,126 @@
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from engine import get_screen_layout
+from server_functions import GameServer, HostedSession
+from cache_functions import LevelCache
+from bot_functions import MOVES
+from benchmark_functions import median, run_cli
+
+
+SEED = 888727
+SESSIONS_FOR_MEMORY = 20
+
+
+def measure_session_memory(level_cache, count=SESSIONS_FOR_MEMORY):
+    """
+    Memory held per hosted session (kB), with the level already in the level cache and the first frame drawn - so it
+    covers the map, entities, consoles and the encoder's copy of the last frame sent.
+
+    Measured with tracemalloc, which sees Python objects and numpy arrays but not memory allocated inside libtcod.
+    """
+    screen_layout = get_screen_layout()
+
+    # Warm up: fill the level cache, and get anything allocated once per process (imports, caches) out of the way.
+    HostedSession(0, screen_layout, SEED, level_cache).step()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    sessions = [HostedSession(i + 1, screen_layout, SEED, level_cache) for i in range(count)]
+    for hosted in sessions:
+        hosted.step()
+
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+    return total / count / 1024
+
+
+async def play(port, client_number, turns):
+    """
+    One client: join, then send turns random moves, timing each round trip. Returns (join ms, [turn ms], bytes).
+    """
+    rng = random.Random(client_number)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=2 ** 24)
+
+    async def send(message):
+        writer.write((json.dumps(message) + "\n").encode())
+        await writer.drain()
+
+    start = time.perf_counter()
+    await send({"type": "join", "seed": SEED})
+    received = len(await reader.readline())
+    received += len(await reader.readline())
+    join_ms = (time.perf_counter() - start) * 1000
+
+    turn_ms = []
+    for i in range(turns):
+        start = time.perf_counter()
+        await send({"type": "action", "action": {"move": list(rng.choice(MOVES))}})
+        received += len(await reader.readline())
+        turn_ms.append((time.perf_counter() - start) * 1000)
+
+    await send({"type": "quit"})
+    writer.close()
+    await writer.wait_closed()
+
+    return join_ms, turn_ms, received
+
+
+async def run_clients(level_cache, clients, turns):
+    server = GameServer(get_screen_layout(), port=0, level_cache=level_cache, max_sessions=clients)
+    await server.start()
+
+    try:
+        runs = await asyncio.gather(*[play(server.port, i, turns) for i in range(clients)])
+    finally:
+        await server.stop()
+
+    turn_ms = sorted(ms for _, client_turn_ms, _ in runs for ms in client_turn_ms)
+
+    return {
+        "cpu_per_turn": server.finished_turn_seconds * 1000 / server.finished_turns,
+        "join_p50": median([join_ms for join_ms, _, _ in runs]),
+        "turn_p50": median(turn_ms),
+        "turn_p95": turn_ms[int(len(turn_ms) * 0.95)],
+        "bytes_per_turn_bytes": sum(received for _, _, received in runs) / (clients * turns),
+    }
+
+
+def run_suite(quick=False):
+    """
+    Per-session memory, then clients playing at once over a local socket - the server's CPU time per turn (taking the
+    turn, drawing it and working out the changed cells), the round trip time of a turn (which, with many clients,
+    includes waiting for the other sessions' turns) and the bytes sent per turn.
+
+    The level cache lives in a temporary directory, and is filled before any timing, so joins load rather than
+    generate the level.
+    """
+    client_counts = [1, 16] if quick else [1, 16, 64]
+    turns = 30 if quick else 100
+    results = dict()
+
+    with tempfile.TemporaryDirectory() as directory:
+        level_cache = LevelCache(os.path.join(directory, "cache"))
+
+        results["memory"] = {"session_kb": measure_session_memory(level_cache)}
+
+        for clients in client_counts:
+            name = "clients_{}".format(clients)
+            results[name] = asyncio.run(run_clients(level_cache, clients, turns))
+            print(name, file=sys.stderr)
+
+    return results
+
+
+if __name__ == "__main__":
+    # Usage: python server_benchmark.py [--quick] [--save baseline.json] [--compare baseline.json]
+    run_cli(run_suite, sys.argv)
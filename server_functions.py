@@ -0,0 +1,296 @@
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from game_states import GameStates
+from session_functions import GameSession
+from message_functions import MessageLog
+from hud_functions import Hud
+from render_functions import render_all
+from render_targets import make_consoles, FrameDeltaEncoder
+from rewind_functions import RewindBuffer
+from cache_functions import LevelCache
+from perf_functions import phase_timer
+
+
+# Longest line a client may send - anything longer is treated as a broken client and it is disconnected.
+MAX_MESSAGE_BYTES = 4096
+
+
+def parse_action(action):
+    """
+    Check an action sent by a client and turn it into the dict GameSession.take_turn expects. Only moves (one step in
+    any direction), pickups and rewinds are accepted - raises ValueError for anything else.
+    """
+    if not isinstance(action, dict) or len(action) != 1:
+        raise ValueError("An action must be a dict with one key")
+
+    if "move" in action:
+        move = action["move"]
+
+        if not (isinstance(move, list) and len(move) == 2 and all(type(step) is int and -1 <= step <= 1 for step in move)):
+            raise ValueError("move must be [dx, dy], each -1, 0 or 1")
+
+        return {"move": tuple(move)}
+
+    if "pickup" in action:
+        return {"pickup": True}
+
+    if "rewind" in action:
+        turns = action["rewind"]
+
+        if type(turns) is not int or turns < 1:
+            raise ValueError("rewind must be a number of turns")
+
+        return {"rewind": turns}
+
+    raise ValueError("Unknown action: {}".format(next(iter(action))))
+
+
+class HostedSession:
+    """
+    One player's game on the server: a GameSession with its own MessageLog, Hud and headless consoles, and a
+    FrameDeltaEncoder which remembers what the client was last sent, so each step only sends the cells that changed.
+
+    Each session has its own combat_rng, so one player's rolls (or a rewind winding them back) never change another's.
+    The level comes from the map generator's module level PRNG, shared with every other session, so a level is not
+    reproducible from its seed alone while other sessions are being generated.
+
+    ATTRIBUTES:
+        - id (int): the session number, unique on its server.
+        - session (GameSession): the game itself.
+        - turns (int): actions taken, including ones which didn't use up a turn.
+        - turn_seconds (float): CPU time spent taking turns and rendering them, for the per-turn cost.
+        - bytes_sent (int): how much has been sent to the client.
+    """
+    def __init__(self, session_id, screen_layout, seed=None, level_cache=None, rewind_turns=0):
+        self.id = session_id
+        self.screen_layout = screen_layout
+
+        self.message_log = MessageLog(0, 0, *screen_layout["message_log"])
+        self.hud = Hud(screen_layout["hud"][0], *screen_layout["right"])
+        self.consoles = make_consoles(screen_layout, headless=True)
+        self.encoder = FrameDeltaEncoder()
+
+        # No level export - a long running server would fill its working directory with <seed>.txt files.
+        self.session = GameSession(*screen_layout["map"], seed=seed, message_log=self.message_log,
+                                   level_cache=level_cache, save_map=False)
+
+        if rewind_turns:
+            self.session.rewind = RewindBuffer(rewind_turns)
+
+        self.turns = 0
+        self.turn_seconds = 0.0
+        self.bytes_sent = 0
+
+    def step(self, action=None):
+        """
+        Take the action (if there is one), draw the result and return the frame message for the client, holding only
+        the cells which changed since the last one.
+        """
+        start = time.perf_counter()
+        session = self.session
+
+        if action is not None:
+            session.take_turn(action)
+            self.turns += 1
+
+        fov_recompute = session.update_fov()
+
+        with phase_timer.phase("frame"):
+            render_all(session.game_map, self.consoles, session.player, session.entities, fov_recompute,
+                       self.screen_layout, self.message_log, (0, 0), self.hud)
+
+        with phase_timer.phase("encode"):
+            cells = self.encoder.get_delta(self.consoles[0])
+
+        self.turn_seconds += time.perf_counter() - start
+
+        return {"type": "frame", "turn": session.turn, "game_state": session.game_state.name, "cells": cells}
+
+    def get_stats(self):
+        return {"session": self.id, "turns": self.turns, "bytes_sent": self.bytes_sent,
+                "ms_per_turn": self.turn_seconds * 1000 / self.turns if self.turns else 0.0}
+
+
+class GameServer:
+    """
+    Hosts many independent games in one process, over a local TCP socket.
+
+    Each connection gets its own HostedSession. Messages both ways are JSON objects, one per line:
+
+        client -> server:
+            {"type": "join", "seed": 1234}          - must come first. seed may be left out (or null) for a random one.
+            {"type": "action", "action": {...}}     - {"move": [dx, dy]}, {"pickup": true} or {"rewind": turns}.
+            {"type": "stats"}                       - ask for this session's stats.
+            {"type": "quit"}
+
+        server -> client:
+            {"type": "welcome", "session": id, "seed": seed, "screen": [width, height]}
+            {"type": "frame", "turn": turn, "game_state": name, "cells": {...} or null}
+                - sent after the welcome (every cell) and after every action (only the cells which changed, see
+                  FrameDeltaEncoder). Apply the cells to a FrameBuffer of the screen size with apply_delta.
+            {"type": "stats", ...}
+            {"type": "error", "message": text}      - for a bad message. The connection stays open.
+
+    Everything runs on one asyncio event loop, so one turn is taken at a time and nothing in the game needs locking.
+    The exception is setting up a new session, which generates a level (tens to hundreds of milliseconds): that runs
+    on a single worker thread, so players already connected keep playing, and two levels are never generated at once
+    (the generator's PRNG is shared). Sharing a LevelCache between sessions makes joining a seed which has been played
+    before cheap.
+
+    ATTRIBUTES:
+        - sessions (dict): session id -> HostedSession, for every connected client.
+        - max_sessions (int): clients beyond this many are turned away.
+        - finished_turns, finished_turn_seconds: the turns and turn_seconds of every session which has ended.
+    """
+    def __init__(self, screen_layout, host="127.0.0.1", port=8765, level_cache=None, max_sessions=256, rewind_turns=0):
+        self.screen_layout = screen_layout
+        self.host = host
+        self.port = port
+        self.level_cache = level_cache
+        self.max_sessions = max_sessions
+        self.rewind_turns = rewind_turns
+
+        self.sessions = dict()
+        self.finished_turns = 0
+        self.finished_turn_seconds = 0.0
+        self._next_id = 1
+        self._generator = ThreadPoolExecutor(max_workers=1)
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self.handle_client, self.host, self.port, limit=MAX_MESSAGE_BYTES)
+
+        # With port 0 the OS picks one, so read back the one actually used.
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        await self.start()
+
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+        self._generator.shutdown(wait=False)
+
+    @staticmethod
+    async def send(writer, message, hosted=None):
+        data = (json.dumps(message, separators=(",", ":")) + "\n").encode()
+        writer.write(data)
+        await writer.drain()
+
+        if hosted is not None:
+            hosted.bytes_sent += len(data)
+
+    @staticmethod
+    async def receive(reader):
+        """
+        The next message from a client, or None if it has gone (or sent something which isn't a JSON object).
+        """
+        try:
+            line = await reader.readline()
+        except (ValueError, ConnectionError):
+            return None
+
+        if not line:
+            return None
+
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return {"type": None}
+
+        return message if isinstance(message, dict) else {"type": None}
+
+    async def handle_client(self, reader, writer):
+        hosted = None
+
+        try:
+            message = await self.receive(reader)
+
+            if message is None or message.get("type") != "join":
+                await self.send(writer, {"type": "error", "message": "Expected a join message"})
+                return
+
+            if len(self.sessions) >= self.max_sessions:
+                await self.send(writer, {"type": "error", "message": "Server full"})
+                return
+
+            seed = message.get("seed")
+            if seed is not None and type(seed) is not int:
+                await self.send(writer, {"type": "error", "message": "seed must be an integer"})
+                return
+
+            session_id = self._next_id
+            self._next_id += 1
+
+            loop = asyncio.get_running_loop()
+            hosted = await loop.run_in_executor(self._generator, HostedSession, session_id, self.screen_layout, seed,
+                                                self.level_cache, self.rewind_turns)
+            self.sessions[session_id] = hosted
+
+            await self.send(writer, {"type": "welcome", "session": session_id, "seed": hosted.session.seed,
+                                     "screen": list(self.screen_layout["screen"])}, hosted)
+            await self.send(writer, hosted.step(), hosted)
+
+            while True:
+                message = await self.receive(reader)
+
+                if message is None or message.get("type") == "quit":
+                    break
+
+                if message.get("type") == "action":
+                    try:
+                        action = parse_action(message.get("action"))
+                    except ValueError as error:
+                        await self.send(writer, {"type": "error", "message": str(error)}, hosted)
+                        continue
+
+                    # Nothing but a rewind does anything once the player is dead.
+                    if hosted.session.game_state == GameStates.PLAYER_DEAD and "rewind" not in action:
+                        action = None
+
+                    await self.send(writer, hosted.step(action), hosted)
+
+                elif message.get("type") == "stats":
+                    await self.send(writer, dict(hosted.get_stats(), type="stats"), hosted)
+
+                else:
+                    await self.send(writer, {"type": "error", "message": "Unknown message type"}, hosted)
+
+        except ConnectionError:
+            pass
+
+        finally:
+            if hosted is not None:
+                self.sessions.pop(hosted.id, None)
+                self.finished_turns += hosted.turns
+                self.finished_turn_seconds += hosted.turn_seconds
+
+            writer.close()
+
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+if __name__ == "__main__":
+    # Usage: python server_functions.py [port]
+    from engine import get_screen_layout
+
+    server = GameServer(get_screen_layout(), port=int(sys.argv[1]) if len(sys.argv) > 1 else 8765,
+                        level_cache=LevelCache(".level_cache"))
+
+    print("Serving on {}:{}".format(server.host, server.port))
+
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,257 @@
+import random
+import map_functions
+from game_states import GameStates
+from map_functions import GameMap, Button, dungeon_generator_complex
+from entity_classes import Monster, Player, Pickup, EntityList, get_blocking_entities_at_location, stats
+from render_functions import RenderOrder
+from lighting_functions import LightMap, LightSource
+from perf_functions import phase_timer
+from event_functions import EventBus, MessageEvent, DeathEvent, PickupEvent, DoorOpenEvent
+from death_functions import kill_player, kill_monster
+from config import colours
+
+
+class GameSession:
+    """
+    One game in progress: the map, the player and entities, and the turn logic which used to live inline in
+    engine.main. Nothing here draws anything or reads the keyboard, so the same session can be driven by the engine,
+    a replay (replay_functions) or a bot (bot_functions), with or without a window.
+
+    Each step of the game is:
+        session.update_fov()        - recompute the FOV if the last turn changed anything.
+        session.take_turn(action)   - the player's action (a dict from handle_keys), then every monster's turn.
+
+    The FOV is updated before the turn, as the engine does before drawing, as monsters only act if they are in view.
+
+    ATTRIBUTES:
+        - seed (int): the map seed the level was generated from.
+        - combat_rng (random.Random): the random numbers for this game's combat rolls. Each session has its own, kept
+          apart from the map generator's PRNG, so sessions running side by side (see server_functions) never share
+          rolls, and a recording, save or rewind can save and restore its state without touching any other game.
+        - combat_state (tuple): the state of combat_rng at the start of the game.
+        - game_state (GameStates): whose turn it is, or PLAYER_DEAD.
+        - fov_recompute (bool): True when the player's view needs recomputing before the next turn.
+        - turn (int): the number of player turns taken.
+        - from_cache (bool): True if the level was loaded from the level cache rather than generated.
+        - generator_parameters (dict): the arguments the level was generated with (None for a session from_state).
+        - rewind (RewindBuffer): set to a RewindBuffer (see rewind_functions) to record every turn, so that a
+          {'rewind': turns} action can undo them. None (the default) records nothing.
+
+    INIT:
+        - seed: map seed - None picks a random one.
+        - combat_state: a combat_rng state to start from (e.g. from a recording) - None starts from a random one.
+        - message_log: MessageLog for game messages. With None no messages are created at all (see EventBus).
+        - level_cache: LevelCache to load the level from, if this seed has been generated before (see cache_functions).
+        - save_map: write a newly generated level to <seed>.txt in the working directory. Off for anything which makes
+          lots of sessions (the server, bots), so they don't fill the directory with level files.
+    """
+    def __init__(self, map_width=150, map_height=150, seed=None, combat_state=None, message_log=None, level_cache=None,
+                 fov_algorithm="BASIC", fov_radius=10, fov_light_walls=True, save_map=True):
+        self.seed = map_functions.set_seed(seed)
+
+        # Player & entities - set up player stats, then put in holding list for all game entities.
+        player_stats = stats(hp=200, arm=50, mp=25, str=4, dex=2)
+        player = Player(5, 5, "Bolly Angerfist", "@", (255, 255, 255), player_stats)
+        entities = EntityList([player])
+
+        # Map - create the map object, then load the level from the cache if it has been generated before, or run the
+        # function to generate game world (and cache the result).
+        game_map = GameMap(map_width, map_height)
+        self.generator_parameters = dict(max_monsters_per_room=3, max_items_per_room=2, num_rooms=15, intersect_chance=0,
+                                         cross_link_chance=30)
+
+        cache_key = level_cache.get_key(self.seed, map_width, map_height, self.generator_parameters) if level_cache else None
+        self.from_cache = bool(level_cache) and level_cache.load(cache_key, game_map, player, entities)
+
+        if not self.from_cache:
+            dungeon_generator_complex(game_map, player, entities, save_map=save_map, **self.generator_parameters)
+
+            if level_cache:
+                level_cache.save(cache_key, game_map, player, entities)
+
+        self._set_up(game_map, player, entities, combat_state, message_log, fov_algorithm, fov_radius, fov_light_walls)
+
+    @classmethod
+    def from_state(cls, game_map, player, entities, seed, turn=0, game_state=GameStates.PLAYER_TURN, combat_state=None,
+                   message_log=None, fov_algorithm="BASIC", fov_radius=10, fov_light_walls=True):
+        """
+        Build a session around a game which is already under way - a map, player and entities put back together from
+        a save (see save_functions) - instead of generating a new level. combat_state is where its combat_rng carries
+        on from.
+        """
+        session = cls.__new__(cls)
+        session.seed = seed
+        session.generator_parameters = None
+        session.from_cache = False
+
+        session._set_up(game_map, player, entities, combat_state, message_log, fov_algorithm, fov_radius,
+                        fov_light_walls)
+        session.turn = turn
+        session.game_state = game_state
+
+        return session
+
+    def _set_up(self, game_map, player, entities, combat_state, message_log, fov_algorithm, fov_radius,
+                fov_light_walls):
+        self.game_map = game_map
+        self.player = player
+        self.entities = entities
+        self.message_log = message_log
+
+        self.combat_rng = random.Random()
+        if combat_state is not None:
+            self.combat_rng.setstate(combat_state)
+
+        self.combat_state = self.combat_rng.getstate()
+
+        self.fov_algorithm = fov_algorithm
+        self.fov_radius = fov_radius
+        self.fov_light_walls = fov_light_walls
+        self.fov_recompute = True
+
+        self.game_state = GameStates.PLAYER_TURN
+        self.turn = 0
+        self.rewind = None
+
+        # Lighting - the player carries a warm lantern which lights up to the edge of their FOV.
+        self.player.light = LightSource(radius=fov_radius, colour=(255, 230, 190))
+        self.game_map.light_map = LightMap(self.game_map)
+        self.game_map.light_map.add_source(self.player)
+
+        # Actions emit events into the bus, and these handlers decide what happens as a result when it is dispatched.
+        self.events = EventBus()
+        self.events.register(DeathEvent, self.on_death)
+        self.events.register(PickupEvent, self.on_pickup)
+        self.events.register(DoorOpenEvent, self.on_door_open)
+
+        if message_log is not None:
+            self.events.register(MessageEvent, self.on_message)
+
+    def on_message(self, event):
+        self.message_log.add_message(event.message)
+
+    def on_death(self, event):
+        if event.entity == self.player:
+            message, self.game_state = kill_player(event.entity)
+        else:
+            message = kill_monster(event.entity, self.entities, self.game_map)
+
+        self.events.emit(MessageEvent, message)
+
+    def on_pickup(self, event):
+        self.fov_recompute = True
+
+    def on_door_open(self, event):
+        game_map = self.game_map
+        door = game_map.door[event.x][event.y]
+
+        # Doors without a button open when touched. If the tile is a Button, activate it.
+        if not door.button:
+            game_map.open_door(event.x, event.y)
+
+        if isinstance(door, Button):
+            door.open_door(game_map)
+
+        self.fov_recompute = True
+
+    def update_fov(self):
+        """
+        Recompute the FOV around the player if the last turn asked for it. Returns True if it was recomputed.
+        """
+        if not self.fov_recompute:
+            return False
+
+        with phase_timer.phase("fov"):
+            self.game_map.compute_fov(self.player.x, self.player.y, fov=self.fov_algorithm, radius=self.fov_radius,
+                                      light_walls=self.fov_light_walls, sphere=True)
+
+        self.fov_recompute = False
+        return True
+
+    def take_turn(self, action):
+        """
+        Carry out the player's action, then (if it used up their turn) let every monster act.
+        Actions other than move, pickup and rewind are ignored - menus and the like are up to whoever drives the session.
+
+        With a RewindBuffer in self.rewind each turn is recorded, and {'rewind': turns} undoes that many of them
+        (even from PLAYER_DEAD).
+        """
+        rewind_turns = action.get('rewind')
+
+        if rewind_turns:
+            if self.rewind is not None:
+                undone = self.rewind.rewind(self, rewind_turns)
+                self.events.message("Rewound {} turns.", colours["light_yellow"], undone)
+                self.events.dispatch()
+
+            return
+
+        if self.rewind is None:
+            self._take_turn(action)
+            return
+
+        with self.rewind.record_turn(self):
+            self._take_turn(action)
+
+    def _take_turn(self, action):
+        move = action.get('move')
+        pickup = action.get('pickup')
+
+        player, entities, game_map, events = self.player, self.entities, self.game_map, self.events
+
+        '''PLAYER TURN START'''
+        with phase_timer.phase("player_turn"):
+            # Check for items - only the player's own tile, via the EntityList's position index. It is copied, as a
+            # pickup which gets used up is removed from it.
+            if pickup and self.game_state == GameStates.PLAYER_TURN:
+                for entity in tuple(entities.at(player.x, player.y)):
+                    if isinstance(entity, Pickup):
+                        entity.activate(player, entities, events)
+                        self.game_state = GameStates.ENEMY_TURN
+
+            # If it's a movement event and it's the player's turn, move the player.
+            if move and self.game_state == GameStates.PLAYER_TURN:
+                dx, dy = move
+                destination_x = player.x + dx
+                destination_y = player.y + dy
+
+                # Only move the player if its a walkable tile on the map.
+                if game_map.walkable[destination_x, destination_y]:
+                    target = get_blocking_entities_at_location(entities, destination_x, destination_y)
+
+                    if target:
+                        if isinstance(target, Monster):
+                            player.attack(target, events, self.combat_rng)
+                            self.fov_recompute = True
+
+                    else:
+                        player.move(dx, dy)
+                        self.fov_recompute = True
+
+                # If the tile is a door and not open, try to open it (see on_door_open).
+                elif game_map.is_door[destination_x, destination_y] and not game_map.door[destination_x][destination_y].is_open:
+                    events.emit(DoorOpenEvent, destination_x, destination_y)
+
+                self.game_state = GameStates.ENEMY_TURN
+
+            events.dispatch()
+        '''PLAYER TURN END'''
+
+        '''ENEMY TURN START'''
+        # If this is the Enemy's turn, iterate through the entities list and let the Monster objects take an action.
+        if self.game_state == GameStates.ENEMY_TURN:
+            self.turn += 1
+
+            with phase_timer.phase("enemy_turn"):
+                for entity in entities.get_by_render_order(RenderOrder.ACTOR):
+                    if isinstance(entity, Monster) and not entity.dead:
+                        entity.take_turn(player, game_map, entities, events, self.combat_rng)
+                        events.dispatch()
+                        self.fov_recompute = True
+
+                        if self.game_state == GameStates.PLAYER_DEAD:
+                            break
+
+                else:
+                    self.game_state = GameStates.PLAYER_TURN
+        '''ENEMY TURN END'''
@@ -0,0 +1,271 @@
+import queue
+import threading
+from collections import namedtuple
+from render_functions import RenderOrder, get_map_view
+from message_functions import Message
+from perf_functions import phase_timer
+from config import colours
+
+
+class EntityView(namedtuple("EntityView", "id name x y char colour hp max_hp arm max_arm mp max_mp")):
+    """
+    A copy of what the renderer needs from an actor (the player, or a monster in the visible list) at the end of a
+    turn. It has the same attribute names as the entity, so the HUD can draw from either.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def of(cls, entity):
+        return cls(entity.id, entity.name, int(entity.x), int(entity.y), entity.char, entity.colour, entity.hp,
+                   entity.max_hp, entity.arm, entity.max_arm, entity.mp, entity.max_mp)
+
+
+class TurnSnapshot(namedtuple("TurnSnapshot", "turn game_state width height view_port chars fg to_draw entities "
+                                              "player visible_monsters messages")):
+    """
+    Everything the renderer needs to draw the game as it was at the end of one turn, copied out of the session so it
+    can be drawn on another thread while the next turn is being taken. Nothing in it is changed after it is built:
+    the map arrays are made read only, and the rest are tuples.
+
+    It has a width and height (the map's), so it can stand in for the game map in get_view_port_position and
+    Hud.get_hovered.
+
+    ATTRIBUTES:
+        - turn (int), game_state (GameStates): the session's turn counter and game state.
+        - width, height (int): the size of the map.
+        - view_port (tuple): (x1, y1, x2, y2) of the view port on the map.
+        - chars, fg, to_draw (np.array): the map under the view port, as returned by render_functions.get_map_view.
+        - entities (tuple): (x, y, char, colour) of each entity in view, in render order.
+        - player (EntityView): the player, for the HUD.
+        - visible_monsters (tuple): an EntityView for each monster in view, for the right panel.
+        - messages (tuple): (text, colour) of each message added since the snapshot before, oldest first.
+    """
+    __slots__ = ()
+
+
+def build_snapshot(session, view_port_width, view_port_height, messages=(), previous=None, fov_recompute=True):
+    """
+    Copy the state of the session into a TurnSnapshot. Called on the thread which runs the session, between turns,
+    after session.update_fov().
+
+    The map is only worked out again if the FOV was recomputed (the same rule render_all uses to redraw it) - otherwise
+    the previous snapshot's arrays are shared, which is safe as nothing writes to them.
+
+    :param messages: the (text, colour) tuples for the new messages.
+    :param previous: the last snapshot built for this session, if any.
+    :param fov_recompute: what session.update_fov() returned.
+    """
+    game_map, player = session.game_map, session.player
+
+    if previous is None or fov_recompute:
+        if game_map.light_map is not None:
+            with phase_timer.phase("lighting"):
+                game_map.light_map.update()  # Only recomposites if a light moved or a door opened.
+
+        with phase_timer.phase("snapshot_map"):
+            view_port, chars, fg, to_draw = get_map_view(game_map, player, view_port_width, view_port_height)
+
+            for array in (chars, fg, to_draw):
+                array.flags.writeable = False
+    else:
+        view_port, chars, fg, to_draw = previous.view_port, previous.chars, previous.fg, previous.to_draw
+
+    with phase_timer.phase("snapshot_entities"):
+        in_view = session.entities.get_in_view(game_map.fov, view_port)
+
+        entities = tuple((int(entity.x), int(entity.y), entity.char, entity.colour) for entity in in_view)
+        visible_monsters = tuple(EntityView.of(entity) for entity in in_view
+                                 if entity is not player and entity.render_order == RenderOrder.ACTOR)
+
+    return TurnSnapshot(session.turn, session.game_state, game_map.width, game_map.height, view_port, chars, fg,
+                        to_draw, entities, EntityView.of(player), visible_monsters, messages)
+
+
+class DoubleBuffer:
+    """
+    The hand over point between the simulation thread, which publishes a TurnSnapshot at the end of every turn, and
+    the render loop, which takes the newest one whenever it is ready to draw.
+
+    There are two slots: front, the snapshot the renderer took last (and is drawing from), and a back slot holding the
+    newest one published and not yet taken. Publishing replaces the back snapshot, so if turns come faster than frames
+    the renderer skips straight to the newest - only the messages of a skipped snapshot are carried over, so none go
+    missing from the log. The lock is only held for the swap, so neither side ever waits on the other's work.
+
+    ATTRIBUTES:
+        - front (TurnSnapshot): the snapshot last taken, None until the first one.
+        - published (int): snapshots published.
+        - skipped (int): snapshots replaced before the renderer took them.
+    """
+    def __init__(self):
+        self.front = None
+        self.published = 0
+        self.skipped = 0
+
+        self._back = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def publish(self, snapshot):
+        with self._lock:
+            if self._back is not None:
+                snapshot = snapshot._replace(messages=self._back.messages + snapshot.messages)
+                self.skipped += 1
+
+            self._back = snapshot
+            self.published += 1
+            self._ready.set()
+
+    def take(self):
+        """
+        The snapshot published since the last take, or None if there isn't a new one. It becomes the front snapshot.
+        """
+        with self._lock:
+            snapshot, self._back = self._back, None
+            self._ready.clear()
+
+        if snapshot is not None:
+            self.front = snapshot
+
+        return snapshot
+
+    def wait(self, timeout=None):
+        """
+        Block until there is a snapshot to take (or the timeout runs out). Returns True if there is one.
+        """
+        return self._ready.wait(timeout)
+
+
+class SimulationThread(threading.Thread):
+    """
+    Runs a GameSession on its own thread, so the window keeps handling input and drawing frames at a steady rate
+    however long a turn takes (a big fight, lighting being recomposited, an autosave writing its base).
+
+    The render loop hands actions over with submit(). For each one this thread records it, takes the turn, autosaves,
+    recomputes the FOV and publishes a TurnSnapshot to the DoubleBuffer. Nothing else touches the session (or the
+    recorder and saver) while the thread is running - read the snapshots instead.
+
+    The profiler is started and stopped here too, so cProfile sees the turns being taken. Its messages go into the
+    session's message log, and reach the screen through the snapshots like any other.
+
+    ATTRIBUTES:
+        - session (GameSession): the game being run.
+        - buffer (DoubleBuffer): where the snapshots are published.
+        - snapshot (TurnSnapshot): the last one published.
+        - error (Exception): what stopped the thread, if it failed. The render loop should check this.
+
+    INIT:
+        - recorder, saver, profiler: a replay_functions.Recorder, save_functions.SaveManager and perf_functions.Profiler
+          to use, or None.
+        - max_queued: how many actions can be waiting for their turn. Actions submitted beyond this (keys held down
+          while a slow turn runs) are dropped, so the player doesn't carry on moving long after letting go.
+    """
+    def __init__(self, session, view_port_width, view_port_height, buffer=None, recorder=None, saver=None,
+                 profiler=None, profile_on_start=False, max_queued=8):
+        super().__init__(name="simulation", daemon=True)
+
+        self.session = session
+        self.view_port_width = view_port_width
+        self.view_port_height = view_port_height
+        self.buffer = buffer or DoubleBuffer()
+        self.recorder = recorder
+        self.saver = saver
+        self.profiler = profiler
+        self.profile_on_start = profile_on_start
+        self.max_queued = max_queued
+
+        self.snapshot = None
+        self.error = None
+
+        self._actions = queue.Queue()
+
+        # Every message already in the log goes into the first snapshot.
+        message_log = session.message_log
+        self._messages_sent = message_log.added - len(message_log) if message_log is not None else 0
+
+    def submit(self, action):
+        """
+        Queue an action for the player's next turn. Returns False if it was dropped as too many are waiting.
+        """
+        if self._actions.qsize() >= self.max_queued:
+            return False
+
+        self._actions.put(action)
+        return True
+
+    def stop(self):
+        """
+        Finish the actions already queued, then stop the thread and wait for it.
+        """
+        self._actions.put(None)
+        self.join()
+
+    def run(self):
+        try:
+            if self.profile_on_start and self.profiler:
+                self.profiler.start()
+
+            self.publish()
+
+            while True:
+                action = self._actions.get()
+
+                if action is None:
+                    break
+
+                self.handle(action)
+                self.publish()
+
+        except Exception as error:
+            self.error = error
+
+        finally:
+            if self.profiler:
+                self.profiler.stop()
+
+    def handle(self, action):
+        session = self.session
+
+        # Starting or stopping the profiler doesn't take up the player's turn.
+        if action.get('toggle_profiler'):
+            if self.profiler:
+                self.toggle_profiler()
+
+            return
+
+        # The player's turn, then the enemies' turn - see GameSession.take_turn.
+        if self.recorder:
+            self.recorder.record(action)
+
+        session.take_turn(action)
+
+        if self.saver:
+            self.saver.save(session)
+
+    def toggle_profiler(self):
+        filenames = self.profiler.toggle()
+
+        if filenames:
+            message = Message("Profile saved: {}", colours["light_yellow"], ", ".join(filenames))
+        else:
+            message = Message("Profiling started.", colours["light_yellow"])
+
+        if self.session.message_log is not None:
+            self.session.message_log.add_message(message)
+
+    def get_new_messages(self):
+        message_log = self.session.message_log
+
+        if message_log is None:
+            return ()
+
+        new = min(message_log.added - self._messages_sent, len(message_log))
+        self._messages_sent = message_log.added
+
+        return tuple((message.text, message.colour) for message in message_log.get_newest(new)) if new else ()
+
+    def publish(self):
+        fov_recompute = self.session.update_fov()
+
+        self.snapshot = build_snapshot(self.session, self.view_port_width, self.view_port_height,
+                                       self.get_new_messages(), self.snapshot, fov_recompute)
+        self.buffer.publish(self.snapshot)
@@ -0,0 +1,98 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from benchmark_functions import median, run_cli
+
+
+SEED = 888727
+REPEATS = 5
+
+
+def time_import(module, repeats=REPEATS):
+    """
+    Median ms to import a module in a fresh interpreter, less the time to start an interpreter which imports nothing.
+    """
+    def run(code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, stdout=subprocess.DEVNULL)
+        return time.perf_counter() - start
+
+    baseline = median([run("pass") for i in range(repeats)])
+    imported = median([run("import " + module) for i in range(repeats)])
+
+    return (imported - baseline) * 1000
+
+
+def time_startup(level_cache_directory):
+    """
+    Everything engine.main does before the first frame is on screen, minus opening the window: create the consoles,
+    set up the session (generating or loading the level), and draw the first frame. Returns {step: ms}.
+    """
+    from engine import get_screen_layout
+    from render_functions import render_all
+    from render_targets import make_consoles
+    from hud_functions import Hud
+    from message_functions import MessageLog
+    from session_functions import GameSession
+    from cache_functions import LevelCache
+
+    screen_layout = get_screen_layout()
+    result = dict()
+
+    start = time.perf_counter()
+    all_consoles = make_consoles(screen_layout, headless=True)
+    message_log = MessageLog(0, 0, *screen_layout["message_log"])
+    hud = Hud(screen_layout["hud"][0], *screen_layout["right"])
+    result["consoles"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    session = GameSession(*screen_layout["map"], seed=SEED, message_log=message_log,
+                          level_cache=LevelCache(level_cache_directory))
+    result["session"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    fov_recompute = session.update_fov()
+    render_all(session.game_map, all_consoles, session.player, session.entities, fov_recompute, screen_layout,
+               message_log, (0, 0), hud)
+    result["first_frame"] = (time.perf_counter() - start) * 1000
+
+    result["total"] = result["consoles"] + result["session"] + result["first_frame"]
+
+    return result
+
+
+def run_suite(quick=False):
+    """
+    Cold start (nothing cached, so the level is generated) and warm start (the level comes from the level cache), plus
+    the time to import the engine. The level dump and cache are written to a temporary directory.
+    """
+    repeats = 1 if quick else REPEATS
+    results = {"import": {"engine": time_import("engine", repeats)}}
+
+    working_directory = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+
+        try:
+            cold_runs, warm_runs = [], []
+
+            for i in range(repeats):
+                cache_directory = os.path.join(directory, "cache_{}".format(i))
+                cold_runs.append(time_startup(cache_directory))
+                warm_runs.append(time_startup(cache_directory))
+
+        finally:
+            os.chdir(working_directory)
+
+    for name, runs in (("cold", cold_runs), ("warm", warm_runs)):
+        results[name] = {step: median([run[step] for run in runs]) for step in runs[0]}
+
+    return results
+
+
+if __name__ == "__main__":
+    # Usage: python startup_benchmark.py [--quick] [--save baseline.json] [--compare baseline.json]
+    run_cli(run_suite, sys.argv)
@@ -0,0 +1,61 @@
+import os
+import sys
+import random
+import numpy as np
+import pytest
+
+# The game's modules live in the root of the repository rather than in a package, so put it on the path for the tests.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_functions import MessageLog
+from session_functions import GameSession
+from save_functions import get_entity_record
+from render_functions import RenderOrder
+
+
+# A level with monsters, items and doors near the start, so a few turns are enough to fight, pick up and open things.
+SEED = 888727
+
+STATE_ARRAYS = ("explored", "transparent", "walkable", "is_door", "r", "g", "b", "light_rgb", "dark_rgb")
+
+
+def make_message_log():
+    return MessageLog(0, 0, 40, 8)
+
+
+def get_state(session):
+    """
+    Everything about a game which saving, loading or rewinding it should bring back, as a dict which can be compared
+    with ==: one entry per map array, then the doors, static layer, entities (with the EntityList's indexes), messages,
+    turn, game state and combat_rng state.
+    """
+    game_map, entities, layer = session.game_map, session.entities, session.game_map.static_layer
+
+    # Entities are told apart by their place in the list, as a loaded game has new objects (and Entity.ids).
+    index = {entity.id: number for number, entity in enumerate(entities)}
+
+    state = {name: np.array(getattr(game_map, name)).tobytes() for name in STATE_ARRAYS}
+    state.update({
+        "doors": sorted((x, y, door.is_open) for x, column in enumerate(game_map.door) for y, door in enumerate(column)
+                        if door),
+        "static": (layer.char.tobytes(), layer.colour.tobytes(), sorted((int(x), int(y), name)
+                                                                        for (x, y), name in layer.names.items())),
+        "entities": [get_entity_record(entity) for entity in entities],
+        "actors": [index[entity.id] for entity in entities.get_by_render_order(RenderOrder.ACTOR)],
+        "cells": sorted((tuple(map(int, cell)), tuple(index[entity.id] for entity in cell_entities))
+                        for cell, cell_entities in entities.cells.items()),
+        "messages": [(message.text, tuple(message.colour)) for message in
+                     session.message_log.get_newest(len(session.message_log))] if session.message_log else None,
+        "turn": session.turn,
+        "game_state": session.game_state,
+        "combat_state": session.combat_rng.getstate(),
+    })
+
+    return state
+
+
+@pytest.fixture
+def session():
+    """ A game on the SEED level, with a message log and repeatable combat rolls. """
+    return GameSession(seed=SEED, combat_state=random.Random(1).getstate(), message_log=make_message_log(),
+                       save_map=False)
@@ -0,0 +1,13 @@
+from bot_functions import ExploreBot, run_bot
+from perf_functions import phase_timer
+from conftest import SEED
+
+
+def test_run_bot_puts_the_phase_timer_back():
+    phase_timer.enabled = False
+
+    result = run_bot(ExploreBot(1), seed=SEED, max_turns=20)
+
+    assert result["turns"] == 20
+    assert "enemy_turn" in result["phases"]
+    assert not phase_timer.enabled
@@ -0,0 +1,102 @@
+import os
+import numpy as np
+import pytest
+from cache_functions import LevelCache
+from map_functions import GameMap, MapSnapshot
+from entity_classes import Player, EntityList, stats
+from session_functions import GameSession
+from conftest import SEED
+
+
+def get_level(session):
+    """ Everything the level cache should bring back, in a form which can be compared with ==. """
+    game_map = session.game_map
+    arrays = {name: np.array(getattr(game_map, name)) for name in MapSnapshot.ARRAYS}
+    doors = {(x, y): (type(door).__name__, vars(door)) for x, column in enumerate(game_map.door)
+             for y, door in enumerate(column) if door}
+    entities = [(type(entity).__name__, int(entity.x), int(entity.y), entity.name, entity.char, tuple(entity.colour),
+                 entity.hp, entity.arm, entity.mp, getattr(entity, "str", None), getattr(entity, "dex", None))
+                for entity in session.entities]
+
+    return arrays, doors, entities
+
+
+def assert_same_level(a, b):
+    arrays_a, doors_a, entities_a = get_level(a)
+    arrays_b, doors_b, entities_b = get_level(b)
+
+    for name in MapSnapshot.ARRAYS:
+        assert np.array_equal(arrays_a[name], arrays_b[name]), name
+
+    assert doors_a == doors_b
+    assert entities_a == entities_b
+
+
+def make_session(level_cache=None):
+    return GameSession(seed=SEED, level_cache=level_cache, save_map=False)
+
+
+def get_cache_filename(level_cache, session):
+    key = level_cache.get_key(SEED, session.game_map.width, session.game_map.height, session.generator_parameters)
+    return level_cache.get_filename(key)
+
+
+def test_cached_level_is_the_generated_level(tmp_path):
+    level_cache = LevelCache(str(tmp_path))
+
+    generated = make_session(level_cache)
+    assert not generated.from_cache
+    assert os.path.exists(get_cache_filename(level_cache, generated))
+
+    loaded = make_session(level_cache)
+    assert loaded.from_cache
+
+    assert_same_level(loaded, make_session())
+
+
+def test_different_parameters_are_different_keys():
+    parameters = dict(num_rooms=15)
+
+    assert LevelCache.get_key(1, 150, 150, parameters) != LevelCache.get_key(2, 150, 150, parameters)
+    assert LevelCache.get_key(1, 150, 150, parameters) != LevelCache.get_key(1, 150, 150, dict(num_rooms=16))
+    assert LevelCache.get_key(1, 150, 150, parameters) != LevelCache.get_key(1, 100, 150, parameters)
+
+
+def test_missing_level_is_a_miss(tmp_path):
+    game_map = GameMap(150, 150)
+    player = Player(5, 5, "Player", "@", (255, 255, 255), stats(hp=100, arm=10, mp=10, str=4, dex=2))
+
+    assert not LevelCache(str(tmp_path)).load("0" * 64, game_map, player, EntityList([player]))
+
+
+@pytest.mark.parametrize("damage", ["truncated", "garbage", "missing_array"])
+def test_unreadable_file_is_a_miss_and_is_deleted(tmp_path, damage):
+    level_cache = LevelCache(str(tmp_path))
+    filename = get_cache_filename(level_cache, make_session(level_cache))
+
+    if damage == "truncated":
+        with open(filename, "rb") as file:
+            data = file.read()
+
+        with open(filename, "wb") as file:
+            file.write(data[:len(data) // 2])
+
+    elif damage == "garbage":
+        with open(filename, "wb") as file:
+            file.write(b"not a level")
+
+    else:
+        # e.g. a file written by an older version of the cache, without every array.
+        np.savez(filename, level=np.array("{}"))
+
+    game_map = GameMap(150, 150)
+    player = Player(5, 5, "Player", "@", (255, 255, 255), stats(hp=100, arm=10, mp=10, str=4, dex=2))
+
+    assert not level_cache.load(os.path.basename(filename)[:-len(".npz")], game_map, player, EntityList([player]))
+    assert not os.path.exists(filename)
+
+    # The session generates the level again, and caches it again.
+    session = make_session(level_cache)
+    assert not session.from_cache
+    assert_same_level(session, make_session())
+    assert make_session(level_cache).from_cache
@@ -0,0 +1,99 @@
+import numpy as np
+from entity_classes import Player, Monster, Pickup, EntityList, stats
+from render_functions import RenderOrder
+
+
+def make_monster(x, y, name="Orc"):
+    return Monster(x, y, name, "o", (0, 255, 0), stats(hp=10, arm=0, mp=0, str=3, dex=1))
+
+
+def make_pickup(x, y):
+    return Pickup(x, y, "Health Potion", "!", (255, 0, 0), stats(hp=25, arm=0, mp=0, str=0, dex=0))
+
+
+def make_player(x=5, y=5):
+    return Player(x, y, "Player", "@", (255, 255, 255), stats(hp=100, arm=10, mp=10, str=4, dex=2))
+
+
+def test_behaves_like_a_list():
+    player, orc, potion = make_player(), make_monster(1, 1), make_pickup(2, 2)
+    entities = EntityList([player, orc, potion])
+
+    assert list(entities) == [player, orc, potion]
+    assert len(entities) == 3
+    assert orc in entities
+
+    # Removing while iterating is safe, as iteration walks a copy.
+    for entity in entities:
+        if entity is orc:
+            entities.remove(orc)
+
+    assert list(entities) == [player, potion]
+    assert orc not in entities
+    assert orc.collection is None
+
+
+def test_position_index_follows_moves():
+    orc = make_monster(1, 1)
+    entities = EntityList([orc])
+
+    orc.move(1, 0)
+
+    assert entities.at(1, 1) == ()
+    assert entities.at(2, 1) == [orc]
+
+    orc.y = 4
+    assert entities.at(2, 1) == ()
+    assert entities.at(2, 4) == [orc]
+
+    entities.remove(orc)
+    assert entities.cells == {}
+
+
+def test_several_entities_on_one_tile():
+    orc, potion = make_monster(3, 3), make_pickup(3, 3)
+    entities = EntityList([orc, potion])
+
+    assert entities.at(3, 3) == [orc, potion]
+
+    entities.remove(potion)
+    assert entities.at(3, 3) == [orc]
+
+
+def test_render_order_buckets():
+    player, orc, potion = make_player(), make_monster(1, 1), make_pickup(2, 2)
+    entities = EntityList([potion, orc, player])
+
+    assert entities.get_by_render_order(RenderOrder.ACTOR) == [orc, player]
+    assert entities.get_by_render_order(RenderOrder.ITEM) == [potion]
+
+    orc.render_order = RenderOrder.CORPSE
+
+    assert entities.get_by_render_order(RenderOrder.ACTOR) == [player]
+    assert entities.get_by_render_order(RenderOrder.CORPSE) == [orc]
+
+
+def test_get_in_view_filters_by_view_port_and_fov_in_render_order():
+    player, orc, potion, far_orc, hidden_orc = (make_player(5, 5), make_monster(6, 5), make_pickup(5, 6),
+                                                make_monster(50, 50), make_monster(7, 7))
+    entities = EntityList([player, orc, potion, far_orc, hidden_orc])
+
+    fov = np.zeros((100, 100), dtype=bool)
+    fov[0:10, 0:10] = True
+    fov[50, 50] = True
+    fov[7, 7] = False
+
+    assert entities.get_in_view(fov, (0, 0, 30, 30)) == [potion, player, orc]
+
+
+def test_set_order_puts_an_entity_back_in_its_old_place():
+    player, first, second = make_player(), make_monster(1, 1, "first"), make_monster(2, 2, "second")
+    entities = EntityList([player, first, second])
+    order = [entity.id for entity in entities]
+
+    entities.remove(first)
+    entities.append(first)
+    entities.set_order(order)
+
+    assert list(entities) == [player, first, second]
+    assert entities.get_by_render_order(RenderOrder.ACTOR) == [player, first, second]
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from map_functions import GameMap
+from entity_classes import Entity
+from lighting_functions import LightMap, LightSource
+
+
+WIDTH, HEIGHT = 30, 20
+
+
+@pytest.fixture
+def game_map():
+    game_map = GameMap(WIDTH, HEIGHT)
+    game_map.transparent[:] = True
+
+    return game_map
+
+
+def add_light(light_map, x, y, radius=10):
+    entity = Entity(x, y, "lantern", "*", (255, 255, 255))
+    entity.light = LightSource(radius)
+    light_map.add_source(entity)
+
+    return entity
+
+
+@pytest.mark.parametrize("x, y", [(0, 0), (WIDTH - 1, 0), (0, HEIGHT - 1), (WIDTH - 1, HEIGHT - 1), (WIDTH - 3, 9),
+                                  (12, HEIGHT - 2)])
+def test_light_next_to_the_edge_of_the_map(game_map, x, y):
+    light_map = LightMap(game_map)
+    add_light(light_map, x, y)
+    light_map.update()
+
+    assert (light_map.light[x, y] == 1.0).all()
+
+    # Nothing is lit beyond the radius - in particular, no light wraps round to the far side of the map.
+    xs, ys = np.meshgrid(np.arange(WIDTH), np.arange(HEIGHT), indexing="ij")
+    out_of_reach = (xs - x) ** 2 + (ys - y) ** 2 > 11 ** 2
+
+    assert (light_map.light[out_of_reach] == light_map.ambient).all()
+
+
+def test_lights_add_up_and_are_clipped(game_map):
+    light_map = LightMap(game_map)
+    add_light(light_map, 5, 5, radius=3)
+    add_light(light_map, 7, 5, radius=3)
+    light_map.update()
+
+    assert (light_map.light[6, 5] > light_map.ambient).all()
+    assert light_map.light.max() == 1.0
+    assert light_map.light[20, 15].tolist() == [light_map.ambient] * 3
+
+
+def test_moving_a_light(game_map):
+    light_map = LightMap(game_map)
+    entity = add_light(light_map, 2, 2, radius=3)
+    light_map.update()
+
+    entity.x, entity.y = WIDTH - 1, HEIGHT - 1
+    light_map.update()
+
+    assert light_map.light[2, 2].tolist() == [light_map.ambient] * 3
+    assert (light_map.light[WIDTH - 1, HEIGHT - 1] == 1.0).all()
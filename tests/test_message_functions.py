@@ -0,0 +1,98 @@
+from message_functions import Message, MessageLog
+
+
+def make_log(capacity=5, width=20, height=3):
+    return MessageLog(0, 0, width, height, capacity=capacity, greeting=None)
+
+
+def texts(messages):
+    return [message.text for message in messages]
+
+
+def test_message_is_formatted_lazily():
+    message = Message("{} attacks for {} damage", (255, 0, 0), "Orc", 3)
+
+    assert message.args == ("Orc", 3)
+    assert message.text == "Orc attacks for 3 damage"
+    assert message.args == ()
+
+
+def test_message_without_args_is_left_alone():
+    assert Message("100% {} braces", (255, 255, 255)).text == "100% {} braces"
+
+
+def test_ring_overwrites_the_oldest_message_once_full():
+    message_log = make_log(capacity=3)
+    added = message_log.added
+
+    for i in range(5):
+        message_log.add_message(Message("message {}", (255, 255, 255), i))
+
+    assert len(message_log) == 3
+    assert message_log.added == added + 5
+    assert texts(message_log.iter_messages()) == ["message 4", "message 3", "message 2"]
+    assert texts(message_log.get_newest(2)) == ["message 3", "message 4"]
+    assert texts(message_log.get_newest(10)) == ["message 2", "message 3", "message 4"]
+
+
+def test_visible_lines_are_the_newest_wrapped_lines():
+    message_log = make_log(capacity=10, width=10, height=2)
+    message_log.add_message(Message("first", (1, 1, 1)))
+    message_log.add_message(Message("second one wraps over", (2, 2, 2)))
+
+    assert message_log.get_visible_lines() == [("second one", (2, 2, 2)), ("wraps over", (2, 2, 2))]
+
+    message_log.scroll(1)
+    assert message_log.get_visible_lines() == [("first", (1, 1, 1)), ("second one", (2, 2, 2))]
+
+
+def test_scroll_is_clamped_to_the_stored_lines():
+    message_log = make_log(capacity=10, height=2)
+
+    for i in range(4):
+        message_log.add_message(Message("line {}", (255, 255, 255), i))
+
+    message_log.scroll(1)
+    assert message_log.scroll_offset == 1
+    assert [text for text, _ in message_log.get_visible_lines()] == ["line 1", "line 2"]
+
+    message_log.scroll(100)
+    assert message_log.scroll_offset == 2
+    assert [text for text, _ in message_log.get_visible_lines()] == ["line 0", "line 1"]
+
+    message_log.scroll(-100)
+    assert message_log.scroll_offset == 0
+
+
+def test_new_message_snaps_back_to_the_bottom():
+    message_log = make_log(capacity=10, height=2)
+
+    for i in range(4):
+        message_log.add_message(Message("line {}", (255, 255, 255), i))
+
+    message_log.scroll(2)
+    message_log.add_message(Message("newest", (255, 255, 255)))
+
+    assert message_log.scroll_offset == 0
+    assert message_log.get_visible_lines()[-1][0] == "newest"
+
+
+def test_needs_redraw_only_after_a_change():
+    message_log = make_log()
+    message_log.mark_drawn()
+    assert not message_log.needs_redraw
+
+    # Scrolling with nothing to scroll to changes nothing.
+    message_log.scroll(1)
+    assert not message_log.needs_redraw
+
+    message_log.add_message(Message("hello", (255, 255, 255)))
+    assert message_log.needs_redraw
+
+
+def test_greeting():
+    message_log = MessageLog(0, 0, 20, 3)
+    assert texts(message_log.get_newest(len(message_log))) == ["Where am I? I have to get out of here..."]
+
+    message_log = MessageLog(0, 0, 20, 3, greeting=None)
+    assert (len(message_log), message_log.added) == (0, 0)
@@ -0,0 +1,97 @@
+import json
+from render_targets import FrameBuffer, FrameCompositor, FrameDeltaEncoder
+
+
+def send(delta):
+    """ What the client gets: the delta after a trip through JSON. """
+    return json.loads(json.dumps(delta))
+
+
+def test_first_delta_holds_every_cell():
+    frame_buffer = FrameBuffer(12, 5)
+    frame_buffer.draw_str(1, 1, "Hello", fg=(200, 10, 10))
+
+    delta = FrameDeltaEncoder().get_delta(frame_buffer)
+
+    assert len(delta["x"]) == 12 * 5
+
+    copy = FrameBuffer(12, 5)
+    copy.clear(fg=(1, 2, 3), bg=(4, 5, 6))
+    copy.apply_delta(send(delta))
+
+    assert copy.get_frame() == frame_buffer.get_frame()
+
+
+def test_deltas_keep_a_copy_up_to_date():
+    frame_buffer, copy = FrameBuffer(20, 10), FrameBuffer(20, 10)
+    encoder = FrameDeltaEncoder()
+
+    copy.apply_delta(send(encoder.get_delta(frame_buffer)))
+
+    frame_buffer.draw_char(3, 4, "@", fg=(255, 255, 0), bg=(0, 0, 40))
+    frame_buffer.draw_rect(10, 2, 4, 3, "#", fg=(90, 90, 90), bg=None)
+    delta = encoder.get_delta(frame_buffer)
+
+    assert len(delta["x"]) == 1 + 4 * 3
+
+    copy.apply_delta(send(delta))
+    assert copy.get_frame() == frame_buffer.get_frame()
+
+    # Only the colour changes.
+    frame_buffer.draw_char(3, 4, None, fg=(0, 255, 0), bg=None)
+    delta = encoder.get_delta(frame_buffer)
+
+    assert list(zip(delta["x"], delta["y"])) == [(3, 4)]
+
+    copy.apply_delta(send(delta))
+    assert copy.get_frame() == frame_buffer.get_frame()
+
+
+def test_nothing_changed():
+    frame_buffer = FrameBuffer(8, 8)
+    encoder = FrameDeltaEncoder()
+    encoder.get_delta(frame_buffer)
+
+    frame_buffer.draw_char(2, 2, "x")
+    frame_buffer.draw_char(2, 2, " ")
+
+    assert encoder.get_delta(frame_buffer) is None
+
+    copy = FrameBuffer(8, 8)
+    copy.apply_delta(None)
+    assert copy.get_frame() == frame_buffer.get_frame()
+
+
+def test_invalidate_sends_every_cell_again():
+    frame_buffer = FrameBuffer(6, 4)
+    encoder = FrameDeltaEncoder()
+    encoder.get_delta(frame_buffer)
+    encoder.invalidate()
+
+    assert len(encoder.get_delta(frame_buffer)["x"]) == 6 * 4
+
+
+def test_compositor_draws_only_the_changed_cells():
+    class WindowConsole:
+        def __init__(self):
+            self.drawn = []
+
+        def draw_char(self, x, y, char, fg, bg):
+            self.drawn.append((x, y, char, fg, bg))
+
+    frame_buffer, window = FrameBuffer(10, 6), WindowConsole()
+    compositor = FrameCompositor(window)
+
+    compositor.present(frame_buffer)
+    assert len(window.drawn) == 10 * 6
+
+    window.drawn.clear()
+    frame_buffer.draw_str(2, 3, "ab", fg=(1, 2, 3), bg=(4, 5, 6))
+    compositor.present(frame_buffer)
+
+    assert sorted(window.drawn) == [(2, 3, ord("a"), (1, 2, 3), (4, 5, 6)), (3, 3, ord("b"), (1, 2, 3), (4, 5, 6))]
+    assert compositor.cells_pushed == 10 * 6 + 2
+
+    window.drawn.clear()
+    compositor.present(frame_buffer)
+    assert window.drawn == []
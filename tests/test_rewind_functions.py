@@ -0,0 +1,78 @@
+import pytest
+from rewind_functions import RewindBuffer
+from game_states import GameStates
+from bot_functions import ExploreBot, SeekMonsterBot
+from conftest import get_state
+
+
+def get_rewound_state(session):
+    """ get_state without explored and the message log, which aren't rewound. """
+    state = get_state(session)
+    del state["explored"], state["messages"]
+
+    return state
+
+
+@pytest.fixture
+def session(session):
+    session.rewind = RewindBuffer(capacity=1000)
+    return session
+
+
+@pytest.mark.parametrize("bot", [ExploreBot(3), SeekMonsterBot(3)], ids=["explore", "seek_monster"])
+def test_undoing_each_turn_restores_the_state_before_it(session, bot):
+    history, actions = [], []
+
+    for _ in range(200):
+        if session.game_state == GameStates.PLAYER_DEAD:
+            break
+
+        session.update_fov()
+        history.append(get_rewound_state(session))
+        actions.append(bot.get_action(session))
+        session.take_turn(actions[-1])
+
+    final = get_rewound_state(session)
+
+    for state in reversed(history):
+        assert session.rewind.rewind(session) == 1
+        assert get_rewound_state(session) == state
+
+    assert session.rewind.rewind(session) == 0
+
+    # Everything was put back, so playing the same turns again ends up in the same place.
+    for action in actions:
+        session.update_fov()
+        session.take_turn(action)
+
+    assert get_rewound_state(session) == final
+
+
+def test_rewind_action(session):
+    session.update_fov()
+    before = get_rewound_state(session)
+
+    for move in [(1, 0), (0, 1), (-1, 0), (0, -1)] * 3:
+        session.update_fov()
+        session.take_turn({"move": move})
+
+    turns = len(session.rewind)
+    assert turns
+
+    session.take_turn({"rewind": turns})
+
+    assert len(session.rewind) == 0
+    assert get_rewound_state(session) == before
+
+
+def test_capacity_drops_the_oldest_turns(session):
+    session.rewind = RewindBuffer(capacity=5)
+    bot = ExploreBot(3)
+
+    for _ in range(20):
+        session.update_fov()
+        session.take_turn(bot.get_action(session))
+
+    assert len(session.rewind) == 5
+    assert session.rewind.rewind(session, 10) == 5
+    assert session.turn == 15
@@ -0,0 +1,103 @@
+import os
+from save_functions import SaveManager, load_game, has_save
+from bot_functions import SeekMonsterBot
+from conftest import get_state, make_message_log
+
+
+def test_no_save(tmp_path):
+    assert not has_save(str(tmp_path))
+    assert load_game(str(tmp_path), make_message_log()) is None
+
+
+def test_load_matches_the_saved_game_across_compactions(session, tmp_path):
+    directory = str(tmp_path)
+    saver = SaveManager(directory, compact_every=25)
+    bot = SeekMonsterBot(3)
+
+    for turn in range(120):
+        session.update_fov()
+        session.take_turn(bot.get_action(session))
+        saver.save(session)
+
+        if turn % 20 == 19:
+            saved = get_state(session)
+            loaded = load_game(directory, make_message_log())
+
+            assert get_state(loaded) == saved
+
+    saver.close()
+
+
+def test_loaded_game_plays_on_the_same(session, tmp_path):
+    directory = str(tmp_path)
+    saver = SaveManager(directory, compact_every=1000)
+
+    # Fight for a while, so the combat rolls move on after the base is written.
+    for _ in range(60):
+        session.update_fov()
+        session.take_turn(SeekMonsterBot(3).get_action(session))
+        saver.save(session)
+
+    saver.close()
+    loaded = load_game(directory, make_message_log())
+
+    actions = [{"move": move} for move in [(1, 0), (0, 1), (-1, 0), (0, -1)] * 10]
+
+    for game in (session, loaded):
+        for action in actions:
+            game.update_fov()
+            game.take_turn(action)
+
+    assert get_state(loaded) == get_state(session)
+
+
+def test_half_written_last_delta_is_ignored(session, tmp_path):
+    directory = str(tmp_path)
+    saver = SaveManager(directory)
+    bot = SeekMonsterBot(3)
+
+    for _ in range(10):
+        session.update_fov()
+        session.take_turn(bot.get_action(session))
+        saver.save(session)
+
+    saver.close()
+    saved = get_state(session)
+
+    with open(os.path.join(directory, SaveManager.DELTAS_FILENAME), "a") as file:
+        file.write('{"turn": 11, "game_st')
+
+    assert get_state(load_game(directory, make_message_log())) == saved
+
+
+def test_stale_deltas_are_skipped_after_a_loaded_game_is_saved_again(session, tmp_path):
+    directory = str(tmp_path)
+    deltas_filename = os.path.join(directory, SaveManager.DELTAS_FILENAME)
+    saver = SaveManager(directory)
+    bot = SeekMonsterBot(3)
+
+    for _ in range(10):
+        session.update_fov()
+        session.take_turn(bot.get_action(session))
+        saver.save(session)
+
+    saver.close()
+
+    with open(deltas_filename) as file:
+        old_deltas = file.read()
+
+    loaded = load_game(directory, make_message_log())
+    saved = get_state(loaded)
+
+    # The new manager carries on the numbering, and its first save writes a new base.
+    saver = SaveManager(directory)
+    assert saver.seq == 9
+
+    saver.save(loaded)
+    saver.close()
+
+    # As if the game stopped after the new base was written, but before the old deltas were emptied.
+    with open(deltas_filename, "w") as file:
+        file.write(old_deltas)
+
+    assert get_state(load_game(directory, make_message_log())) == saved
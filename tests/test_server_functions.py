@@ -0,0 +1,80 @@
+import json
+import pytest
+from engine import get_screen_layout
+from render_targets import FrameBuffer
+from server_functions import parse_action, HostedSession
+from game_states import GameStates
+from conftest import SEED
+
+
+@pytest.mark.parametrize("action, expected", [
+    ({"move": [1, 0]}, {"move": (1, 0)}),
+    ({"move": [-1, -1]}, {"move": (-1, -1)}),
+    ({"move": [0, 0]}, {"move": (0, 0)}),
+    ({"pickup": True}, {"pickup": True}),
+    ({"rewind": 3}, {"rewind": 3}),
+])
+def test_parse_action_accepts(action, expected):
+    assert parse_action(action) == expected
+
+
+@pytest.mark.parametrize("action", [
+    [1, 0],
+    "move",
+    None,
+    {},
+    {"move": [1, 0], "pickup": True},
+    {"move": [2, 0]},
+    {"move": [1, 0, 0]},
+    {"move": [1]},
+    {"move": [1.0, 0]},
+    {"move": [True, 0]},
+    {"move": "10"},
+    {"rewind": 0},
+    {"rewind": -2},
+    {"rewind": "3"},
+    {"rewind": True},
+    {"quit": True},
+])
+def test_parse_action_rejects(action):
+    with pytest.raises(ValueError):
+        parse_action(action)
+
+
+def test_client_frame_follows_the_session():
+    screen_layout = get_screen_layout()
+    hosted = HostedSession(0, screen_layout, seed=SEED)
+    client = FrameBuffer(*screen_layout["screen"])
+
+    for move in [None] + [[1, 0], [0, 1], [-1, 0], [0, -1], [1, 1]] * 4:
+        action = parse_action({"move": move}) if move else None
+        message = json.loads(json.dumps(hosted.step(action)))
+
+        assert message["type"] == "frame"
+        assert message["turn"] == hosted.session.turn
+        assert message["game_state"] in GameStates.__members__
+
+        client.apply_delta(message["cells"])
+        assert client.get_frame() == hosted.consoles[0].get_frame()
+
+
+def test_rewinding_one_session_leaves_the_others_rolls_alone():
+    screen_layout = get_screen_layout()
+    first, second = (HostedSession(i, screen_layout, seed=SEED, rewind_turns=10) for i in range(2))
+
+    for hosted in (first, second):
+        hosted.step(None)
+        for move in [[1, 0], [0, 1]] * 3:
+            hosted.step(parse_action({"move": move}))
+
+    assert first.session.combat_rng is not second.session.combat_rng
+
+    # Winding the first session's rolls back to where the game started, with the second's having moved on.
+    second.session.combat_rng.random()
+    second_state = second.session.combat_rng.getstate()
+
+    first.step(parse_action({"rewind": 10}))
+
+    assert first.session.turn == 0
+    assert first.session.combat_rng.getstate() == first.session.combat_state
+    assert second.session.combat_rng.getstate() == second_state
@@ -0,0 +1,96 @@
+import threading
+from snapshot_functions import DoubleBuffer, TurnSnapshot, SimulationThread
+from bot_functions import SeekMonsterBot
+
+
+def make_snapshot(turn, *messages):
+    return TurnSnapshot(turn, None, 0, 0, None, None, None, None, (), None, (), tuple(messages))
+
+
+def test_take_returns_each_snapshot_once():
+    buffer = DoubleBuffer()
+
+    assert buffer.take() is None
+    assert buffer.front is None
+
+    first = make_snapshot(1, ("a", (1, 1, 1)))
+    buffer.publish(first)
+
+    assert buffer.wait(0)
+    assert buffer.take() is first
+    assert buffer.front is first
+
+    assert not buffer.wait(0)
+    assert buffer.take() is None
+    assert buffer.front is first
+
+
+def test_skipped_snapshots_pass_on_their_messages():
+    buffer = DoubleBuffer()
+
+    buffer.publish(make_snapshot(1, ("a", (1, 1, 1))))
+    buffer.publish(make_snapshot(2))
+    buffer.publish(make_snapshot(3, ("b", (2, 2, 2)), ("c", (3, 3, 3))))
+
+    snapshot = buffer.take()
+
+    assert snapshot.turn == 3
+    assert snapshot.messages == (("a", (1, 1, 1)), ("b", (2, 2, 2)), ("c", (3, 3, 3)))
+    assert (buffer.published, buffer.skipped) == (3, 2)
+
+    buffer.publish(make_snapshot(4, ("d", (4, 4, 4))))
+
+    assert buffer.take().messages == (("d", (4, 4, 4)),)
+    assert buffer.skipped == 2
+
+
+def test_no_messages_lost_between_threads():
+    buffer = DoubleBuffer()
+    published = []
+
+    def publish():
+        for turn in range(2000):
+            message = ("turn {}".format(turn), (0, 0, 0))
+            published.append(message)
+            buffer.publish(make_snapshot(turn, message))
+
+    thread = threading.Thread(target=publish)
+    thread.start()
+
+    taken = []
+    while thread.is_alive() or buffer.wait(0):
+        if buffer.wait(0.01):
+            taken.extend(buffer.take().messages)
+
+    thread.join()
+
+    assert taken == published
+    assert buffer.front.turn == 1999
+
+
+def test_simulation_thread_publishes_every_message(session):
+    message_log = session.message_log
+    bot = SeekMonsterBot(3)
+
+    simulation = SimulationThread(session, 30, 30, max_queued=1000)
+    simulation.start()
+
+    # Each action is published as one snapshot, so once it has been taken the thread is idle until the next submit
+    # and the bot can look at the session.
+    taken = []
+    for _ in range(60):
+        assert simulation.buffer.wait(5)
+        taken.extend(simulation.buffer.take().messages)
+        assert simulation.submit(bot.get_action(session))
+
+    simulation.stop()
+
+    snapshot = simulation.buffer.take()
+    if snapshot is not None:
+        taken.extend(snapshot.messages)
+
+    assert simulation.error is None
+    assert simulation.buffer.front.turn == session.turn
+    assert [text for text, colour in taken][-len(message_log):] == [message.text for message in
+                                                                    message_log.get_newest(len(message_log))]
+    assert len(taken) == message_log.added > 1